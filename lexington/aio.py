@@ -0,0 +1,231 @@
+"""
+lexington.aio
+=============
+Adapters for lexing input as it arrives through `asyncio`, either by reading
+from a `asyncio.StreamReader` with `lex_stream` or by handing
+`LexerProtocol` to the event loop as a protocol.
+
+Either way, tokens wait in a `TokenQueue` until they're consumed. The queue
+is bounded: once it fills up, no more input is read until the consumer
+catches up, so a slow consumer can't make tokens pile up without limit.
+
+(This module requires Python 3.6 or later.)
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import asyncio
+from collections import deque
+from .lexer import LexError
+
+
+class TokenQueue(object):
+    """
+    A bounded queue of tokens, consumed with ``async for``. The lexing side
+    adds tokens with `put`, and once the queue is `full` it should stop
+    reading input until `wait_for_room` returns (or `on_room` is called).
+
+    The bound is on when input gets read, not a hard limit: one piece of
+    input can complete many tokens, and they are all queued at once.
+
+    :param maxsize: How many tokens can be queued before the queue is full.
+    :param on_room: A function to call when the queue has drained to half of
+                    `maxsize` after being full.
+    """
+    def __init__(self, maxsize=1024, on_room=None):
+        #: How many tokens can be queued before the queue is full.
+        self.maxsize = maxsize
+        self.on_room = on_room
+        self._tokens = deque()
+        self._finished = False
+        self._error = None
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    @property
+    def full(self):
+        """
+        Indicates whether the lexing side should stop reading input.
+        """
+        return len(self._tokens) >= self.maxsize
+
+    @property
+    def finished(self):
+        """
+        Indicates whether `finish` has been called.
+        """
+        return self._finished
+
+    def put(self, tokens):
+        """
+        Adds tokens to the queue.
+
+        :param tokens: A list of tokens, as returned by
+                       `~lexington.lexer.LexerStream.feed`.
+        """
+        if tokens:
+            self._tokens.extend(tokens)
+            self._ready.set()
+            if self.full:
+                self._room.clear()
+
+    def finish(self, error=None):
+        """
+        Signals that no more tokens are coming. If `error` is given, it
+        will be raised to the consumer after the tokens already queued.
+
+        :param error: An exception that stopped lexing, if any.
+        """
+        if not self._finished:
+            self._finished = True
+            self._error = error
+            self._ready.set()
+
+    async def wait_for_room(self):
+        """
+        Waits until the queue is no longer full.
+        """
+        await self._room.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        tokens = self._tokens
+        while not tokens:
+            if self._finished:
+                error, self._error = self._error, None
+                if error is not None:
+                    raise error
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        token = tokens.popleft()
+        if not self._room.is_set() and len(tokens) <= self.maxsize // 2:
+            self._room.set()
+            if self.on_room is not None:
+                self.on_room()
+        return token
+
+
+async def lex_stream(lexer, reader, maxsize=1024, chunk_size=65536,
+                     encoding=None):
+    """
+    Lexes everything read from `reader`, yielding tokens as they are
+    completed. Reading happens in a background task, which stops reading
+    whenever `maxsize` tokens are waiting to be consumed::
+
+        async for token in lex_stream(lexer, reader):
+            ...
+
+    :param lexer: The `~lexington.lexer.Lexer` to use.
+    :param reader: An `asyncio.StreamReader` (or anything else with a
+                   coroutine `read` method).
+    :param maxsize: The size of the token queue.
+    :param chunk_size: How much to read from `reader` at a time.
+    :param encoding: The encoding to decode the bytes read from `reader`
+                     in, if the lexer's rules match text.
+    :raises LexError: If no rule matches somewhere in the input.
+    :raises UnicodeDecodeError: If the input isn't in `encoding`.
+    """
+    queue = TokenQueue(maxsize)
+
+    async def produce():
+        stream = lexer.stream(encoding=encoding)
+        try:
+            while True:
+                await queue.wait_for_room()
+                data = await reader.read(chunk_size)
+                if not data:
+                    queue.put(stream.finish())
+                    break
+                queue.put(stream.feed(data))
+        except LexError as e:
+            queue.put(e.tokens)
+            queue.finish(e)
+        except Exception as e:
+            queue.finish(e)
+        else:
+            queue.finish()
+
+    task = asyncio.ensure_future(produce())
+    try:
+        async for token in queue:
+            yield token
+    finally:
+        task.cancel()
+
+
+class LexerProtocol(asyncio.Protocol):
+    """
+    An `asyncio.Protocol` that lexes the data it receives. Iterate over it
+    with ``async for`` to get the tokens. When `maxsize` tokens are waiting
+    to be consumed, it pauses the transport, and resumes it once the
+    consumer has caught up halfway.
+
+    :param lexer: The `~lexington.lexer.Lexer` to use.
+    :param maxsize: The size of the token queue.
+    :param encoding: The encoding to decode the data received in, if the
+                     lexer's rules match text.
+    """
+    def __init__(self, lexer, maxsize=1024, encoding=None):
+        #: The `~lexington.lexer.LexerStream` receiving the data.
+        self.stream = lexer.stream(encoding=encoding)
+        #: The `TokenQueue` holding completed tokens.
+        self.tokens = TokenQueue(maxsize, self._resume)
+        self.transport = None
+        self._paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        try:
+            self.tokens.put(self.stream.feed(data))
+        except LexError as e:
+            self.tokens.put(e.tokens)
+            self.tokens.finish(e)
+            self.transport.close()
+            return
+        except UnicodeDecodeError as e:
+            self.tokens.finish(e)
+            self.transport.close()
+            return
+        if self.tokens.full and not self._paused:
+            self._paused = True
+            self.transport.pause_reading()
+
+    def eof_received(self):
+        self._finish()
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            self.tokens.finish(exc)
+        else:
+            self._finish()
+
+    def _finish(self):
+        if self.tokens.finished:
+            return
+        try:
+            self.tokens.put(self.stream.finish())
+        except LexError as e:
+            self.tokens.put(e.tokens)
+            self.tokens.finish(e)
+        except UnicodeDecodeError as e:
+            self.tokens.finish(e)
+        else:
+            self.tokens.finish()
+
+    def _resume(self):
+        if self._paused and self.transport is not None:
+            self._paused = False
+            self.transport.resume_reading()
+
+    def __aiter__(self):
+        return self.tokens.__aiter__()
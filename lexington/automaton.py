@@ -0,0 +1,499 @@
+"""
+lexington.automaton
+===================
+Deriving a regular expression once per symbol is simple, but it builds
+a fresh tree of `~lexington.regex.Regex` objects at every step. An
+`Automaton` remembers every derivative it computes and numbers the distinct
+ones as states, so that each state only has to be derived by a particular
+symbol once. The result is a DFA that gets built lazily, as input actually
+reaches its states.
+
+Automata over text don't keep a transition for every symbol they've read,
+since there are over a million code points. Above ASCII, each state's
+transitions are sorted ranges of code points, found with a binary search,
+so a state takes as much room as it has distinct ranges, however many
+different characters the input has.
+
+Automata are meant to be shared. Looking up a transition that has already
+been discovered never takes a lock, and discovering a new one is
+synchronized, so any number of threads can match against one automaton and
+they will all warm the same cache.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from timeit import default_timer
+from .regex import Regex, Null, union, signature, symbols
+from .strings import Text, n
+
+#: The state number of the dead state -- the state for `Null`, which can
+#: never accept anything no matter what input follows.
+DEAD = 0
+
+# Rough sizes, in bytes, of a state (its derivative, and its entries in the
+# automaton's lists and index) and of a transition, for Limits.memory.
+_STATE_BYTES = 512
+_TRANSITION_BYTES = 96
+
+
+class Limits(object):
+    """
+    Bounds on how big an automaton may get, and how long it may spend
+    discovering states. An automaton that would go over one raises
+    `LimitExceeded` instead, so a regex whose automaton explodes fails
+    quickly instead of eating all of a process's memory.
+
+    :param states: The most states the automaton may have.
+    :param seconds: The most time, in total, it may spend deriving states.
+    :param memory: The most memory, in bytes, its states and transitions
+                   may take up. (This is a rough estimate.)
+    """
+    def __init__(self, states=None, seconds=None, memory=None):
+        #: The most states the automaton may have.
+        self.states = states
+        #: The most time it may spend deriving states.
+        self.seconds = seconds
+        #: Roughly the most bytes it may take up.
+        self.memory = memory
+
+    def __repr__(self):
+        return "Limits(states=%r, seconds=%r, memory=%r)" % (
+            self.states, self.seconds, self.memory)
+
+
+class LimitExceeded(RuntimeError):
+    """
+    Raised when an automaton would go over one of its `Limits`. The
+    automaton is left as it was, so it can still be used for input that
+    only reaches states it already has.
+
+    :param limit: The name of the limit: ``"states"``, ``"seconds"``, or
+                  ``"memory"``.
+    :param value: The limit's value.
+    """
+    def __init__(self, limit, value):
+        RuntimeError.__init__(self, n("Automaton exceeded its limit of %r %s"
+                                      % (value, limit)))
+        #: The name of the limit.
+        self.limit = limit
+        #: The limit's value.
+        self.value = value
+
+
+class Automaton(object):
+    """
+    A deterministic automaton, built lazily from the derivatives of a
+    regular expression. State `DEAD` is always the `Null` regex, and
+    `start` is the state for the regex itself.
+
+    :param regex: The regular expression to recognize. (It will be
+                  converted with `~lexington.regex.regexify`.)
+    :param limits: The `Limits` on the automaton's size, if any.
+    """
+    def __init__(self, regex, limits=None):
+        regex = Regex(regex)
+        #: The regular expression this automaton recognizes.
+        self.regex = regex
+        #: The alphabet of `regex`.
+        self.alphabet = regex.alphabet
+        self._setup(Null, regex, limits)
+
+    def _setup(self, dead, start, limits):
+        #: The `Limits` on this automaton, or `None`.
+        self.limits = limits
+        self._spent = 0.0
+        self._edges = 0
+
+        # These five are indexed by state number. They are only ever
+        # appended to, and only while holding the lock. (An entry in
+        # _ranges is None until the state first reads a symbol above
+        # ASCII, and then it's replaced once; see _ranges_for.)
+        self.states = [dead]
+        self.accepting = [self._accepts(dead)]
+        self.transitions = [{}]
+        self._ranges = [None]
+        self.index = {dead: DEAD}
+        self._lock = threading.Lock()
+
+        # Every code point from one of these up to the next leads to the
+        # same place, in every state: the ones after 128 are where a symbol
+        # the regexes mention starts or stops.
+        self._codes = None
+        if self.alphabet in (Text, None):
+            codes = set([128])
+            for regex in (start if isinstance(start, tuple) else (start,)):
+                for sym in symbols(regex):
+                    codes.update((ord(sym), ord(sym) + 1))
+            self._codes = sorted(code for code in codes
+                                 if 128 <= code <= sys.maxunicode)
+
+        #: The state number of the start state.
+        self.start = self._intern(start)
+
+    def _check_limits(self, new_states, started):
+        # Must be called with the lock held, before adding new_states states
+        # and one transition.
+        limits = self.limits
+        self._spent += default_timer() - started
+        if limits.seconds is not None and self._spent > limits.seconds:
+            raise LimitExceeded("seconds", limits.seconds)
+        states = len(self.states) + new_states
+        if limits.states is not None and states > limits.states:
+            raise LimitExceeded("states", limits.states)
+        if limits.memory is not None and (
+                states * _STATE_BYTES +
+                (self._edges + 1) * _TRANSITION_BYTES) > limits.memory:
+            raise LimitExceeded("memory", limits.memory)
+
+    def _derive(self, key, sym):
+        # Subclasses can override this and `_accepts` to use something
+        # other than a single regex as the contents of a state.
+        return key.derive(sym)
+
+    def _accepts(self, key):
+        return key.accepts_empty_string
+
+    def __getstate__(self):
+        # Locks can't be pickled, but the states discovered so far can,
+        # so a warmed automaton stays warm when sent to another process.
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.states)
+
+    def __repr__(self):
+        return "<Automaton for %r (%d states)>" % (self.regex, len(self))
+
+    def _intern(self, key):
+        # Must be called with the lock held (or before the automaton is
+        # visible to other threads).
+        state = self.index.get(key)
+        if state is None:
+            state = len(self.states)
+            self.index[key] = state
+            self.accepting.append(self._accepts(key))
+            self.transitions.append({})
+            self._ranges.append(None)
+            self.states.append(key)
+        return state
+
+    def step(self, state, sym):
+        """
+        Returns the state reached from `state` after reading `sym`,
+        deriving a new state if this transition hasn't been seen yet.
+
+        :param state: The state number to start from.
+        :param sym: The symbol to read.
+        """
+        target = self.transitions[state].get(sym)
+        if target is None:
+            target = self._discover(state, sym)
+        return target
+
+    def _discover(self, state, sym):
+        # Deriving is pure, so it can happen outside the lock. If another
+        # thread finds the same transition first, we just use its state.
+        if self.alphabet is Text and sym > "\x7f":
+            starts, targets = self._ranges[state] or self._ranges_for(state)
+            return targets[bisect_right(starts, ord(sym)) - 1]
+        if self.limits is not None:
+            started = default_timer()
+        derivative = self._derive(self.states[state], sym)
+        with self._lock:
+            target = self.transitions[state].get(sym)
+            if target is None:
+                if self.limits is not None:
+                    self._check_limits(derivative not in self.index, started)
+                self._edges += 1
+                target = self._intern(derivative)
+                # Publishing the transition comes last, so that any thread
+                # that can see the new state number can see the whole state.
+                self.transitions[state][sym] = target
+        return target
+
+    def _ranges_for(self, state):
+        # Steps state by one code point from each range in _codes, and
+        # stores where the ranges of code points above ASCII start and the
+        # state each one leads to, merging neighbors that agree.
+        starts, targets = array(str('i'), [128]), array(str('i'), [DEAD])
+        key = self.states[state]
+        for code in self._codes:
+            if self.limits is not None:
+                started = default_timer()
+            derivative = self._derive(key, "%c" % code)
+            with self._lock:
+                if self.limits is not None:
+                    self._check_limits(derivative not in self.index, started)
+                _add_range(starts, targets, code, self._intern(derivative))
+        with self._lock:
+            if self._ranges[state] is None:
+                self._edges += len(targets)
+                self._ranges[state] = (starts, targets)
+            return self._ranges[state]
+
+    def run(self, subject, state=None):
+        """
+        Reads every symbol in `subject`, and returns the state the automaton
+        ends up in. It stops early if it reaches `DEAD`.
+
+        :param subject: The string to read.
+        :param state: The state number to start from. (Defaults to `start`.)
+        """
+        if state is None:
+            state = self.start
+        transitions = self.transitions
+        for sym in subject:
+            target = transitions[state].get(sym)
+            if target is None:
+                target = self._discover(state, sym)
+            state = target
+            if state == DEAD:
+                break
+        return state
+
+    def match(self, subject):
+        """
+        Determines whether the `subject` matches this automaton's regex.
+        This gives the same results as `~lexington.regex.Regex.match`.
+
+        :param subject: The string to match.
+        """
+        return self.accepting[self.run(subject)]
+
+    def matcher(self):
+        """
+        Creates a new `Matcher` that reads input for this automaton
+        incrementally. Matchers are cheap, and each one should only be used
+        by one thread at a time -- but they can all share one automaton.
+        """
+        return Matcher(self)
+
+
+def _add_range(starts, targets, start, target):
+    # Appends a range, merging it with the one before if they lead to the
+    # same state, or replacing that one if it would be empty.
+    if starts[-1] == start:
+        targets[-1] = target
+        if len(targets) > 1 and targets[-2] == target:
+            starts.pop()
+            targets.pop()
+    elif targets[-1] != target:
+        starts.append(start)
+        targets.append(target)
+
+
+class Matcher(object):
+    """
+    Matches input against an `Automaton` a piece at a time.
+
+    :param automaton: The automaton to match against.
+    """
+    __slots__ = ('automaton', 'state')
+
+    def __init__(self, automaton):
+        #: The automaton this matcher is running.
+        self.automaton = automaton
+        #: The state number the matcher is currently in.
+        self.state = automaton.start
+
+    def feed(self, data):
+        """
+        Reads more input. This returns `False` once the input can no longer
+        match, no matter what comes after it, and `True` otherwise.
+
+        :param data: The next piece of the string to match.
+        """
+        self.state = self.automaton.run(data, self.state)
+        return self.state != DEAD
+
+    @property
+    def accepts(self):
+        """
+        Indicates whether all the input fed so far matches.
+        """
+        return self.automaton.accepting[self.state]
+
+    def reset(self):
+        """
+        Starts matching over again from the beginning.
+        """
+        self.state = self.automaton.start
+
+
+class RuleAutomaton(Automaton):
+    """
+    An automaton that runs several regexes side by side, the way a lexer's
+    rules need to be. Each state holds one derivative per regex, and its
+    entry in `accepting` is the index of the first regex that accepts there
+    (or `None` if none of them do).
+
+    :param regexes: The regular expressions to recognize, in priority order.
+    :param limits: The `Limits` on the automaton's size, if any.
+    """
+    def __init__(self, regexes, limits=None):
+        #: The regular expressions this automaton recognizes.
+        self.regexes = tuple(Regex(r) for r in regexes)
+        # union will complain if the rules' alphabets don't agree.
+        self.alphabet = union(*self.regexes).alphabet
+        self._setup((Null,) * len(self.regexes), self.regexes, limits)
+        # Derivatives of single regexes that an earlier automaton already
+        # found, by symbol and the id of the regex (see `updated`). Regexes
+        # only compare their hashes, so a collision would find another
+        # regex's derivative; ids can't collide, since each entry keeps its
+        # regex alive.
+        self._known = {}
+
+    def __repr__(self):
+        return "<RuleAutomaton for %d rules (%d states)>" % (
+            len(self.regexes), len(self))
+
+    def start_for(self, indexes):
+        """
+        Returns the number of a start state in which only some of the
+        regexes can match -- the ones whose indexes are in `indexes`. The
+        other regexes start out as `Null`, so they never match from that
+        state or any state it leads to. (A lexer uses this to give each of
+        its modes a start state in the same automaton.)
+
+        :param indexes: The indexes of the regexes that can match.
+        """
+        indexes = frozenset(indexes)
+        key = tuple(regex if i in indexes else Null
+                    for i, regex in enumerate(self.regexes))
+        with self._lock:
+            return self._intern(key)
+
+    def updated(self, regexes):
+        """
+        Returns a new automaton of the same kind for `regexes`, which can
+        add, remove, or reorder regexes compared to this one's. Whatever
+        this automaton has discovered is reused instead of derived again:
+
+        * If every regex in `regexes` is already one of this automaton's,
+          all of its states and transitions are copied over, leaving out
+          the regexes that were removed.
+        * Otherwise, the derivatives this automaton found for each of its
+          regexes are remembered, so discovering new states only derives
+          the regexes that were added.
+
+        This automaton doesn't change, so anything using it can keep using
+        it until it's ready to switch to the new one.
+
+        :param regexes: The regular expressions to recognize, in priority
+                        order.
+        """
+        # Using the same objects for the regexes that didn't change makes
+        # looking up their derivatives cheaper. (Regexes only compare their
+        # hashes, so the signatures make sure they really are the same.)
+        same = dict((regex, regex) for regex in self.regexes)
+        kept = []
+        for regex in map(Regex, regexes):
+            old = same.get(regex)
+            if old is not None and (old is regex or
+                                    signature(old) == signature(regex)):
+                regex = old
+            kept.append(regex)
+        automaton = type(self)(kept, self.limits)
+        with self._lock:
+            states = list(self.states)
+            transitions = [dict(edges) for edges in self.transitions]
+            ranges = list(self._ranges)
+
+        # Where each new regex was in this automaton's states, if it was.
+        unused = list(enumerate(self.regexes))
+        places = []
+        for regex in automaton.regexes:
+            for i, (place, old) in enumerate(unused):
+                if old is regex:
+                    places.append(place)
+                    del unused[i]
+                    break
+
+        if len(places) == len(automaton.regexes):
+            numbers = [automaton._intern(tuple(key[place] for place in places))
+                       for key in states]
+            for state, edges in enumerate(transitions):
+                if numbers[state] == DEAD:
+                    continue
+                targets = automaton.transitions[numbers[state]]
+                for sym, target in edges.items():
+                    if sym not in targets:
+                        targets[sym] = numbers[target]
+                        automaton._edges += 1
+                if (ranges[state] is not None and
+                        automaton._ranges[numbers[state]] is None):
+                    new = array(str('i'), [128]), array(str('i'), [DEAD])
+                    for start, target in zip(*ranges[state]):
+                        _add_range(new[0], new[1], start, numbers[target])
+                    automaton._ranges[numbers[state]] = new
+                    automaton._edges += len(new[1])
+        else:
+            known = automaton._known
+            for key, edges, found in zip(states, transitions, ranges):
+                edges = list(edges.items())
+                if found is not None and automaton._codes is not None:
+                    # Every code point in a range has the same derivatives.
+                    starts, targets = found
+                    edges.extend(("%c" % code,
+                                  targets[bisect_right(starts, code) - 1])
+                                 for code in automaton._codes)
+                for sym, target in edges:
+                    for regex, derivative in zip(key, states[target]):
+                        known[id(regex), sym] = (regex, derivative)
+        return automaton
+
+    def _derive(self, key, sym):
+        known = self._known
+        if known:
+            return tuple(known[id(r), sym][1] if (id(r), sym) in known
+                         else r.derive(sym) for r in key)
+        return tuple(r.derive(sym) for r in key)
+
+    def _accepts(self, key):
+        for index, regex in enumerate(key):
+            if regex.accepts_empty_string:
+                return index
+        return None
+
+
+class RegexSet(RuleAutomaton):
+    """
+    An automaton that matches a string against many regexes at once. Like
+    a `RuleAutomaton`, each state holds one derivative per regex, but its
+    entry in `accepting` is the `frozenset` of the indexes of every regex
+    that accepts there. So `match` reads the input once, and returns the
+    indexes of all the regexes that match it::
+
+        >>> patterns = RegexSet(["ab", Regex("a") + Regex("b").star()])
+        >>> sorted(patterns.match("ab"))
+        [0, 1]
+
+    :param regexes: The regular expressions to recognize.
+    """
+    def __repr__(self):
+        return "<RegexSet of %d regexes (%d states)>" % (
+            len(self.regexes), len(self))
+
+    def _accepts(self, key):
+        return frozenset(index for index, regex in enumerate(key)
+                         if regex.accepts_empty_string)
+
+    def match(self, subject):
+        """
+        Returns a `frozenset` of the indexes of the regexes `subject`
+        matches (which will be empty if it matches none of them).
+
+        :param subject: The string to match.
+        """
+        return self.accepting[self.run(subject)]
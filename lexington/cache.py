@@ -0,0 +1,79 @@
+"""
+lexington.cache
+===============
+Parsing a pattern and building its automaton are both much slower than
+using the result, and the results never change, so Lexington keeps recently
+used ones around in an `LRUCache`.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A mapping that holds at most `maxsize` entries, forgetting the least
+    recently used one to make room for a new one. It can be shared between
+    threads.
+
+    :param maxsize: How many entries to keep.
+    """
+    def __init__(self, maxsize=256):
+        #: How many entries to keep.
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return "<LRUCache (%d of %d entries)>" % (len(self), self.maxsize)
+
+    def get(self, key, default=None):
+        """
+        Returns the value for `key`, and marks it as recently used.
+        If there isn't one, this returns `default`.
+
+        :param key: The key to look up.
+        :param default: What to return if `key` isn't cached.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = value
+            return value
+
+    def setdefault(self, key, value):
+        """
+        Stores `value` for `key`, unless there already is a value for `key`.
+        Either way, this returns the value that ends up cached, so that when
+        two threads build the same value at once, they both end up using
+        the same one.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        """
+        with self._lock:
+            entries = self._entries
+            if key in entries:
+                value = entries.pop(key)
+            elif len(entries) >= self.maxsize:
+                entries.popitem(last=False)
+            entries[key] = value
+            return value
+
+    def clear(self):
+        """
+        Forgets every entry.
+        """
+        with self._lock:
+            self._entries.clear()
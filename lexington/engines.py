@@ -0,0 +1,203 @@
+"""
+lexington.engines
+=================
+Lexington has several ways to match a regex, each best in different cases:
+
+``"derivative"``
+    Deriving the regex itself, one symbol at a time (`Regex.match`'s
+    original method). It takes no setup, so it's the cheapest way to match
+    a short string once.
+
+``"literal"``
+    A `LiteralSet`, for regexes that just match one of a few fixed strings.
+    It matches with a single set lookup.
+
+``"dfa"``
+    An `~lexington.automaton.Automaton`, which caches derivatives as it
+    goes, so it gets faster the more input it sees.
+
+``"position"``
+    A `~lexington.glushkov.PositionAutomaton`, which is ready right away and
+    never gets any bigger, for small regexes whose DFAs could get big.
+
+``"nfa"``
+    An `~lexington.nfa.NFA`, which stays small even for large regexes that
+    would need a huge number of DFA states.
+
+`compile` picks one with `choose_engine`, using cheap statistics about the
+regex's structure, and keeps what it builds in a cache so it can be shared.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+from collections import namedtuple
+from .automaton import Automaton
+from .cache import LRUCache
+from .glushkov import PositionAutomaton
+from .nfa import NFA
+from .regex import Regex, UnionRegex, parse
+from .strings import Strings, n
+
+#: Strings up to this long are matched by deriving the regex directly,
+#: since building anything would take longer than matching.
+SHORT_INPUT = 64
+
+#: Regexes with more positions than this, whose DFAs could explode, are
+#: too big for a `~lexington.glushkov.PositionAutomaton`.
+MAX_POSITIONS = 256
+
+#: Regexes with this many positions or fewer can use a DFA, even if it
+#: might not be small, because it can't have too many states.
+SMALL_POSITIONS = 12
+
+#: A union of at most this many literal strings can use a `LiteralSet`.
+MAX_LITERALS = 4096
+
+#: The cache `compile` keeps its results in, keyed by regex and engine.
+engine_cache = LRUCache(256)
+
+#: The engine `choose_engine` picked, and why.
+#:
+#: .. attribute:: engine
+#:
+#:    The engine's name, like ``"dfa"``.
+#:
+#: .. attribute:: reason
+#:
+#:    A short explanation of why that engine was picked.
+#:
+#: .. attribute:: positions
+#:
+#:    The number of symbols in the regex (if they were counted).
+EngineChoice = namedtuple(n("EngineChoice"), "engine reason positions")
+
+
+class LiteralSet(object):
+    """
+    Matches a regex that is a union of literal strings, by looking the
+    subject up in a `frozenset` of them.
+
+    :param regex: The regex.
+    :param strings: The strings it matches.
+    """
+    def __init__(self, regex, strings):
+        #: The regular expression this matches.
+        self.regex = regex
+        #: The strings the regex matches.
+        self.strings = frozenset(strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __repr__(self):
+        return "<LiteralSet for %r (%d strings)>" % (self.regex, len(self))
+
+    def match(self, subject):
+        """
+        Determines whether `subject` is one of the strings. Other sequences
+        of symbols, like lists or a `bytearray`, can't be looked up, so
+        they're matched with a DFA for the regex instead.
+
+        :param subject: The string to match.
+        """
+        if isinstance(subject, Strings):
+            return subject in self.strings
+        return bool(compile(self.regex, "dfa").match(subject))
+
+
+def literals(regex):
+    """
+    Returns the set of strings `regex` matches, if it's a literal string or
+    a union of them, or `None` otherwise.
+
+    :param regex: The regex to examine.
+    """
+    options = regex.options if isinstance(regex, UnionRegex) else (regex,)
+    if len(options) > MAX_LITERALS:
+        return None
+    strings = set()
+    for option in options:
+        literal = option.literal
+        if literal is None:
+            return None
+        strings.add(literal)
+    return strings
+
+
+def choose_engine(regex, length=None):
+    """
+    Decides which engine should match `regex`, and returns an
+    `EngineChoice` saying which one and why. This is what ``"auto"`` means
+    in `compile`, and you can call it yourself to see why a regex is being
+    matched the way it is.
+
+    :param regex: The regex to match.
+    :param length: The length of the string that's about to be matched, if
+                   only one string is. (Short strings are best matched by
+                   deriving the regex directly.)
+    """
+    regex = Regex(regex)
+    if length is not None and length <= SHORT_INPUT:
+        return EngineChoice("derivative", "one short input", None)
+    if literals(regex) is not None:
+        return EngineChoice("literal", "only matches fixed strings", None)
+    try:
+        positions = PositionAutomaton(regex)
+    except TypeError:
+        # Intersections, complements, and ranges don't have positions.
+        return EngineChoice("dfa", "regex uses intersection, complement, "
+                            "or a range", None)
+    count = len(positions)
+    if positions.deterministic:
+        return EngineChoice("dfa", "DFA has at most one state per position",
+                            count)
+    elif count <= SMALL_POSITIONS:
+        return EngineChoice("dfa", "too few positions for many DFA states",
+                            count)
+    elif count <= MAX_POSITIONS:
+        return EngineChoice("position", "DFA could explode, but positions "
+                            "fit in a bit set", count)
+    return EngineChoice("nfa", "DFA could explode, and too many positions "
+                        "for a bit set", count)
+
+
+def compile(pattern, engine="auto"):
+    """
+    Returns an object whose `match` method matches a pattern. Everything
+    that compiles the same regex with the same engine shares one object, so
+    automata that discover states as they go stay warm.
+
+    Strings are parsed with `~lexington.regex.parse` (not treated as
+    literals, like they are elsewhere).
+
+    :param pattern: A pattern string, or a `~lexington.regex.Regex`.
+    :param engine: The name of the engine to use, or ``"auto"`` to let
+                   `choose_engine` pick.
+    :raises PatternError: If the pattern isn't valid.
+    """
+    regex = parse(pattern) if isinstance(pattern, Strings) else Regex(pattern)
+    key = (regex, engine)
+    compiled = engine_cache.get(key)
+    if compiled is None:
+        name = choose_engine(regex).engine if engine == "auto" else engine
+        if name not in _ENGINES:
+            raise ValueError(n("Unknown engine %r" % (engine,)))
+        compiled = engine_cache.setdefault(key, _ENGINES[name](regex))
+    return compiled
+
+
+def _literal_set(regex):
+    strings = literals(regex)
+    if strings is None:
+        raise ValueError(n("%r doesn't just match fixed strings" % regex))
+    return LiteralSet(regex, strings)
+
+
+_ENGINES = {
+    "derivative": lambda regex: regex,
+    "literal": _literal_set,
+    "dfa": Automaton,
+    "position": PositionAutomaton,
+    "nfa": NFA
+}
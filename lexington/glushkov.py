@@ -0,0 +1,261 @@
+"""
+lexington.glushkov
+==================
+For a small regex, there's an even cheaper way to match than following
+transitions: number every symbol in the regex (its *positions*), keep the
+set of positions the input could have just matched as the bits of one
+integer, and move that set forward with bitwise operations. This is
+Glushkov's position automaton, run bit-parallel in the style of Shift-And.
+
+A `PositionAutomaton` is built straight from the regex's structure, without
+deriving anything, so it's ready to use as soon as it's created. Reading a
+symbol costs a shift, a few ANDs and ORs, and a dictionary lookup or two,
+and never creates anything but the integer for the new set. Since Python's
+integers can be any size, this works for any number of positions, but it's
+at its best with fewer than a few hundred.
+
+Intersections and complements have no positions, so regexes that use them
+can't be matched this way.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+from .regex import (Regex, EpsilonRegex, NullRegex, SymbolRegex,
+                    AnySymbolRegex, UnionRegex, ConcatRegex, StarRegex,
+                    RepeatRegex)
+from .strings import n
+
+# How many combinations of non-adjacent follow sets to remember.
+_CACHE_LIMIT = 4096
+
+
+class PositionAutomaton(object):
+    """
+    A bit-parallel Glushkov automaton for a regular expression. Position 0
+    is the start, and positions 1 and up are the symbols of the regex, in
+    the order they appear. A set of positions is an integer whose bit `i`
+    is set if position `i` is in the set.
+
+    :param regex: The regular expression to recognize. (It will be
+                  converted with `~lexington.regex.regexify`.)
+    """
+    def __init__(self, regex):
+        regex = Regex(regex)
+        #: The regular expression this automaton recognizes.
+        self.regex = regex
+        #: The alphabet of `regex`.
+        self.alphabet = regex.alphabet
+
+        builder = _Builder()
+        nullable, first, last = builder.visit(regex)
+        follow = builder.follow
+        follow[0] = first
+
+        #: The number of symbol positions in the regex.
+        self.positions = len(follow) - 1
+        #: The set of positions where a match can end.
+        self.final = (last | 1) if nullable else last
+
+        # Most follow edges go from one position to the next, so they're
+        # handled all at once by shifting the set left a bit. The rest are
+        # looked up by which of their sources are in the set.
+        self._adjacent = 0
+        self._sources = 0
+        self._others = {}
+        for i, positions in enumerate(follow):
+            following = 1 << (i + 1)
+            self._adjacent |= positions & following
+            positions &= ~following
+            if positions:
+                self._sources |= 1 << i
+                self._others[1 << i] = positions
+        self._extra = {0: 0}
+
+        # Each symbol's mask is the positions that can match it.
+        self._any = builder.any
+        self._masks = dict((sym, mask | builder.any)
+                           for sym, mask in builder.masks.items())
+        self._follow = follow
+
+    def __len__(self):
+        return self.positions
+
+    def __repr__(self):
+        return "<PositionAutomaton for %r (%d positions)>" % (
+            self.regex, self.positions)
+
+    @property
+    def deterministic(self):
+        """
+        Indicates whether this automaton can only ever be in one position
+        at a time -- that is, whether no position can be followed by two
+        positions that match the same symbol. If so, a DFA for the regex
+        needs at most one state per position.
+        """
+        any_mask = self._any
+        masks = list(self._masks.values()) or [any_mask]
+        for positions in self._follow:
+            for mask in masks:
+                both = positions & mask
+                if both & (both - 1):
+                    return False
+        return True
+
+    def _follow_others(self, sources):
+        extra = 0
+        others = self._others
+        bits = sources
+        while bits:
+            bit = bits & -bits
+            extra |= others[bit]
+            bits ^= bit
+        if len(self._extra) < _CACHE_LIMIT:
+            self._extra[sources] = extra
+        return extra
+
+    def run(self, subject, state=1):
+        """
+        Reads every symbol in `subject`, and returns the set of positions
+        the automaton ends up in. It stops early if the set becomes empty.
+
+        :param subject: The string to read.
+        :param state: The set of positions to start from. (Defaults to just
+                      the start position.)
+        """
+        adjacent, sources = self._adjacent, self._sources
+        extra, masks, any_mask = self._extra, self._masks, self._any
+        for sym in subject:
+            others = extra.get(state & sources)
+            if others is None:
+                others = self._follow_others(state & sources)
+            state = (((state << 1) & adjacent) | others) & \
+                masks.get(sym, any_mask)
+            if not state:
+                break
+        return state
+
+    def match(self, subject):
+        """
+        Determines whether the `subject` matches this automaton's regex.
+        This gives the same results as `~lexington.regex.Regex.match`.
+
+        :param subject: The string to match.
+        """
+        return bool(self.run(subject) & self.final)
+
+    def matcher(self):
+        """
+        Creates a new `PositionMatcher` that reads input for this automaton
+        incrementally.
+        """
+        return PositionMatcher(self)
+
+
+class PositionMatcher(object):
+    """
+    Matches input against a `PositionAutomaton` a piece at a time.
+
+    :param automaton: The automaton to match against.
+    """
+    __slots__ = ('automaton', 'state')
+
+    def __init__(self, automaton):
+        #: The automaton this matcher is running.
+        self.automaton = automaton
+        #: The set of positions the matcher is currently in.
+        self.state = 1
+
+    def feed(self, data):
+        """
+        Reads more input. This returns `False` once the input can no longer
+        match, no matter what comes after it, and `True` otherwise.
+
+        :param data: The next piece of the string to match.
+        """
+        self.state = self.automaton.run(data, self.state)
+        return self.state != 0
+
+    @property
+    def accepts(self):
+        """
+        Indicates whether all the input fed so far matches.
+        """
+        return bool(self.state & self.automaton.final)
+
+    def reset(self):
+        """
+        Starts matching over again from the beginning.
+        """
+        self.state = 1
+
+
+class _Builder(object):
+    # Walks a regex, numbering its positions and working out the sets the
+    # Glushkov construction needs. visit returns whether a regex accepts the
+    # empty string, the positions it can start with, and the positions it
+    # can end with, and records which positions can follow which.
+    def __init__(self):
+        self.follow = [0]
+        self.masks = {}
+        self.any = 0
+
+    def position(self):
+        self.follow.append(0)
+        return 1 << (len(self.follow) - 1)
+
+    def add_follow(self, sources, targets):
+        follow = self.follow
+        while sources:
+            bit = sources & -sources
+            follow[bit.bit_length() - 1] |= targets
+            sources ^= bit
+
+    def visit(self, regex):
+        if isinstance(regex, SymbolRegex):
+            bit = self.position()
+            self.masks[regex.sym] = self.masks.get(regex.sym, 0) | bit
+            return False, bit, bit
+        elif isinstance(regex, AnySymbolRegex):
+            bit = self.position()
+            self.any |= bit
+            return False, bit, bit
+        elif isinstance(regex, EpsilonRegex):
+            return True, 0, 0
+        elif isinstance(regex, NullRegex):
+            return False, 0, 0
+        elif isinstance(regex, UnionRegex):
+            nullable, first, last = False, 0, 0
+            for option in regex.options:
+                n_opt, f_opt, l_opt = self.visit(option)
+                nullable = nullable or n_opt
+                first |= f_opt
+                last |= l_opt
+            return nullable, first, last
+        elif isinstance(regex, ConcatRegex):
+            # Long concatenations nest too deeply to recurse into.
+            factors = regex.factors()
+            result = self.visit(factors[0])
+            for factor in factors[1:]:
+                result = self.concat(result, self.visit(factor))
+            return result
+        elif isinstance(regex, StarRegex):
+            nullable, first, last = self.visit(regex.regex)
+            self.add_follow(last, first)
+            return True, first, last
+        elif isinstance(regex, RepeatRegex):
+            # Every repetition gets its own positions.
+            result = self.visit(regex.regex)
+            for i in range(regex.count - 1):
+                result = self.concat(result, self.visit(regex.regex))
+            return result
+        raise TypeError(n("Can't build a position automaton for %r" %
+                          regex))
+
+    def concat(self, prefix, suffix):
+        n_pre, f_pre, l_pre = prefix
+        n_suf, f_suf, l_suf = suffix
+        self.add_follow(l_pre, f_suf)
+        return (n_pre and n_suf,
+                f_pre | f_suf if n_pre else f_pre,
+                l_pre | l_suf if n_suf else l_suf)
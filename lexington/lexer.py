@@ -0,0 +1,1252 @@
+"""
+lexington.lexer
+===============
+A lexer is a list of rules, each of which pairs a name with a regular
+expression. The lexer reads input and splits it into tokens, using the
+longest prefix any rule matches (and the earliest rule in the list, if
+several match the same prefix).
+
+Because lexing runs on an `~lexington.automaton.Automaton`, input can be
+fed to a `LexerStream` in arbitrary pieces as it arrives, and tokens come
+out as soon as it's certain where they end.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import codecs
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from .automaton import RuleAutomaton, LimitExceeded, DEAD
+from .regex import Regex, concat, lengths, signature
+from .strings import Text, Bytestring, n
+
+# A checkpoint is this header -- the format version, flags, the lexer's
+# fingerprint, the stream's position, the number and offset of the line it's
+# on, the decoder's flag, and the lengths of the next two fields --
+# followed by the encoding's name, the decoder's buffered bytes, the mode
+# stack (if anything has been pushed on it), and the pending input. The mode
+# stack is a count followed by that many modes. There's no automaton state,
+# since states are numbered in the order each automaton discovers them; the
+# pending input is lexed again instead.
+_CHECKPOINT = struct.Struct(str("<BBIqIqIBH"))
+_VERSION = 3
+_MODE = struct.Struct(str("<H"))
+_PENDING_TEXT = 1
+_MODE_STACK = 2
+
+# The typecode for arrays of offsets. Python 2's arrays don't have "q",
+# but its "l" is just as big on 64-bit platforms.
+try:
+    _OFFSETS = str("q")
+    array(_OFFSETS)
+except ValueError:
+    _OFFSETS = str("l")
+
+#: The name of the only mode of a `Lexer` that isn't given any modes.
+DEFAULT_MODE = "default"
+
+
+class LexError(ValueError):
+    """
+    Raised when the input can't be split into tokens, because no rule matches
+    at some position.
+
+    :param position: The offset where no rule matched.
+    :param message: What went wrong, if it was something other than no
+                    rule matching.
+    """
+    def __init__(self, position, message=None):
+        if message is None:
+            message = "No rule matches at offset %d" % position
+        ValueError.__init__(self, n(message))
+        #: The offset where no rule matched.
+        self.position = position
+        #: The tokens a `LexerStream` completed before the error, in the
+        #: same call to `~LexerStream.feed` or `~LexerStream.finish`.
+        self.tokens = []
+
+
+class Token(object):
+    """
+    A single token produced by a lexer. To stay small, a token only stores
+    its rule's name and its offsets, along with the `Source` it came from.
+    Its text, line, and column are worked out when they're asked for.
+
+    (Keep in mind that a token keeps its source's text alive.)
+
+    :param kind: The name of the rule that matched.
+    :param start: The offset of the token's first symbol.
+    :param end: The offset just after the token's last symbol.
+    :param source: The `Source` the token was lexed from.
+    """
+    __slots__ = ('kind', 'start', 'end', 'source')
+
+    def __init__(self, kind, start, end, source):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.source = source
+
+    @property
+    def text(self):
+        """
+        The text that was matched.
+        """
+        source = self.source
+        base = source.base
+        return source.text[self.start - base:self.end - base]
+
+    @property
+    def line(self):
+        """
+        The number of the line the token starts on, counting from 1.
+        """
+        return self.source.lines.locate(self.start)[0]
+
+    @property
+    def column(self):
+        """
+        The offset of the token's start within its line, counting from 0.
+        """
+        return self.source.lines.locate(self.start)[1]
+
+    def __eq__(self, other):
+        return (isinstance(other, Token) and
+                self.kind == other.kind and self.start == other.start and
+                self.end == other.end and self.text == other.text)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<Token %r %r at %d>" % (self.kind, self.text, self.start)
+
+
+class Source(object):
+    """
+    A piece of input that tokens were lexed from.
+
+    :param text: The input.
+    :param base: The offset of the first symbol in `text`.
+    :param lines: The `LineIndex` for the input, if there is already one.
+    """
+    __slots__ = ('text', 'base', '_lines')
+
+    def __init__(self, text, base=0, lines=None):
+        self.text = text
+        self.base = base
+        self._lines = lines
+
+    @property
+    def lines(self):
+        """
+        The `LineIndex` for this input (created the first time it's used).
+        """
+        if self._lines is None:
+            self._lines = LineIndex(self.text, self.base)
+        return self._lines
+
+
+class LineIndex(object):
+    """
+    Records the offset where each line of some input starts, so that an
+    offset can be turned into a line and column with a binary search.
+
+    Lines can be found two ways: if `text` is given, it's searched lazily,
+    only as far as the offsets being located. Otherwise, input is added a
+    piece at a time with `feed`.
+
+    :param text: The entire input, if it's all available.
+    :param base: The offset of the first symbol of the input.
+    :param line: The number of the line that starts at `base`.
+    """
+    def __init__(self, text=None, base=0, line=1):
+        #: The offset of the start of each line.
+        self.starts = [base]
+        #: The number of the line starting at ``starts[0]``.
+        self.first_line = line
+        self._text = text
+        self._base = base
+        self._scanned = base
+
+    def feed(self, data):
+        """
+        Records the lines in the next piece of input.
+
+        :param data: The next piece of input.
+        """
+        self._add(data, 0, len(data), self._scanned)
+        self._scanned += len(data)
+
+    def _add(self, data, start, end, base):
+        # str.find does the searching, so this only loops once per line.
+        newline = "\n" if isinstance(data, Text) else b"\n"
+        find, starts = data.find, self.starts
+        i = find(newline, start, end)
+        while i >= 0:
+            starts.append(base + i + 1)
+            i = find(newline, i + 1, end)
+
+    def locate(self, offset):
+        """
+        Returns the line (counting from 1) and column (counting from 0) of
+        an offset.
+
+        :param offset: The offset to find.
+        """
+        text = self._text
+        if text is not None and offset >= self._scanned:
+            start = self._scanned - self._base
+            end = min(max(offset - self._base + 1, start + 4096), len(text))
+            self._add(text, start, end, self._base)
+            self._scanned = self._base + end
+        index = bisect_right(self.starts, offset) - 1
+        return self.first_line + index, offset - self.starts[index]
+
+
+class TrailingContext(object):
+    """
+    A rule that only matches `regex` when `context` comes right after it,
+    like ``r/s`` in lex. The context is part of the match when the lexer
+    looks for the longest one, but the token ends where `regex` does, and
+    the context is lexed again as the beginning of the next token.
+
+    Finding where the token ends never takes a second scan, because either
+    `regex` or `context` has to match strings of just one length: the end
+    is that far from the token's start or the match's end.
+
+    :param regex: The regex for the token itself.
+    :param context: The regex that has to follow it.
+    """
+    __slots__ = ('regex', 'context')
+
+    def __init__(self, regex, context):
+        #: The regex for the token itself.
+        self.regex = Regex(regex)
+        #: The regex that has to follow the token.
+        self.context = Regex(context)
+
+    def __eq__(self, other):
+        return (isinstance(other, TrailingContext) and
+                self.regex == other.regex and self.context == other.context)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((TrailingContext, self.regex, self.context))
+
+    def __repr__(self):
+        return "TrailingContext(%r, %r)" % (self.regex, self.context)
+
+    def to_utf8(self):
+        """
+        Returns the same rule, with both regexes converted with
+        `~lexington.regex.Regex.to_utf8`.
+        """
+        return TrailingContext(self.regex.to_utf8(), self.context.to_utf8())
+
+
+class Lexer(object):
+    """
+    Splits input into tokens according to a list of rules.
+
+    :param rules: A sequence of ``(name, regex)`` pairs, in priority order.
+                  None of the regexes may accept the empty string. A regex
+                  can also be a `TrailingContext`.
+    :param restart: A string after which it's always safe to start lexing
+                    from scratch (like ``"\\n"`` for line-based grammars).
+                    This is only a hint, used by `lex_parallel` to pick
+                    places to split its input.
+    :param skip: The names of rules whose tokens should be thrown away,
+                 like whitespace and comments.
+    :param limits: The `~lexington.automaton.Limits` on the size of the
+                   lexer's automaton, if any.
+    :param modes: A sequence of ``(mode, rule names)`` pairs, naming each
+                  mode and the rules that can match in it. The lexer starts
+                  in the first one. (By default, there is one mode, named
+                  `DEFAULT_MODE`, with every rule in it.)
+    :param push: A mapping from rule names to modes. After one of those
+                 rules matches, its mode is pushed onto the lexer's stack of
+                 modes, and only its rules can match until it's popped.
+    :param pop: The names of rules that go back to the previous mode after
+                they match. (If a rule pops and pushes, the pop comes
+                first.)
+    """
+    def __init__(self, rules, restart=None, skip=(), limits=None, modes=None,
+                 push=None, pop=()):
+        #: The ``(name, regex)`` pairs this lexer uses.
+        self.rules = [(name, regex if isinstance(regex, TrailingContext)
+                       else Regex(regex)) for name, regex in rules]
+        # Indexed by rule: None, or whether the token's length is fixed
+        # (instead of its context's) and what that length is.
+        self._trails = []
+        regexes = []
+        for name, regex in self.rules:
+            trail = None
+            if isinstance(regex, TrailingContext):
+                trail = _trail(name, regex)
+                regexes.append(concat(regex.regex, regex.context))
+                regex = regex.regex
+            else:
+                regexes.append(regex)
+            if regex.accepts_empty_string:
+                raise ValueError(n("Rule %r accepts the empty string" %
+                                   (name,)))
+            self._trails.append(trail)
+        #: The names of the rules, in order.
+        self.names = [name for name, regex in self.rules]
+        #: The `~lexington.automaton.RuleAutomaton` for the rules.
+        self.automaton = RuleAutomaton(regexes, limits)
+        #: The string after which lexing can safely restart.
+        self.restart = restart
+        #: The names of the rules whose tokens are skipped.
+        self.skip = frozenset(skip)
+        for name in self.skip:
+            if name not in self.names:
+                raise ValueError(n("Can't skip unknown rule %r" % (name,)))
+        # Indexed by rule, so the scanning loops can check it cheaply.
+        self._skip = [name in self.skip for name in self.names]
+
+        if modes is None:
+            modes = [(DEFAULT_MODE, self.names)]
+        #: The ``(mode, rule names)`` pairs, with the first mode first.
+        self.modes = [(mode, tuple(names)) for mode, names in modes]
+        #: The names of the modes, in order.
+        self.mode_names = [mode for mode, names in self.modes]
+        #: Which mode each rule pushes, by rule name.
+        self.push = dict(push or {})
+        #: The names of the rules that pop a mode.
+        self.pop = frozenset(pop)
+        for mode, names in self.modes:
+            for name in names:
+                if name not in self.names:
+                    raise ValueError(n("Mode %r has unknown rule %r" %
+                                       (mode, name)))
+        for name in set(self.push) | self.pop:
+            if name not in self.names:
+                raise ValueError(n("Can't switch modes after unknown rule "
+                                   "%r" % (name,)))
+        for mode in self.push.values():
+            if mode not in self.mode_names:
+                raise ValueError(n("Can't push unknown mode %r" % (mode,)))
+        self._starts = self._start_states()
+        # Also indexed by rule: None, or whether to pop and what to push.
+        self._actions = [None] * len(self.names)
+        for rule, name in enumerate(self.names):
+            if name in self.pop or name in self.push:
+                mode = self.push.get(name)
+                self._actions[rule] = (
+                    name in self.pop,
+                    None if mode is None else self.mode_names.index(mode))
+
+        self._fingerprint = zlib.crc32("\0".join(
+            ["%s=%s" % (name, _signature(rule)) for name, rule in self.rules] +
+            ["%s:%s" % (mode, ",".join(names)) for mode, names in self.modes] +
+            ["%s>%s" % item for item in sorted(self.push.items())] +
+            ["%s<" % name for name in sorted(self.pop)]
+        ).encode("utf-8")) & 0xffffffff
+
+    def __repr__(self):
+        return "<Lexer with rules %s>" % ", ".join(self.names)
+
+    def _start_states(self):
+        # Every mode is a start state of the same automaton, so switching
+        # modes is just starting the next token somewhere else.
+        return [self.automaton.start_for(self.names.index(name)
+                                         for name in names)
+                for mode, names in self.modes]
+
+    def _trim(self, rule, begin, end):
+        # Moves the end of a trailing context rule's match back to the end
+        # of its token.
+        fixed, length = self._trails[rule]
+        return begin + length if fixed else end - length
+
+    def _switch(self, rule, modes, position):
+        # Carries out a rule's mode action on a stack of modes, and returns
+        # the start state of the mode on top afterwards.
+        pops, pushed = self._actions[rule]
+        if pops:
+            if len(modes) == 1:
+                raise LexError(position, "Rule %r can't pop the first mode, "
+                               "at offset %d" % (self.names[rule], position))
+            modes.pop()
+        if pushed is not None:
+            modes.append(pushed)
+        return self._starts[modes[-1]]
+
+    def to_utf8(self):
+        """
+        Returns a lexer with the same rules, converted with
+        `~lexington.regex.Regex.to_utf8`, so that it lexes UTF-8 encoded
+        bytes without decoding them. Its tokens' text and offsets are in
+        bytes, so only the tokens you actually keep need to be decoded.
+        """
+        restart = self.restart
+        if restart is not None and not isinstance(restart, Bytestring):
+            restart = restart.encode("utf-8")
+        return Lexer([(name, regex.to_utf8()) for name, regex in self.rules],
+                     restart, self.skip, self.automaton.limits, self.modes,
+                     self.push, self.pop)
+
+    def updated(self, add=(), remove=(), skip=()):
+        """
+        Returns a new lexer with some rules added, replaced, or removed.
+        Instead of starting from scratch, its automaton reuses the states
+        this lexer's automaton has already discovered (see
+        `~lexington.automaton.RuleAutomaton.updated`). This lexer doesn't
+        change, and streams using it can move to the new one with
+        `LexerStream.switch`.
+
+        :param add: ``(name, regex)`` pairs. If a name is already a rule's,
+                    its regex replaces that rule's. Otherwise, the rule is
+                    added after the existing ones, in the first mode.
+        :param remove: The names of rules to remove. They're also taken out
+                       of every mode, `skip`, `push`, and `pop`.
+        :param skip: The names of added rules whose tokens should be thrown
+                     away.
+        """
+        remove = frozenset(remove)
+        for name in remove:
+            if name not in self.names:
+                raise ValueError(n("Can't remove unknown rule %r" % (name,)))
+        add = list(add)
+        changed = dict(add)
+        rules = [(name, changed.pop(name, rule)) for name, rule in self.rules
+                 if name not in remove]
+        added = [name for name, rule in add if name in changed]
+        rules.extend((name, rule) for name, rule in add if name in changed)
+
+        def keep(names):
+            return [name for name in names if name not in remove]
+        modes = [(mode, keep(names)) for mode, names in self.modes]
+        modes[0] = (modes[0][0], modes[0][1] + added)
+        push = dict((name, mode) for name, mode in self.push.items()
+                    if name not in remove)
+        lexer = Lexer(rules, self.restart, keep(self.skip) + list(skip),
+                      self.automaton.limits, modes, push, keep(self.pop))
+        lexer.automaton = self.automaton.updated(lexer.automaton.regexes)
+        lexer._starts = lexer._start_states()
+        return lexer
+
+    def stream(self, offset=0, encoding=None):
+        """
+        Creates a new `LexerStream` that can be fed input incrementally.
+
+        :param offset: The offset of the first symbol that will be fed.
+        :param encoding: The encoding to decode input from, if the rules
+                         match text but the input will be bytes.
+        """
+        return LexerStream(self, offset, encoding)
+
+    def lex(self, text):
+        """
+        Lexes an entire string at once, and returns a list of its tokens.
+
+        :param text: The string to lex.
+        :raises LexError: If no rule matches somewhere in `text`.
+        """
+        names = self.names
+        source = Source(text)
+        return [Token(names[rule], start, end, source)
+                for rule, start, end, seen, modes
+                in self._munch(text, [0], skip=self._skip)]
+
+    def lex_columns(self, text, batch_size=65536):
+        """
+        Lexes an entire string without creating any `Token` objects.
+        Instead, this yields the tokens in batches of three parallel arrays:
+        the index of each token's rule in `rules`, each token's start offset,
+        and each token's end offset. ::
+
+            for kinds, starts, ends in lexer.lex_columns(text):
+                ...
+
+        The rule indexes are an ``array('i')``, and the offsets are
+        ``array('q')`` (``array('l')`` on Python 2, which doesn't have
+        ``'q'``), so they can be handed to NumPy with
+        `numpy.frombuffer` without copying. The same three arrays are
+        filled again for every batch, so copy them if you need them after
+        asking for the next one. Every batch has `batch_size` tokens,
+        except for the last, which may be shorter.
+
+        :param text: The string to lex.
+        :param batch_size: How many tokens to put in each batch.
+        :raises LexError: If no rule matches somewhere in `text`.
+        """
+        kinds = array(str('i'), [0]) * batch_size
+        starts = array(_OFFSETS, [0]) * batch_size
+        ends = array(_OFFSETS, [0]) * batch_size
+        count = 0
+
+        # This is _munch's loop again, filling the arrays directly: going
+        # through _munch costs a tuple and a generator step per token, which
+        # is most of what skipping Token objects saves.
+        automaton, skip, actions = self.automaton, self._skip, self._actions
+        trails = self._trails
+        transitions, accepting = automaton.transitions, automaton.accepting
+        start_state = state = self._starts[0]
+        modes = [0]
+        length = len(text)
+        begin = i = 0
+        accept = None
+        while True:
+            if i < length:
+                sym = text[i]
+                target = transitions[state].get(sym)
+                if target is None:
+                    target = automaton._discover(state, sym)
+                state = target
+                i += 1
+                if state != DEAD:
+                    rule = accepting[state]
+                    if rule is not None:
+                        accept, accept_end = rule, i
+                    continue
+            elif begin == length:
+                break
+            if accept is None:
+                raise LexError(begin)
+            if trails[accept] is not None:
+                accept_end = self._trim(accept, begin, accept_end)
+            if actions[accept] is not None:
+                start_state = self._switch(accept, modes, begin)
+            if not skip[accept]:
+                kinds[count] = accept
+                starts[count] = begin
+                ends[count] = accept_end
+                count += 1
+                if count == batch_size:
+                    yield kinds, starts, ends
+                    count = 0
+            begin = i = accept_end
+            state, accept = start_state, None
+
+        if count:
+            del kinds[count:], starts[count:], ends[count:]
+            yield kinds, starts, ends
+
+    def resume(self, checkpoint):
+        """
+        Creates a `LexerStream` that continues from a checkpoint made by
+        `LexerStream.checkpoint`, possibly in another process.
+
+        :param checkpoint: The checkpoint's bytes.
+        :raises ValueError: If the checkpoint wasn't made by a lexer with
+                            the same rules and modes.
+        """
+        checkpoint = bytes(checkpoint)
+        (version, flags, fingerprint, position, line, line_start,
+         decoder_flag, encoding_size, buffered_size) = \
+            _CHECKPOINT.unpack_from(checkpoint)
+        if version != _VERSION:
+            raise ValueError(n("Unknown checkpoint version %d" % version))
+        if fingerprint != self._fingerprint:
+            raise ValueError(n("Checkpoint was made by a different lexer"))
+
+        rest = checkpoint[_CHECKPOINT.size:]
+        encoding = rest[:encoding_size].decode("ascii") or None
+        buffered = rest[encoding_size:encoding_size + buffered_size]
+        pending = rest[encoding_size + buffered_size:]
+        modes = [0]
+        if flags & _MODE_STACK:
+            depth = _MODE.unpack_from(pending)[0]
+            modes = [_MODE.unpack_from(pending, _MODE.size * (i + 1))[0]
+                     for i in range(depth)]
+            pending = pending[_MODE.size * (depth + 1):]
+            if max(modes) >= len(self.modes):
+                raise ValueError(n("Checkpoint refers to unknown mode %d" %
+                                   max(modes)))
+        if flags & _PENDING_TEXT:
+            pending = pending.decode("utf-8", "surrogatepass")
+
+        stream = LexerStream(self, position, encoding)
+        if stream._decoder is not None:
+            stream._decoder.setstate((buffered, decoder_flag))
+        # With nothing scanned, the pending input is read again from the
+        # start of the token in progress when more input arrives.
+        stream._pending = [pending] if pending else []
+        stream._lines = LineIndex(base=line_start, line=line)
+        stream._lines._scanned = position
+        stream._lines.feed(pending)
+        stream._modes = modes
+        stream._state = self._starts[modes[-1]]
+        return stream
+
+    def document(self, text):
+        """
+        Lexes `text`, and returns a `Document` that can keep its tokens
+        up to date as the text is edited.
+
+        :param text: The initial text.
+        :raises LexError: If no rule matches somewhere in `text`.
+        """
+        return Document(self, text)
+
+    def _munch(self, text, stack, begin=0, i=None, state=None, accept=None,
+               accept_end=0, final=True, base=0, progress=None,
+               skip=None, skipped=None, switches=None):
+        # The longest-match loop every way of lexing shares. It reads text
+        # from i, in state, where the token in progress started at begin
+        # and the longest match so far is accept (or None), ending at
+        # accept_end. (By default, it starts a new token at begin in the
+        # mode on top of stack.) For each token it completes, it yields
+        # (rule, start, end, seen, modes): seen is one past the last symbol
+        # the automaton read to find the token, or len(text) + 1 if it had
+        # to see the end of the input, and modes is the tuple of modes on
+        # the stack when the token started. Mode switches are carried out on
+        # stack before the token is yielded, and if switches is a list,
+        # (end, modes after) is appended to it for each one. Unless final is
+        # true, it stops when text runs out in the middle of a token, and
+        # stores (begin, state, accept, accept_end) for it in progress.
+        # base is text's offset, for error messages and switches. If skip
+        # is given, tokens of the rules it marks aren't yielded, and if
+        # skipped is also given, skipped[0] is raised to the seen of each
+        # of those tokens (and left for the caller to reset).
+        automaton, actions = self.automaton, self._actions
+        trails = self._trails
+        transitions, accepting = automaton.transitions, automaton.accepting
+        modes = tuple(stack)
+        start_state = self._starts[stack[-1]]
+        if state is None:
+            state = start_state
+        if i is None:
+            i = begin
+        length = len(text)
+        while True:
+            if i < length:
+                sym = text[i]
+                target = transitions[state].get(sym)
+                if target is None:
+                    target = automaton._discover(state, sym)
+                state = target
+                i += 1
+                if state != DEAD:
+                    rule = accepting[state]
+                    if rule is not None:
+                        accept, accept_end = rule, i
+                    continue
+                seen = i
+            elif not final:
+                progress[:] = [begin, state, accept, accept_end]
+                return
+            elif begin == length:
+                return
+            else:
+                seen = length + 1
+            # Either the automaton died, or the input is over: the longest
+            # match found so far is a token.
+            if accept is None:
+                raise LexError(base + begin)
+            if trails[accept] is not None:
+                accept_end = self._trim(accept, begin, accept_end)
+            before = modes
+            if actions[accept] is not None:
+                start_state = self._switch(accept, stack, base + begin)
+                modes = tuple(stack)
+                if switches is not None:
+                    switches.append((base + accept_end, modes))
+            if skip is None or not skip[accept]:
+                yield accept, begin, accept_end, seen, before
+            elif skipped is not None and seen > skipped[0]:
+                skipped[0] = seen
+            begin = i = accept_end
+            state, accept = start_state, None
+
+    def _tokenize(self, text, pos=0, modes=(0,)):
+        # Lazily lexes text for a Document, from pos in the given modes.
+        # Along with each token's rule, start, and end, it yields how far
+        # the automaton read to find that token, and the tuple of modes it
+        # was lexed in (see _munch). Skipped tokens aren't yielded, so how
+        # far they looked is added to the token before them (or the first
+        # token, for any at the very beginning).
+        skipped = [0]
+        held = None
+        for rule, start, end, seen, before in self._munch(
+                text, list(modes), pos, skip=self._skip, skipped=skipped):
+            reach, skipped[0] = skipped[0], 0
+            if held is not None:
+                yield (held[0], held[1], held[2], max(held[3], reach),
+                       held[4])
+            else:
+                seen = max(seen, reach)
+            held = (rule, start, end, seen, before)
+        if held is not None:
+            yield held[0], held[1], held[2], max(held[3], skipped[0]), held[4]
+
+    def split(self, text, chunk_size):
+        """
+        Splits `text` into pieces roughly `chunk_size` symbols long, each
+        ending just after an occurrence of `restart`. This returns a list of
+        ``(start, end)`` offsets.
+
+        :param text: The string to split.
+        :param chunk_size: The smallest size of a piece (except the last).
+        """
+        restart = self.restart
+        if restart is None:
+            return [(0, len(text))]
+        bounds = []
+        start = 0
+        while start < len(text):
+            end = text.find(restart, start + chunk_size)
+            end = len(text) if end < 0 else end + len(restart)
+            bounds.append((start, end))
+            start = end
+        return bounds
+
+    def lex_parallel(self, text, executor=None, chunk_size=1 << 20):
+        """
+        Lexes an entire string using a pool of processes, and returns a list
+        of its tokens (which will be the same as the ones `lex` returns).
+
+        The text is split with `split`, and each piece is lexed as if it
+        began at a token boundary, in the first mode. When a token turns out
+        to straddle the edge of a piece, or a piece ends in some other mode,
+        the tokens around it are lexed again in this process until they
+        line up with the next piece's tokens. If this lexer doesn't have a
+        `restart` string, this is no faster than `lex`.
+
+        :param text: The string to lex.
+        :param executor: A `concurrent.futures.Executor` to run the pieces
+                         in. If not given, a `ProcessPoolExecutor` is
+                         created (and shut down) for this call. (On
+                         Python 2, `concurrent.futures` comes from the
+                         ``futures`` backport.)
+        :param chunk_size: The approximate size of each piece.
+        :raises LexError: If no rule matches somewhere in `text`.
+        """
+        bounds = self.split(text, chunk_size)
+        if len(bounds) < 2:
+            return self.lex(text)
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor() as pool:
+                return self.lex_parallel(text, pool, chunk_size)
+
+        futures = [executor.submit(_lex_piece, self, text[start:end], start)
+                   for start, end in bounds]
+
+        names = self.names
+        source = Source(text)
+        tokens = []
+        stream = None
+        for (start, end), future in zip(bounds, futures):
+            found, tail, switches = future.result()
+            points = [offset for offset, modes in switches]
+            # When stream is None, everything before start has already been
+            # turned into tokens, so this piece's tokens are right.
+            # Otherwise, stream is holding a token that hasn't ended, and we
+            # feed it this piece a token at a time until the place it's
+            # waiting at is one where this piece's tokens start, in the same
+            # modes.
+            if stream is not None:
+                starts = dict((s, i) for i, (r, s, e) in enumerate(found))
+                starts[tail] = len(found)
+                synced = None
+                fed = start
+                for rule, s, e in found:
+                    tokens.extend(stream.feed(text[fed:e]))
+                    fed = e
+                    position = stream.position
+                    if position in starts and tuple(stream._modes) == \
+                            _modes_at(switches, points, position):
+                        synced = starts[position]
+                        break
+                if synced is None:
+                    tokens.extend(stream.feed(text[fed:end]))
+                    continue
+                found = found[synced:]
+                stream = None
+            tokens.extend(Token(names[r], s, e, source) for r, s, e in found)
+            modes = _modes_at(switches, points, tail)
+            if tail < end or modes != (0,):
+                stream = self.stream(tail)
+                stream._modes = list(modes)
+                stream._state = self._starts[modes[-1]]
+                tokens.extend(stream.feed(text[tail:end]))
+        if stream is not None:
+            tokens.extend(stream.finish())
+        # The tokens from streams only know about part of the text, so they
+        # get pointed at the whole thing, for line numbers' sake.
+        for token in tokens:
+            token.source = source
+        return tokens
+
+
+class Document(object):
+    """
+    A piece of text and its tokens, which can be edited without lexing the
+    whole thing over again. Use `Lexer.document` to create one.
+
+    Every token remembers how far past its end the lexer had to look to
+    find it. When the text is edited, lexing restarts at the first token
+    that looked at any of the edited text, and stops as soon as it reaches
+    a token that starts where an old token after the edit started -- from
+    there on, the old tokens are still right, and just get moved.
+
+    :param lexer: The `Lexer` to use.
+    :param text: The initial text.
+    """
+    def __init__(self, lexer, text):
+        #: The `Lexer` this document uses.
+        self.lexer = lexer
+        #: The current text.
+        self.text = text
+        #: The current tokens.
+        self.tokens = []
+        # seen[i] is how far the lexer looked to find tokens[i], and reach[i]
+        # is the most of seen[0] through seen[i], which is what we search.
+        # modes[i] is the stack of modes tokens[i] was lexed in.
+        self._seen = []
+        self._reach = []
+        self._modes = []
+        names = lexer.names
+        source = Source(text)
+        for rule, start, end, seen, modes in lexer._tokenize(text):
+            self.tokens.append(Token(names[rule], start, end, source))
+            self._seen.append(seen)
+            self._modes.append(modes)
+        self._update_reach(0)
+
+    def _update_reach(self, start):
+        reach = self._reach
+        del reach[start:]
+        highest = reach[-1] if reach else 0
+        for seen in self._seen[start:]:
+            if seen > highest:
+                highest = seen
+            reach.append(highest)
+
+    def edit(self, offset, deleted, inserted):
+        """
+        Replaces `deleted` symbols of the text starting at `offset` with
+        `inserted`, and updates the tokens to match. This returns a tuple
+        ``(first, old_stop, new_stop)``, meaning that the old tokens
+        ``first`` through ``old_stop - 1`` were replaced by the new tokens
+        ``first`` through ``new_stop - 1``. (The other tokens are the same
+        objects as before, with their offsets moved and their `Source`
+        updated to the new text.)
+
+        :param offset: Where the edit starts.
+        :param deleted: How many symbols were removed.
+        :param inserted: The text put in their place.
+        :raises LexError: If no rule matches somewhere in the new text.
+            (The document is left unchanged.)
+        """
+        old_text = self.text
+        if offset < 0 or deleted < 0 or offset + deleted > len(old_text):
+            raise ValueError(n("Edit is outside the text"))
+        text = old_text[:offset] + inserted + old_text[offset + deleted:]
+        delta = len(inserted) - deleted
+        edit_end = offset + deleted
+        tokens = self.tokens
+
+        # The last token always looks at the end of the text, so this only
+        # runs off the end when there are no tokens at all. If it's the first
+        # token, skipped tokens before it may have changed too.
+        first = bisect_right(self._reach, offset)
+        if 0 < first < len(tokens):
+            pos, modes = tokens[first].start, self._modes[first]
+        else:
+            pos, modes = 0, (0,)
+
+        names = self.lexer.names
+        source = Source(text)
+        new_tokens, new_seen, new_modes = [], [], []
+        old = first
+        for rule, start, end, seen, modes in self.lexer._tokenize(text, pos,
+                                                                  modes):
+            # Past the edit, see whether an old token starts here too, in
+            # the same modes.
+            if start - delta >= edit_end:
+                while old < len(tokens) and tokens[old].start < start - delta:
+                    old += 1
+                if (old < len(tokens) and
+                        tokens[old].start == start - delta and
+                        self._modes[old] == modes):
+                    break
+            new_tokens.append(Token(names[rule], start, end, source))
+            new_seen.append(seen)
+            new_modes.append(modes)
+        else:
+            old = len(tokens)
+
+        for token in tokens[:first]:
+            token.source = source
+        for token in tokens[old:]:
+            token.start += delta
+            token.end += delta
+            token.source = source
+        seen = self._seen
+        seen[old:] = [s + delta for s in seen[old:]]
+        tokens[first:old] = new_tokens
+        seen[first:old] = new_seen
+        self._modes[first:old] = new_modes
+        self.text = text
+        self._update_reach(first)
+        return first, old, first + len(new_tokens)
+
+
+def _signature(rule):
+    # Describes a rule the same way in every process, for fingerprints.
+    if isinstance(rule, TrailingContext):
+        return "%s / %s" % (signature(rule.regex), signature(rule.context))
+    return signature(rule)
+
+
+def _trail(name, rule):
+    # Works out how to find the end of a TrailingContext rule's token.
+    shortest, longest = lengths(rule.context)
+    if shortest == longest:
+        return False, shortest
+    shortest, longest = lengths(rule.regex)
+    if shortest == longest:
+        return True, shortest
+    raise ValueError(n("Rule %r needs its regex or its context to match "
+                       "strings of only one length" % (name,)))
+
+
+def _lex_piece(lexer, text, offset):
+    # This runs in a worker process. It returns the tokens whose ends are
+    # certain as (rule, start, end) triples, which are cheaper to send back
+    # than Tokens, the offset where the uncertain tail begins, and where
+    # the stack of modes changed, as (offset, modes) pairs.
+    # A LexError here may only mean the piece doesn't really start on a
+    # token boundary, so it's left for the parent to sort out.
+    stream = lexer.stream(offset)
+    stream._switches = []
+    found = []
+    try:
+        stream._scan(text, False, found)
+    except LexError:
+        pass
+    return found, stream.position, stream._switches
+
+
+def _modes_at(switches, points, offset):
+    # Finds the stack of modes a piece was being lexed in at offset.
+    i = bisect_right(points, offset)
+    return switches[i - 1][1] if i else (0,)
+
+
+class LexerStream(object):
+    """
+    Lexes input that arrives a piece at a time. Each call to `feed` returns
+    the tokens that are complete so far -- a token is only complete once
+    the lexer has seen a symbol that can't extend it.
+
+    If the lexer's rules match text but the input arrives as bytes, pass
+    the `encoding` the bytes are in. The stream will decode them as they
+    arrive (holding on to a character that's split between two pieces), and
+    tokens and offsets will be in terms of the decoded text.
+
+    When a stream raises `LexError`, the tokens it completed before the
+    error are in the exception's `~LexError.tokens`. The stream stops at the
+    error, so feeding it more input only raises the same error again.
+
+    If the lexer's automaton hits one of its `~lexington.automaton.Limits`,
+    `~lexington.automaton.LimitExceeded` is raised and nothing is lexed, so
+    the same input can be fed again once the limit is raised.
+
+    :param lexer: The `Lexer` whose rules to use.
+    :param offset: The offset of the first symbol that will be fed.
+    :param encoding: The encoding to decode input from, if it's bytes.
+    """
+    def __init__(self, lexer, offset=0, encoding=None):
+        #: The `Lexer` whose rules this stream uses.
+        self.lexer = lexer
+        #: The offset of the first symbol that isn't part of a returned
+        #: token yet.
+        self.position = offset
+        #: The encoding input is decoded from, or `None`.
+        self.encoding = encoding
+        self._decoder = (codecs.getincrementaldecoder(encoding)()
+                         if encoding is not None else None)
+        self._lines = LineIndex(base=offset)
+
+        # pending holds the input from position onwards, in the pieces it
+        # was fed in, all of which the automaton has already read. accept
+        # is the rule that matched the longest prefix of that input, and
+        # accept_end is where that prefix ends.
+        self._pending = []
+        self._scanned = 0
+        self._state = lexer._starts[0]
+        self._accept = None
+        self._accept_end = 0
+        # The stack of modes, as indexes into lexer.modes. If switches is
+        # a list, every change to the stack is recorded in it.
+        self._modes = [0]
+        self._switches = None
+        # The lexer to switch to at the next token boundary.
+        self._next = None
+
+    @property
+    def mode(self):
+        """
+        The name of the mode the next token will be lexed in.
+        """
+        return self.lexer.mode_names[self._modes[-1]]
+
+    def switch(self, lexer):
+        """
+        Starts using another `Lexer`, like one made by `Lexer.updated`,
+        from the next token boundary on. If no token is in progress, that's
+        right away. Otherwise, it's as soon as the token in progress is
+        complete, so every token is lexed entirely by one lexer or the
+        other.
+
+        :param lexer: The lexer to switch to. It must have the same modes
+                      as this stream's lexer.
+        :raises ValueError: If the lexers' modes are different.
+        """
+        if lexer.mode_names != self.lexer.mode_names:
+            raise ValueError(n("Can't switch to a lexer with different "
+                               "modes"))
+        if self._pending:
+            self._next = lexer
+        else:
+            self.lexer, self._next = lexer, None
+            self._state = lexer._starts[self._modes[-1]]
+            self._accept = None
+
+    def feed(self, data):
+        """
+        Lexes another piece of input, and returns a list of the tokens
+        that it completed.
+
+        :param data: The next piece of input.
+        :raises LexError: If no rule matches at some position. (Its
+                          `~LexError.tokens` are the tokens completed
+                          before that.)
+        """
+        return self._lex(data, False)
+
+    def finish(self):
+        """
+        Signals that there is no more input, and returns a list of the
+        remaining tokens.
+
+        :raises LexError: If the remaining input isn't made of tokens.
+        """
+        return self._lex(b"" if self._decoder is not None else None, True)
+
+    def _lex(self, data, final):
+        # _scan leaves the stream alone if the automaton hits a limit, so
+        # the decoder is put back the way it was too.
+        decoder = self._decoder
+        if decoder is not None:
+            saved = decoder.getstate()
+            data = decoder.decode(data, final)
+        found = []
+        try:
+            text, base, retired = self._scan(data, final, found)
+        except LimitExceeded:
+            if decoder is not None:
+                decoder.setstate(saved)
+            raise
+        except LexError:
+            if data:
+                self._lines.feed(data)
+            raise
+        if data:
+            self._lines.feed(data)
+        tokens = self._tokens(found, text, base, retired)
+        self._trim_lines()
+        return tokens
+
+    def checkpoint(self):
+        """
+        Returns a snapshot of this stream as a few bytes, which
+        `Lexer.resume` can turn back into a stream that picks up exactly
+        where this one is now. The snapshot holds the stream's position and
+        modes, plus whatever input is pending in the token being lexed,
+        which is lexed again after resuming.
+
+        It doesn't depend on how far the lexer's automaton has been built,
+        so any lexer with the same rules and modes can resume it -- in
+        another process, for instance.
+
+        :raises ValueError: If a `switch` to another lexer is still waiting
+                            for the token in progress to end. (The
+                            snapshot can only name one lexer.)
+        """
+        if self._next is not None:
+            raise ValueError(n("Can't checkpoint a stream that's waiting to "
+                               "switch lexers"))
+        pending = self._pending
+        data = pending[0][:0].join(pending) if pending else b""
+        flags = 0
+        if isinstance(data, Text):
+            data = data.encode("utf-8", "surrogatepass")
+            flags |= _PENDING_TEXT
+        buffered, decoder_flag = b"", 0
+        if self._decoder is not None:
+            buffered, decoder_flag = self._decoder.getstate()
+        encoding = (self.encoding or "").encode("ascii")
+        modes = b""
+        if self._modes != [0]:
+            flags |= _MODE_STACK
+            modes = b"".join(_MODE.pack(mode) for mode in
+                             [len(self._modes)] + self._modes)
+        lines = self._lines
+        index = bisect_right(lines.starts, self.position) - 1
+        return (_CHECKPOINT.pack(_VERSION, flags, self.lexer._fingerprint,
+                                 self.position, lines.first_line + index,
+                                 lines.starts[index],
+                                 decoder_flag, len(encoding),
+                                 len(buffered)) +
+                encoding + buffered + modes + data)
+
+    def _trim_lines(self):
+        # The lines before the one position is on are only needed by tokens
+        # that were already returned, which share the old LineIndex. So the
+        # stream can go on with a new one that leaves them out.
+        lines = self._lines
+        index = bisect_right(lines.starts, self.position) - 1
+        if index > 0:
+            trimmed = LineIndex(base=lines.starts[index],
+                                line=lines.first_line + index)
+            trimmed.starts.extend(lines.starts[index + 1:])
+            trimmed._scanned = lines._scanned
+            self._lines = trimmed
+
+    def _tokens(self, found, text, base, retired=None):
+        # If the stream switched lexers, retired holds how many of the
+        # tokens came from the old lexer, and that lexer's rule names.
+        names = self.lexer.names
+        source = Source(text, base, self._lines)
+        if retired is not None:
+            count, old_names = retired
+            return ([Token(old_names[r], s, e, source)
+                     for r, s, e in found[:count]] +
+                    [Token(names[r], s, e, source)
+                     for r, s, e in found[count:]])
+        return [Token(names[r], s, e, source) for r, s, e in found]
+
+    def _switched(self, lexer, modes, switches, retired):
+        # Writes back what _scan changed besides the input: the modes, any
+        # changes to them it recorded, and the lexer, if a switch happened.
+        self._modes = modes
+        if switches:
+            self._switches.extend(switches)
+        if retired is not None:
+            self.lexer, self._next = lexer, None
+
+    def _scan(self, data, final, found):
+        # This is the inner loop of the lexer. It appends a (rule, start,
+        # end) triple to found for each token it completes, and returns the
+        # text it scanned, that text's offset, and what _tokens needs to
+        # know about a switch to another lexer (or None).
+        lexer = self.lexer
+        automaton = lexer.automaton
+        transitions, accepting = automaton.transitions, automaton.accepting
+        pending, scanned = self._pending, self._scanned
+        state, accept, accept_end = self._state, self._accept, self._accept_end
+        position = self.position
+        switching = self._next is not None
+        i = scanned
+
+        if pending and data and scanned:
+            # A token is already in progress. As long as it keeps going,
+            # only the new data is read, and it's set aside without copying
+            # the input that came before it. That way, a long token arriving
+            # in many pieces costs time in proportion to each piece.
+            length = len(data)
+            j = 0
+            while j < length:
+                sym = data[j]
+                target = transitions[state].get(sym)
+                if target is None:
+                    target = automaton._discover(state, sym)
+                if target == DEAD:
+                    break
+                state = target
+                j += 1
+                rule = accepting[state]
+                if rule is not None:
+                    accept, accept_end = rule, scanned + j
+            if j == length and not final:
+                pending.append(data)
+                self._scanned = scanned + length
+                self._state = state
+                self._accept, self._accept_end = accept, accept_end
+                return data, position, None
+            # Something ends in this piece, so pick up where that left off.
+            i = scanned + j
+
+        # Nothing is written back to the stream until the end, so if the
+        # automaton hits a limit partway through, the stream is left the way
+        # it was before this input.
+        if data:
+            pending = pending + [data]
+        if not pending:
+            return data, position, None
+        buffer = pending[0][:0].join(pending) if len(pending) > 1 \
+            else pending[0]
+
+        modes = list(self._modes)
+        switches = [] if self._switches is not None else None
+        retired = None
+        begin = 0
+        progress = []
+        append = found.append
+        while True:
+            # While switching, skipped tokens are yielded too, since the
+            # switch happens at the first token boundary of any kind.
+            tokens = lexer._munch(buffer, modes, begin, i, state, accept,
+                                  accept_end, final, position, progress,
+                                  None if switching else lexer._skip,
+                                  None, switches)
+            try:
+                if not switching:
+                    for rule, start, end, seen, before in tokens:
+                        append((rule, position + start, position + end))
+                    break
+                for rule, start, end, seen, before in tokens:
+                    if not lexer._skip[rule]:
+                        append((rule, position + start, position + end))
+                    break
+                else:
+                    break
+            except LexError as error:
+                # Everything before the error was lexed, so that much is
+                # kept, along with the input from the error on. (Lexing it
+                # again will fail the same way.)
+                self._switched(lexer, modes, switches, retired)
+                rest = buffer[error.position - position:]
+                self._pending = [rest] if rest else []
+                self._scanned = 0
+                self.position = error.position
+                self._state = lexer._starts[modes[-1]]
+                self._accept = None
+                error.tokens = self._tokens(found, buffer, position,
+                                            retired)
+                raise
+            # This is the token boundary a switch was waiting for.
+            tokens.close()
+            switching = False
+            retired = (len(found), lexer.names)
+            lexer = self._next
+            begin = i = end
+            state, accept = None, None
+
+        if progress:
+            begin, state, accept, accept_end = progress
+        else:
+            begin, state, accept = len(buffer), lexer._starts[modes[-1]], None
+        length = len(buffer)
+
+        self._switched(lexer, modes, switches, retired)
+        rest = buffer[begin:]
+        self._pending = [rest] if rest else []
+        self._scanned = length - begin
+        self.position = position + begin
+        self._state = state
+        self._accept = accept
+        self._accept_end = accept_end - begin
+        return buffer, position, retired
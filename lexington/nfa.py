@@ -0,0 +1,148 @@
+"""
+lexington.nfa
+=============
+An `~lexington.automaton.Automaton` is a DFA, and for some regexes -- like
+``(a|b)* a (a|b)**20``, which has to remember the last 21 symbols -- a DFA
+needs exponentially many states. An `NFA` avoids that by using Antimirov's
+partial derivatives (see `~lexington.regex.Regex.partial_derive`) instead.
+Its states are single partial derivatives, and there are never more of them
+than there are pieces of the original regex. Matching keeps track of the
+set of states the input could be in, so it does a little more work per
+symbol, but the memory it needs grows with the size of the regex instead of
+with the number of DFA states. (Intersections and complements are the
+exception: their partial derivatives combine pieces of the regex, so they
+can add more states.)
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+from timeit import default_timer
+from .automaton import Automaton, Matcher
+
+_NOTHING = frozenset()
+
+
+class NFA(Automaton):
+    """
+    A nondeterministic automaton, built lazily from the partial derivatives
+    of a regular expression. It numbers its states and caches its
+    transitions just like `~lexington.automaton.Automaton`, and can be
+    shared between threads the same way, but each transition leads to a
+    tuple of states instead of just one.
+
+    :param regex: The regular expression to recognize. (It will be
+                  converted with `~lexington.regex.regexify`.)
+    """
+    def __repr__(self):
+        return "<NFA for %r (%d states)>" % (self.regex, len(self))
+
+    def step(self, state, sym):
+        """
+        Returns a tuple of the states reached from `state` after reading
+        `sym`, deriving them if this transition hasn't been seen yet.
+
+        :param state: The state number to start from.
+        :param sym: The symbol to read.
+        """
+        targets = self.transitions[state].get(sym)
+        if targets is None:
+            targets = self._discover(state, sym)
+        return targets
+
+    def _discover(self, state, sym):
+        if self.limits is not None:
+            started = default_timer()
+        terms = self.states[state].partial_derive(sym)
+        with self._lock:
+            targets = self.transitions[state].get(sym)
+            if targets is None:
+                if self.limits is not None:
+                    self._check_limits(
+                        sum(1 for t in terms if t not in self.index), started)
+                self._edges += 1
+                targets = tuple(sorted(self._intern(t) for t in terms))
+                self.transitions[state][sym] = targets
+        return targets
+
+    def run(self, subject, states=None):
+        """
+        Reads every symbol in `subject`, and returns the `frozenset` of
+        states the automaton could end up in. It stops early if that set
+        becomes empty.
+
+        :param subject: The string to read.
+        :param states: The set of states to start from. (Defaults to just
+                       `start`.)
+        """
+        if states is None:
+            states = (self.start,)
+        transitions = self.transitions
+        for sym in subject:
+            following = set()
+            for state in states:
+                targets = transitions[state].get(sym)
+                if targets is None:
+                    targets = self._discover(state, sym)
+                following.update(targets)
+            if not following:
+                return _NOTHING
+            states = following
+        return frozenset(states)
+
+    def match(self, subject):
+        """
+        Determines whether the `subject` matches this automaton's regex.
+        This gives the same results as `~lexington.regex.Regex.match`.
+
+        :param subject: The string to match.
+        """
+        accepting = self.accepting
+        return any(accepting[state] for state in self.run(subject))
+
+    def matcher(self):
+        """
+        Creates a new `NFAMatcher` that reads input for this automaton
+        incrementally.
+        """
+        return NFAMatcher(self)
+
+
+class NFAMatcher(Matcher):
+    """
+    Matches input against an `NFA` a piece at a time. Its `state` is the
+    `frozenset` of states the input so far could have led to.
+
+    :param automaton: The automaton to match against.
+    """
+    __slots__ = ()
+
+    def __init__(self, automaton):
+        #: The automaton this matcher is running.
+        self.automaton = automaton
+        #: The set of state numbers the matcher could currently be in.
+        self.state = frozenset((automaton.start,))
+
+    def feed(self, data):
+        """
+        Reads more input. This returns `False` once the input can no longer
+        match, no matter what comes after it, and `True` otherwise.
+
+        :param data: The next piece of the string to match.
+        """
+        self.state = self.automaton.run(data, self.state)
+        return bool(self.state)
+
+    @property
+    def accepts(self):
+        """
+        Indicates whether all the input fed so far matches.
+        """
+        accepting = self.automaton.accepting
+        return any(accepting[state] for state in self.state)
+
+    def reset(self):
+        """
+        Starts matching over again from the beginning.
+        """
+        self.state = frozenset((self.automaton.start,))
@@ -10,9 +10,17 @@ derivatives even if they were. So, this implementation is necessary.
 :license:   Released under the MIT/X11 license, see LICENSE for details
 """
 from __future__ import unicode_literals
+import random
+import sys
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import Sequence
-from .strings import Strings, Characters, native_strings, n, string_type
+from collections import namedtuple
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+from .cache import LRUCache
+from .strings import (Strings, Characters, Text, Bytestring, PYTHON_3000,
+                      native_strings, n, string_type)
 
 
 ### Very scary metaprogramming ###
@@ -95,6 +103,22 @@ class Regex(_Regex):
         """
         pass
 
+    @abstractmethod
+    def partial_derive(self, sym):
+        """
+        Returns the partial derivatives of this regular expression with
+        respect to a symbol, as a `frozenset` of regexes. The union of the
+        partial derivatives is equivalent to `derive`'s result, but keeping
+        them apart means every one is made of pieces of this regex, so only
+        a handful of distinct ones can ever come up, no matter how many
+        symbols are derived in a row. (This is Antimirov's construction,
+        which `~lexington.nfa.NFA` uses.)
+
+        :param sym: The symbol to derive this regular expression with regards
+                    to.
+        """
+        pass
+
     @abstractproperty
     def accepts_empty_string(self):
         """
@@ -115,6 +139,19 @@ class Regex(_Regex):
         """
         pass
 
+    @abstractmethod
+    def to_utf8(self):
+        """
+        Returns an equivalent regular expression over the UTF-8 encoding of
+        the strings this one matches. That is, the result matches the bytes
+        ``s.encode("utf-8")`` exactly when this regex matches the text `s`.
+        This lets `~lexington.strings.Text` rules run over raw bytes,
+        without decoding them first.
+
+        :raises TypeError: If this regex matches bytes already.
+        """
+        pass
+
     def __eq__(self, other):
         return type(self) is type(other) and hash(self) == hash(other)
 
@@ -132,8 +169,22 @@ class Regex(_Regex):
 
         This returns `True` if the match succeeds, and `False` if not.
 
+        Short strings (and iterables without a length) are matched by
+        deriving this regex directly. Longer ones are matched with
+        whichever engine `~lexington.engines.compile` picks for this regex,
+        which is kept around for next time.
+
         :param subject: The string to match against this regex.
         """
+        # The engines are built on regexes, so they can't be imported
+        # until they're needed.
+        from .engines import SHORT_INPUT, compile
+        try:
+            long_input = len(subject) > SHORT_INPUT
+        except TypeError:
+            long_input = False
+        if long_input:
+            return bool(compile(self).match(subject))
         re = self
         for sym in subject:
             re = re.derive(sym)
@@ -141,6 +192,30 @@ class Regex(_Regex):
                 return False
         return re.accepts_empty_string
 
+    def equivalent(self, other):
+        """
+        Determines whether this regex matches exactly the same strings as
+        `other`, even if they're written differently. (``==`` only checks
+        whether two regexes are built the same way.)
+
+        :param other: The regular expression to compare against. (It will
+                      be converted with `regexify`.)
+        :raises TypeError: If the regexes have different alphabets.
+        """
+        return _bisimilar(self, regexify(other))
+
+    def subset_of(self, other):
+        """
+        Determines whether every string this regex matches is also matched
+        by `other`.
+
+        :param other: The regular expression to compare against. (It will
+                      be converted with `regexify`.)
+        :raises TypeError: If the regexes have different alphabets.
+        """
+        other = regexify(other)
+        return _bisimilar(union(self, other), other)
+
     @property
     def literal(self):
         """
@@ -186,6 +261,15 @@ class Regex(_Regex):
     def __ror__(self, other):
         return union(other, self)
 
+    def __and__(self, other):
+        return intersect(self, other)
+
+    def __rand__(self, other):
+        return intersect(other, self)
+
+    def __invert__(self):
+        return complement(self)
+
     def __pow__(self, count):
         return repeat(self, count)
 
@@ -199,6 +283,12 @@ class EpsilonRegex(Regex):
     def derive(self, sym):
         return Null
 
+    def partial_derive(self, sym):
+        return _NO_TERMS
+
+    def to_utf8(self):
+        return self
+
     accepts_empty_string = True
 
     alphabet = None
@@ -209,6 +299,11 @@ class EpsilonRegex(Regex):
     def __hash__(self):
         return hash(type(self))
 
+    def __reduce__(self):
+        # There's only one of these, and it should stay that way when
+        # unpickled.
+        return n("Epsilon")
+
 
 class NullRegex(Regex):
     """
@@ -220,6 +315,12 @@ class NullRegex(Regex):
     def derive(self, sym):
         return self
 
+    def partial_derive(self, sym):
+        return _NO_TERMS
+
+    def to_utf8(self):
+        return self
+
     accepts_empty_string = False
 
     alphabet = None
@@ -230,6 +331,11 @@ class NullRegex(Regex):
     def __hash__(self):
         return hash(type(self))
 
+    def __reduce__(self):
+        # There's only one of these, and it should stay that way when
+        # unpickled.
+        return n("Null")
+
 
 class SymbolRegex(Regex):
     """
@@ -245,6 +351,14 @@ class SymbolRegex(Regex):
     def derive(self, sym):
         return Epsilon if sym == self.sym else Null
 
+    def partial_derive(self, sym):
+        return _EPSILON_TERMS if sym == self.sym else _NO_TERMS
+
+    def to_utf8(self):
+        if self.alphabet is not Text:
+            raise TypeError(n("%r is already a bytestring regex" % self))
+        return regexify(self.sym.encode("utf-8"))
+
     accepts_empty_string = False
 
     @property
@@ -253,13 +367,23 @@ class SymbolRegex(Regex):
 
     @property
     def literal(self):
+        # On Python 3, iterating over bytes gives ints, which can't be
+        # concatenated back into a string.
+        if isinstance(self.sym, int):
+            return Bytestring(bytearray((self.sym,)))
         return self.sym
 
     def __repr__(self):
-        return "Regex(%r)" % self.sym
+        return "Regex(%r)" % self.literal
 
     def __hash__(self):
-        return hash((id(type(self)), self.sym))
+        # On Python 2, u"a" and b"a" have the same hash, so the symbol's
+        # type is needed to tell them apart.
+        return hash((id(type(self)), type(self.sym), self.sym))
+
+    def __reduce__(self):
+        # Python 2 can only pickle classes with __slots__ this way.
+        return (SymbolRegex, (self.sym,))
 
 
 class AnySymbolRegex(Regex):
@@ -274,6 +398,18 @@ class AnySymbolRegex(Regex):
     def derive(self, sym):
         return Epsilon
 
+    def partial_derive(self, sym):
+        return _EPSILON_TERMS
+
+    def to_utf8(self):
+        # Matching "any codepoint" in UTF-8 means matching any well-formed
+        # sequence for one codepoint, which is built the first time it's
+        # needed.
+        global _utf8_any
+        if _utf8_any is None:
+            _utf8_any = _build_utf8_any()
+        return _utf8_any
+
     accepts_empty_string = False
 
     alphabet = None
@@ -284,6 +420,50 @@ class AnySymbolRegex(Regex):
     def __hash__(self):
         return hash(type(self))
 
+    def __reduce__(self):
+        # There's only one of these, and it should stay that way when
+        # unpickled.
+        return n("Any")
+
+
+class SymbolRangeRegex(Regex):
+    """
+    A regular expression that matches any one character between two
+    others, inclusive. (Wide character classes are built from these,
+    instead of from a union with an option for every character.)
+
+    :param low: The first character to match.
+    :param high: The last character to match.
+    """
+    __slots__ = ('low', 'high')
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def derive(self, sym):
+        return Epsilon if self.low <= sym <= self.high else Null
+
+    def partial_derive(self, sym):
+        return _EPSILON_TERMS if self.low <= sym <= self.high else _NO_TERMS
+
+    def to_utf8(self):
+        return _utf8_range(ord(self.low), ord(self.high))
+
+    accepts_empty_string = False
+
+    alphabet = Text
+
+    def __repr__(self):
+        return "symbol_range(%r, %r)" % (self.low, self.high)
+
+    def __hash__(self):
+        return hash((id(type(self)), self.low, self.high))
+
+    def __reduce__(self):
+        # Python 2 can only pickle classes with __slots__ this way.
+        return (SymbolRangeRegex, (self.low, self.high))
+
 
 class UnionRegex(Regex):
     """
@@ -291,7 +471,7 @@ class UnionRegex(Regex):
 
     :param options: The regular expressions to accept.
     """
-    __slots__ = ('options', 'alphabet')
+    __slots__ = ('options', 'alphabet', 'accepts_empty_string', '_hash')
 
     def __init__(self, options):
         self.alphabet = None
@@ -304,26 +484,42 @@ class UnionRegex(Regex):
                     raise TypeError(n("Cannot mix alphabets %r and %r in "
                                       "union" %
                                       (self.alphabet, opt.alphabet)))
+        self.accepts_empty_string = any(r.accepts_empty_string
+                                        for r in self.options)
+        self._hash = hash((id(type(self)), self.options))
 
     def derive(self, sym):
         return union(*(r.derive(sym) for r in self.options))
 
-    @property
-    def accepts_empty_string(self):
-        return any(r.accepts_empty_string for r in self.options)
+    def partial_derive(self, sym):
+        return _NO_TERMS.union(*(r.partial_derive(sym)
+                                 for r in self.options))
+
+    def to_utf8(self):
+        return union(*(r.to_utf8() for r in self.options))
 
     def __repr__(self):
         return " | ".join(repr(r) for r in self.options)
 
     def __hash__(self):
-        return hash((id(type(self)), self.options))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process.
+        return (UnionRegex, (tuple(self.options),))
 
 
 class ConcatRegex(Regex):
     """
     A regular expression that matches two regular expressions in a row.
+
+    Long concatenations (like a `join` of thousands of pieces) nest very
+    deeply, so nothing here recurses into `prefix` and `suffix`: the hash
+    and `accepts_empty_string` are worked out once, from the pieces' own
+    cached values, and everything else walks the chain with a loop.
     """
-    __slots__ = ('prefix', 'suffix', 'alphabet')
+    __slots__ = ('prefix', 'suffix', 'alphabet', 'accepts_empty_string',
+                 '_hash')
 
     def __init__(self, prefix, suffix):
         self.prefix = prefix
@@ -337,40 +533,128 @@ class ConcatRegex(Regex):
         alpha_pre = prefix.alphabet
         alpha_suf = suffix.alphabet
         if alpha_pre is not None or alpha_suf is not None:
-            if alpha_pre is not alpha_suf:
+            if (alpha_pre is not None and alpha_suf is not None and
+                    alpha_pre is not alpha_suf):
                 raise TypeError(n("Cannot concatenate alphabets %r and %r" %
                                   (alpha_pre, alpha_suf)))
             self.alphabet = alpha_pre if alpha_suf is None else alpha_suf
         else:
             self.alphabet = None
 
-    def derive(self, sym):
-        if self.prefix.accepts_empty_string:
-            return union(concat(self.prefix.derive(sym), self.suffix),
-                         self.suffix.derive(sym))
-        else:
-            return concat(self.prefix.derive(sym), self.suffix)
+        self.accepts_empty_string = (prefix.accepts_empty_string and
+                                     suffix.accepts_empty_string)
+        self._hash = hash((id(type(self)), prefix, suffix))
 
-    @property
-    def accepts_empty_string(self):
-        return (self.prefix.accepts_empty_string and
-                self.suffix.accepts_empty_string)
+    def factors(self):
+        """
+        Returns a list of the regexes this one matches in a row, none of
+        which are concatenations themselves.
+        """
+        found = []
+        stack = [self]
+        while stack:
+            regex = stack.pop()
+            if isinstance(regex, ConcatRegex):
+                stack.append(regex.suffix)
+                stack.append(regex.prefix)
+            else:
+                found.append(regex)
+        return found
+
+    def _leading(self):
+        # Yields every factor that can match the first symbol -- up to and
+        # including the first one that can't match the empty string --
+        # along with the suffixes that come after it, innermost first.
+        # (Usually, the chain nests to the right, so that's just one.)
+        rests = []
+        regex = self
+        while True:
+            while isinstance(regex, ConcatRegex):
+                rests.append(regex.suffix)
+                regex = regex.prefix
+            yield regex, rests[::-1]
+            if not rests or not regex.accepts_empty_string:
+                return
+            regex = rests.pop()
+
+    def derive(self, sym):
+        # Joining the suffixes back together nests them to the right, so
+        # even if this concatenation nests to the left, its derivatives
+        # (and theirs) will be quick to derive.
+        options = []
+        for factor, suffixes in self._leading():
+            derivative = factor.derive(sym)
+            if derivative is not Null:
+                options.append(join([derivative] + suffixes))
+        return union(*options)
+
+    def partial_derive(self, sym):
+        return frozenset(_follow(t, suffixes)
+                         for factor, suffixes in self._leading()
+                         for t in factor.partial_derive(sym))
+
+    def to_utf8(self):
+        return join([factor.to_utf8() for factor in self.factors()])
 
     @property
     def literal(self):
-        if self.prefix.literal and self.suffix.literal:
-            return self.prefix.literal + self.suffix.literal
-        else:
-            return None
+        pieces = []
+        for factor in self.factors():
+            literal = factor.literal
+            if not literal:
+                return None
+            pieces.append(literal)
+        return pieces[0][:0].join(pieces)
 
     def __repr__(self):
-        if self.literal:
-            return "Regex(%r)" % self.literal
+        literal = self.literal
+        if literal:
+            return "Regex(%r)" % literal
         else:
-            return "%r + %r" % (self.prefix, self.suffix)
+            return " + ".join(repr(factor) for factor in self.factors())
 
     def __hash__(self):
-        return hash((id(type(self)), self.prefix, self.suffix))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process. Pickling the prefix
+        # and suffix as arguments would recurse once per factor, so the
+        # chain goes in postfix order instead, with None for each
+        # concatenation, and _unflatten puts it back together with a loop.
+        items = []
+        stack = [(self, False)]
+        while stack:
+            regex, joined = stack.pop()
+            if joined:
+                items.append(None)
+            elif isinstance(regex, ConcatRegex):
+                stack.append((regex, True))
+                stack.append((regex.suffix, False))
+                stack.append((regex.prefix, False))
+            else:
+                items.append(regex)
+        return (_unflatten, (items,))
+
+
+def _unflatten(items):
+    # Rebuilds a concatenation from ConcatRegex.__reduce__'s items, nesting
+    # it exactly the way it was.
+    stack = []
+    for item in items:
+        if item is None:
+            suffix = stack.pop()
+            stack[-1] = ConcatRegex(stack[-1], suffix)
+        else:
+            stack.append(item)
+    return stack[0]
+
+
+def _follow(regex, suffixes):
+    # Concatenates the suffixes onto regex, one at a time, so the result
+    # nests the same way the original concatenation did.
+    for suffix in suffixes:
+        regex = concat(regex, suffix)
+    return regex
 
 
 class StarRegex(Regex):
@@ -380,25 +664,34 @@ class StarRegex(Regex):
 
     :param regex: The regular expression describing the strings to repeat.
     """
-    __slots__ = ('regex')
+    __slots__ = ('regex', 'alphabet', '_hash')
 
     def __init__(self, regex):
         self.regex = regex
+        self.alphabet = regex.alphabet
+        self._hash = hash((id(type(self)), regex))
 
     def derive(self, sym):
         return concat(self.regex.derive(sym), self)
 
-    accepts_empty_string = True
+    def partial_derive(self, sym):
+        return frozenset(concat(t, self)
+                         for t in self.regex.partial_derive(sym))
 
-    @property
-    def alphabet(self):
-        return self.regex.alphabet
+    def to_utf8(self):
+        return star(self.regex.to_utf8())
+
+    accepts_empty_string = True
 
     def __repr__(self):
         return "star(%r)" % self.regex
 
     def __hash__(self):
-        return hash((id(type(self)), self.regex))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process.
+        return (StarRegex, (self.regex,))
 
 
 class RepeatRegex(Regex):
@@ -409,29 +702,134 @@ class RepeatRegex(Regex):
     :param regex: The regular expression describing the strings to repeat.
     :param count: The number of times to repeat it.
     """
-    __slots__ = ('regex', 'count')
+    __slots__ = ('regex', 'count', 'alphabet', '_hash')
 
     def __init__(self, regex, count):
         if count < 2:
             raise ValueError("Repeat must be greater than 1" % count)
         self.regex = regex
         self.count = count
+        self.alphabet = regex.alphabet
+        self._hash = hash((id(type(self)), regex, count))
 
     def derive(self, sym):
         return concat(self.regex.derive(sym),
                       repeat(self.regex, self.count - 1))
 
-    accepts_empty_string = False
+    def partial_derive(self, sym):
+        rest = repeat(self.regex, self.count - 1)
+        return frozenset(concat(t, rest)
+                         for t in self.regex.partial_derive(sym))
+
+    def to_utf8(self):
+        return repeat(self.regex.to_utf8(), self.count)
 
     @property
-    def alphabet(self):
-        return self.regex.alphabet
+    def accepts_empty_string(self):
+        return self.regex.accepts_empty_string
 
     def __repr__(self):
         return "%r ** %d" % (self.regex, self.count)
 
     def __hash__(self):
-        return hash((id(type(self)), self.regex, self.count))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process.
+        return (RepeatRegex, (self.regex, self.count))
+
+
+class IntersectionRegex(Regex):
+    """
+    A regular expression that only matches strings that all of several
+    regexes match.
+
+    :param options: The regular expressions that all have to match.
+    """
+    __slots__ = ('options', 'alphabet', 'accepts_empty_string', '_hash')
+
+    def __init__(self, options):
+        self.alphabet = None
+        self.options = frozenset(options)
+        for opt in self.options:
+            if opt.alphabet is not None:
+                if self.alphabet is None:
+                    self.alphabet = opt.alphabet
+                elif opt.alphabet is not self.alphabet:
+                    raise TypeError(n("Cannot mix alphabets %r and %r in "
+                                      "intersection" %
+                                      (self.alphabet, opt.alphabet)))
+        self.accepts_empty_string = all(r.accepts_empty_string
+                                        for r in self.options)
+        self._hash = hash((id(type(self)), self.options))
+
+    def derive(self, sym):
+        return intersect(*(r.derive(sym) for r in self.options))
+
+    def partial_derive(self, sym):
+        # Intersection distributes over union, so there's a term for every
+        # way to pick one term from each option.
+        choices = [()]
+        for r in self.options:
+            terms = r.partial_derive(sym)
+            if not terms:
+                return _NO_TERMS
+            choices = [chosen + (t,) for chosen in choices for t in terms]
+        terms = frozenset(intersect(*chosen) for chosen in choices)
+        return terms - _NULL_TERMS
+
+    def to_utf8(self):
+        return intersect(*(r.to_utf8() for r in self.options))
+
+    def __repr__(self):
+        return "intersect(%s)" % ", ".join(repr(r) for r in self.options)
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process.
+        return (IntersectionRegex, (tuple(self.options),))
+
+
+class ComplementRegex(Regex):
+    """
+    A regular expression that matches every string a certain regex doesn't.
+
+    :param regex: The regular expression describing the strings not to
+                  match.
+    """
+    __slots__ = ('regex', 'alphabet', 'accepts_empty_string', '_hash')
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.alphabet = regex.alphabet
+        self.accepts_empty_string = not regex.accepts_empty_string
+        self._hash = hash((id(type(self)), regex))
+
+    def derive(self, sym):
+        return complement(self.regex.derive(sym))
+
+    def partial_derive(self, sym):
+        # Complement doesn't distribute over union, so this can only be
+        # split up as far as the derivative itself.
+        term = complement(union(*self.regex.partial_derive(sym)))
+        return _NO_TERMS if term is Null else frozenset([term])
+
+    def to_utf8(self):
+        # The complement of the encoded strings would include byte strings
+        # that aren't UTF-8 at all, so those have to be taken back out.
+        return intersect(star(Any.to_utf8()), complement(self.regex.to_utf8()))
+
+    def __repr__(self):
+        return "complement(%r)" % self.regex
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only good in this process.
+        return (ComplementRegex, (self.regex,))
 
 
 ### Regex constructors ###
@@ -468,6 +866,11 @@ Epsilon = EpsilonRegex()
 #: empty string.
 Null = NullRegex()
 
+# The most common sets of partial derivatives.
+_NO_TERMS = frozenset()
+_EPSILON_TERMS = frozenset([Epsilon])
+_NULL_TERMS = frozenset([Null])
+
 
 def union(*options):
     """
@@ -493,6 +896,53 @@ def union(*options):
         return UnionRegex(s)
 
 
+def intersect(*options):
+    """
+    Creates a regular expression that only accepts strings that *all* of
+    the following regexes accept.
+
+    :param options: The regular expressions to accept.
+    """
+    s = set()
+    for regex in options:
+        if isinstance(regex, IntersectionRegex):
+            s.update(regex.options)
+        else:
+            regex = regexify(regex)
+            if regex is Null:
+                return Null
+            # complement(Null) accepts everything, so it doesn't narrow
+            # anything down.
+            if not (isinstance(regex, ComplementRegex) and
+                    regex.regex is Null):
+                s.add(regex)
+    if not s:
+        return complement(Null)
+    elif Epsilon in s:
+        if all(regex.accepts_empty_string for regex in s):
+            return Epsilon
+        return Null
+    elif len(s) == 1:
+        return s.pop()
+    else:
+        return IntersectionRegex(s)
+
+
+def complement(regex):
+    """
+    Creates a regular expression that accepts every string `regex` doesn't.
+    (With `intersect`, this can describe things like "an identifier that
+    isn't a keyword.")
+
+    :param regex: The regular expression describing the strings not to
+                  accept.
+    """
+    regex = regexify(regex)
+    if isinstance(regex, ComplementRegex):
+        return regex.regex
+    return ComplementRegex(regex)
+
+
 def concat(prefix, suffix):
     """
     Concatenates two regular expressions, such that `prefix` will be matched,
@@ -580,3 +1030,636 @@ def repeat(regex, count):
         return Null
     else:
         return RepeatRegex(regexify(regex), count)
+
+
+def symbol_range(low, high):
+    """
+    Creates a regular expression that accepts any one character from `low`
+    to `high`, inclusive. (This is what ``[a-z]`` in a pattern means, but
+    however wide the range is, the regex stays the same size.)
+
+    :param low: The first character to accept.
+    :param high: The last character to accept.
+    :raises TypeError: If `low` and `high` aren't text.
+    :raises ValueError: If `high` comes before `low`.
+    """
+    if not (isinstance(low, Text) and isinstance(high, Text)):
+        raise TypeError(n("Ranges can only be made of characters"))
+    if high < low:
+        raise ValueError(n("Range %r to %r is out of order" % (low, high)))
+    elif low == high:
+        return SymbolRegex(low)
+    return SymbolRangeRegex(low, high)
+
+
+### Analysis ###
+
+
+def symbols(regex):
+    """
+    Returns a `frozenset` of every symbol `regex` mentions, counting the
+    first and last symbols of each `symbol_range`. Any two symbols that
+    aren't in this set have the same derivative, in every state, unless a
+    symbol that is in it comes between them.
+
+    :param regex: The regex to examine.
+    """
+    found = set()
+    for node in _nodes(regex):
+        if isinstance(node, SymbolRegex):
+            found.add(node.sym)
+        elif isinstance(node, SymbolRangeRegex):
+            found.add(node.low)
+            found.add(node.high)
+    return frozenset(found)
+
+
+def _nodes(regex):
+    # Yields regex, and every regex inside it.
+    stack = [regex]
+    while stack:
+        regex = stack.pop()
+        yield regex
+        if isinstance(regex, (UnionRegex, IntersectionRegex)):
+            stack.extend(regex.options)
+        elif isinstance(regex, ConcatRegex):
+            stack.append(regex.prefix)
+            stack.append(regex.suffix)
+        elif isinstance(regex, (StarRegex, RepeatRegex, ComplementRegex)):
+            stack.append(regex.regex)
+
+
+def lengths(regex):
+    """
+    Returns the lengths of the shortest and longest strings `regex`
+    matches, as a tuple ``(shortest, longest)``. `longest` is `None` if
+    there's no limit. (For intersections and complements, these are only
+    bounds: no string will be shorter or longer, but there may not be one
+    that's exactly that long.)
+
+    :param regex: The regex to examine.
+    """
+    if isinstance(regex, (SymbolRegex, SymbolRangeRegex, AnySymbolRegex)):
+        return 1, 1
+    elif isinstance(regex, (EpsilonRegex, NullRegex)):
+        return 0, 0
+    elif isinstance(regex, ConcatRegex):
+        shortest, longest = 0, 0
+        for factor in regex.factors():
+            low, high = lengths(factor)
+            shortest += low
+            longest = None if longest is None or high is None \
+                else longest + high
+        return shortest, longest
+    elif isinstance(regex, (UnionRegex, IntersectionRegex)):
+        bounds = [lengths(option) for option in regex.options]
+        lows = [low for low, high in bounds]
+        highs = [high for low, high in bounds]
+        if isinstance(regex, UnionRegex):
+            return min(lows), None if None in highs else max(highs)
+        limited = [high for high in highs if high is not None]
+        return max(lows), min(limited) if limited else None
+    elif isinstance(regex, StarRegex):
+        return 0, 0 if lengths(regex.regex)[1] == 0 else None
+    elif isinstance(regex, RepeatRegex):
+        low, high = lengths(regex.regex)
+        return (low * regex.count,
+                None if high is None else high * regex.count)
+    elif isinstance(regex, ComplementRegex):
+        return (1 if regex.regex.accepts_empty_string else 0), None
+    raise TypeError(n("Can't find the lengths of %r" % regex))
+
+
+def signature(regex):
+    """
+    Returns a string that describes `regex`'s structure. Unlike its hash,
+    which changes from process to process, and its `repr`, which lists a
+    union's options in whatever order they're stored in, it's the same for
+    equal regexes everywhere, so it can identify a regex in data that's
+    saved or sent somewhere else.
+
+    :param regex: The regex to describe.
+    """
+    if isinstance(regex, (UnionRegex, IntersectionRegex)):
+        joiner = " | " if isinstance(regex, UnionRegex) else " & "
+        return "(%s)" % joiner.join(sorted(signature(option)
+                                           for option in regex.options))
+    elif isinstance(regex, ConcatRegex):
+        return "(%s)" % " + ".join(signature(factor)
+                                   for factor in regex.factors())
+    elif isinstance(regex, StarRegex):
+        return "star(%s)" % signature(regex.regex)
+    elif isinstance(regex, RepeatRegex):
+        return "%s ** %d" % (signature(regex.regex), regex.count)
+    elif isinstance(regex, ComplementRegex):
+        return "complement(%s)" % signature(regex.regex)
+    return repr(regex)
+
+
+def representatives(regex):
+    """
+    Returns a list of symbols that covers every way `regex` can be derived:
+    each symbol it mentions, and one symbol it doesn't (if there is one).
+    If it has any `symbol_range` in it, the symbols right after each one
+    it mentions are included too, since the symbols it doesn't mention
+    can be inside a range or outside it.
+
+    :param regex: The regex to examine.
+    """
+    mentioned = symbols(regex)
+    if regex.alphabet is Bytestring:
+        every = Bytestring(bytearray(range(256)))
+        if not PYTHON_3000:
+            every = list(every)
+    else:
+        every = ("%c" % c for c in range(sys.maxunicode + 1))
+    result = sorted(mentioned)
+    for sym in every:
+        if sym not in mentioned:
+            result.append(sym)
+            break
+    if any(isinstance(node, SymbolRangeRegex) for node in _nodes(regex)):
+        for code in sorted(ord(sym) + 1 for sym in mentioned):
+            if code <= sys.maxunicode:
+                sym = "%c" % code
+                if sym not in mentioned and sym not in result:
+                    result.append(sym)
+    return result
+
+
+def _bisimilar(first, second):
+    # Hopcroft and Karp's algorithm: assume the two regexes are equivalent,
+    # and follow every pair of derivatives reachable from them, merging the
+    # classes of each pair in a union-find forest. Pairs already in the
+    # same class have been (or are being) checked, so each class only has
+    # to be derived once. The regexes are equivalent unless some pair
+    # disagrees about accepting the empty string.
+    syms = representatives(union(first, second))
+    parents = {}
+
+    def find(regex):
+        path = []
+        while regex in parents:
+            path.append(regex)
+            regex = parents[regex]
+        for child in path:
+            parents[child] = regex
+        return regex
+
+    pending = []
+    if not first == second:
+        parents[first] = second
+        pending.append((first, second))
+    while pending:
+        first, second = pending.pop()
+        if first.accepts_empty_string != second.accepts_empty_string:
+            return False
+        for sym in syms:
+            d_first, d_second = first.derive(sym), second.derive(sym)
+            r_first, r_second = find(d_first), find(d_second)
+            if not r_first == r_second:
+                parents[r_first] = r_second
+                pending.append((d_first, d_second))
+    return True
+
+
+def prune(regex):
+    """
+    Returns a regex that matches the same strings as `regex`, leaving out
+    any option of a union that only matches strings the other options match
+    anyway (like ``"ab"`` in ``"ab" | "a" + Any``). This takes a
+    derivative-by-derivative comparison per option, so it's meant to be
+    done once, before a regex gets compiled.
+
+    :param regex: The regex to prune.
+    """
+    regex = regexify(regex)
+    if not isinstance(regex, UnionRegex):
+        return regex
+    # Trying the biggest options last means they're the ones that stay.
+    # (Options the same size go in signature order, so the same ones stay
+    # every time.)
+    kept = sorted(regex.options, key=lambda option: (
+        sum(1 for node in _nodes(option)), signature(option)))
+    i = 0
+    while i < len(kept) and len(kept) > 1:
+        others = union(*(kept[:i] + kept[i + 1:]))
+        if kept[i].subset_of(others):
+            del kept[i]
+        else:
+            i += 1
+    return union(*kept)
+
+
+#: What `estimate_states` found out about a regex's DFA.
+#:
+#: .. attribute:: states
+#:
+#:    How many distinct derivatives were actually found.
+#:
+#: .. attribute:: complete
+#:
+#:    Whether that was all of them, which makes `states` exact.
+#:
+#: .. attribute:: estimate
+#:
+#:    A guess at the total number of states (the same as `states` if
+#:    `complete` is true).
+StateEstimate = namedtuple(n("StateEstimate"), "states complete estimate")
+
+
+def estimate_states(regex, budget=10000, samples=200, seed=0):
+    """
+    Works out roughly how many states a DFA for `regex` (like an
+    `~lexington.automaton.Automaton`) would need, without spending more
+    than `budget` derivatives' worth of memory finding out.
+
+    This explores the distinct derivatives of `regex` breadth-first. If
+    there are no more than `budget` of them, the count is exact. Otherwise,
+    it takes `samples` random walks, up to three times as deep as the
+    exploration got, and counts how many of them end up at a derivative it
+    already found: if only a tenth do, there are probably about ten times as
+    many states as were found. This can only see as deep as the walks go,
+    so for regexes that really explode, it's an underestimate -- but it's
+    enough to tell ten states from ten million.
+
+    :param regex: The regex to examine.
+    :param budget: How many derivatives to explore before estimating.
+    :param samples: How many random walks to take when estimating.
+    :param seed: The seed for the random walks, so that estimates are
+                 repeatable.
+    """
+    regex = Regex(regex)
+    syms = representatives(regex)
+    seen = set([regex, Null])
+    frontier = [regex]
+    depth = 0
+    while frontier and len(seen) < budget:
+        following = []
+        for state in frontier:
+            for sym in syms:
+                derivative = state.derive(sym)
+                if derivative not in seen:
+                    seen.add(derivative)
+                    following.append(derivative)
+        frontier = following
+        depth += 1
+    if not frontier:
+        return StateEstimate(len(seen), True, len(seen))
+
+    # The walks never step into Null, since walks that die would all be
+    # counted as finding a known state.
+    rand = random.Random(seed)
+    hits = 0
+    for i in range(samples):
+        state = regex
+        for j in range(rand.randint(depth + 1, 3 * depth)):
+            choices = list(syms)
+            rand.shuffle(choices)
+            for sym in choices:
+                derivative = state.derive(sym)
+                if derivative is not Null:
+                    state = derivative
+                    break
+            else:
+                break
+        if state in seen:
+            hits += 1
+    return StateEstimate(len(seen), False,
+                         len(seen) * samples // max(hits, 1))
+
+
+### Parsing textual patterns ###
+
+
+class PatternError(ValueError):
+    """
+    Raised when `parse` is given a pattern it can't understand.
+
+    :param message: What went wrong.
+    :param position: The offset in the pattern where it went wrong.
+    """
+    def __init__(self, message, position):
+        ValueError.__init__(self, n("%s at offset %d" % (message, position)))
+        #: The offset in the pattern where it went wrong.
+        self.position = position
+
+
+#: The cache of parsed patterns `parse` uses.
+pattern_cache = LRUCache(512)
+
+
+def parse(pattern):
+    """
+    Parses a regular expression written in the usual textual syntax, like
+    ``"[a-z_][a-z0-9_]*"``, into a `Regex`. If `pattern` is bytes, the
+    regex will match bytes. This syntax is supported:
+
+    * Literal symbols, and ``\\`` followed by any punctuation to match it
+      literally
+    * ``.``, which matches any symbol
+    * Classes like ``[abc]`` and ``[a-z0-9]``, and negated classes like
+      ``[^abc]``
+    * The escapes ``\\d``, ``\\w``, and ``\\s`` (which match ASCII
+      digits, word characters, and whitespace), their opposites ``\\D``,
+      ``\\W``, and ``\\S``, ``\\n``, ``\\t``,
+      ``\\r``, ``\\f``, ``\\v``, ``\\xhh``, and ``\\uhhhh``
+    * The repetitions ``*``, ``+``, ``?``, ``{m}``, ``{m,}``, and ``{m,n}``
+    * Groups, written ``(...)`` or ``(?:...)``
+    * Alternation with ``|``
+
+    Since regexes here always match the whole string, there are no anchors,
+    and non-greedy repetitions match the same strings as greedy ones.
+
+    Patterns are cached in `pattern_cache`, so parsing the same pattern
+    again returns the same `Regex` object without any work.
+
+    :param pattern: The pattern to parse.
+    :raises PatternError: If the pattern isn't valid.
+    """
+    key = (type(pattern), pattern)
+    regex = pattern_cache.get(key)
+    if regex is None:
+        regex = pattern_cache.setdefault(key, _Parser(pattern).parse())
+    return regex
+
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v"}
+
+_CLASSES = {
+    "d": "0123456789",
+    "w": "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_",
+    "s": " \t\n\r\f\v"
+}
+
+_NEGATED_CLASSES = {"D": "d", "W": "w", "S": "s"}
+
+# Ranges in a class with more characters than this become a
+# symbol_range, instead of a union with an option for each one.
+_WIDE_RANGE = 64
+
+
+class _Parser(object):
+    # A recursive descent parser, with one method per level of precedence.
+    def __init__(self, pattern):
+        self.binary = isinstance(pattern, Bytestring)
+        # Bytes are parsed as the characters with the same numbers, and
+        # turned back into bytes when they become symbols.
+        self.pattern = pattern.decode("latin-1") if self.binary else pattern
+        self.pos = 0
+
+    def error(self, message, pos=None):
+        return PatternError(message, self.pos if pos is None else pos)
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def take(self):
+        char = self.peek()
+        if char is None:
+            raise self.error("Unexpected end of pattern")
+        self.pos += 1
+        return char
+
+    def symbol(self, char):
+        if self.binary:
+            if ord(char) > 0xff:
+                raise self.error("%r isn't a byte" % char)
+            return regexify(char.encode("latin-1"))
+        return SymbolRegex(char)
+
+    def parse(self):
+        regex = self.alternation()
+        if self.pos < len(self.pattern):
+            # The only way to stop early is an unmatched parenthesis.
+            raise self.error("Unbalanced parenthesis")
+        return regex
+
+    def alternation(self):
+        options = [self.sequence()]
+        while self.peek() == "|":
+            self.pos += 1
+            options.append(self.sequence())
+        return union(*options)
+
+    def sequence(self):
+        items = []
+        while self.peek() not in (None, "|", ")"):
+            items.append(self.repetition())
+        return join(items)
+
+    def repetition(self):
+        regex = self.atom()
+        while True:
+            char = self.peek()
+            if char == "*":
+                regex = star(regex)
+            elif char == "+":
+                regex = regex.plus()
+            elif char == "?":
+                regex = regex.maybe()
+            elif char == "{":
+                bounds = self.bounds()
+                if bounds is None:
+                    return regex
+                regex = self.repeat(regex, *bounds)
+                continue
+            else:
+                return regex
+            self.pos += 1
+
+    def bounds(self):
+        # Parses {m}, {m,}, or {m,n} at the current position, and moves
+        # past it. If it isn't one of those, the { is just a symbol.
+        end = self.pattern.find("}", self.pos)
+        if end < 0:
+            return None
+        low, comma, high = self.pattern[self.pos + 1:end].partition(",")
+        if not low.isdigit() or not (high.isdigit() or not high):
+            return None
+        start, self.pos = self.pos, end + 1
+        low = int(low)
+        high = int(high) if high else (None if comma else low)
+        if high is not None and high < low:
+            raise self.error("Repetition bounds are out of order", start)
+        return low, high
+
+    def repeat(self, regex, low, high):
+        if high is None:
+            return concat(repeat(regex, low), star(regex))
+        return concat(repeat(regex, low), repeat(regex.maybe(), high - low))
+
+    def atom(self):
+        start = self.pos
+        char = self.take()
+        if char == "(":
+            if self.pattern.startswith("?:", self.pos):
+                self.pos += 2
+            elif self.peek() == "?":
+                raise self.error("Unsupported group type")
+            regex = self.alternation()
+            if self.peek() != ")":
+                raise self.error("Unbalanced parenthesis", start)
+            self.pos += 1
+            return regex
+        elif char == "[":
+            negated = self.peek() == "^"
+            if negated:
+                self.pos += 1
+            regex = self.ranges(self.char_class(start))
+            return intersect(Any, ~regex) if negated else regex
+        elif char == ".":
+            return Any
+        elif char == "\\":
+            if self.peek() in _NEGATED_CLASSES:
+                # \D, \W, and \S match any one symbol *not* in the class.
+                chars = _CLASSES[_NEGATED_CLASSES[self.take()]]
+                return intersect(Any, ~union(*(self.symbol(c) for c in chars)))
+            return union(*(self.symbol(c) for c in self.escape()))
+        elif char in "*+?":
+            raise self.error("Nothing to repeat", start)
+        elif char in "^$":
+            raise self.error("Anchors aren't supported", start)
+        return self.symbol(char)
+
+    def escape(self):
+        # Returns the characters an escape sequence (after the backslash)
+        # stands for.
+        start = self.pos - 1
+        char = self.take()
+        if char in _CLASSES:
+            return _CLASSES[char]
+        elif char in _ESCAPES:
+            return _ESCAPES[char]
+        elif char in "xu":
+            digits = self.pattern[self.pos:self.pos + (2 if char == "x"
+                                                         else 4)]
+            try:
+                code = int(digits, 16)
+            except ValueError:
+                code = None
+            if code is None or len(digits) < (2 if char == "x" else 4):
+                raise self.error("Bad escape \\%s" % char, start)
+            self.pos += len(digits)
+            return "%c" % code
+        elif char.isalnum():
+            raise self.error("Unsupported escape \\%s" % char, start)
+        return char
+
+    def char_class(self, start):
+        # Returns the ranges of character codes in a class, after the [
+        # (and ^), as (low, high) pairs.
+        ranges = []
+        first = True
+        while True:
+            char = self.peek()
+            if char is None:
+                raise self.error("Unterminated character class", start)
+            if char == "]" and not first:
+                self.pos += 1
+                return ranges
+            first = False
+            self.pos += 1
+            if char == "\\":
+                low = self.escape()
+                if len(low) > 1:
+                    ranges.extend((ord(c), ord(c)) for c in low)
+                    continue
+            else:
+                low = char
+            if (self.peek() == "-" and
+                    self.pattern[self.pos + 1:self.pos + 2] not in ("]", "")):
+                self.pos += 1
+                high = self.take()
+                if high == "\\":
+                    high = self.escape()
+                    if len(high) > 1:
+                        raise self.error("Bad range", start)
+                if high < low:
+                    raise self.error("Range is out of order", start)
+                ranges.append((ord(low), ord(high)))
+            else:
+                ranges.append((ord(low), ord(low)))
+
+    def ranges(self, ranges):
+        # Merges overlapping and adjacent ranges. Narrow ones become a
+        # union of their symbols, but wide ones become a single
+        # symbol_range, so they don't need an option for every character.
+        merged = []
+        for low, high in sorted(ranges):
+            if merged and low <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], high)
+            else:
+                merged.append([low, high])
+        options = []
+        for low, high in merged:
+            if self.binary or high - low < _WIDE_RANGE:
+                options.extend(self.symbol("%c" % c)
+                               for c in range(low, high + 1))
+            else:
+                options.append(symbol_range("%c" % low, "%c" % high))
+        return union(*options)
+
+
+### UTF-8 support ###
+
+_utf8_any = None
+
+
+def _byte_range(low, high):
+    return union(*(SymbolRegex(sym) for sym in
+                   Bytestring(bytearray(range(low, high + 1)))))
+
+
+def _utf8_range(low, high):
+    # Splits the range up by how long each codepoint's encoding is, and
+    # leaves out the surrogates, which UTF-8 can't encode.
+    options = []
+    for first, last in ((0, 0x7F), (0x80, 0x7FF), (0x800, 0xD7FF),
+                        (0xE000, 0xFFFF), (0x10000, 0x10FFFF)):
+        first, last = max(first, low), min(last, high)
+        if first <= last:
+            options.append(_utf8_sequences(
+                bytearray(("%c" % first).encode("utf-8")),
+                bytearray(("%c" % last).encode("utf-8"))))
+    return union(*options)
+
+
+def _utf8_sequences(low, high):
+    # Matches the byte sequences from low to high, which are the same
+    # length. Each byte after the first is from 0x80 to 0xBF, so if the
+    # first bytes differ, the range splits into the sequences that start
+    # with low's first byte, the ones that start with high's, and the
+    # ones in between, where anything can come after the first byte.
+    if len(low) == 1:
+        return _byte_range(low[0], high[0])
+    elif low[0] == high[0]:
+        return (_byte_range(low[0], low[0]) +
+                _utf8_sequences(low[1:], high[1:]))
+    rest = len(low) - 1
+    bottom, top = bytearray([0x80] * rest), bytearray([0xBF] * rest)
+    return union(
+        _byte_range(low[0], low[0]) + _utf8_sequences(low[1:], top),
+        _byte_range(low[0] + 1, high[0] - 1) +
+        repeat(_byte_range(0x80, 0xBF), rest),
+        _byte_range(high[0], high[0]) + _utf8_sequences(bottom, high[1:])
+    )
+
+
+def _build_utf8_any():
+    # These are the well-formed byte sequences from table 3-7 of the
+    # Unicode standard, which exclude overlong encodings and surrogates.
+    tail = _byte_range(0x80, 0xBF)
+    return union(
+        _byte_range(0x00, 0x7F),
+        _byte_range(0xC2, 0xDF) + tail,
+        _byte_range(0xE0, 0xE0) + _byte_range(0xA0, 0xBF) + tail,
+        _byte_range(0xE1, 0xEC) + tail + tail,
+        _byte_range(0xED, 0xED) + _byte_range(0x80, 0x9F) + tail,
+        _byte_range(0xEE, 0xEF) + tail + tail,
+        _byte_range(0xF0, 0xF0) + _byte_range(0x90, 0xBF) + tail + tail,
+        _byte_range(0xF1, 0xF3) + tail + tail + tail,
+        _byte_range(0xF4, 0xF4) + _byte_range(0x80, 0x8F) + tail + tail
+    )
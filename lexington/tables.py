@@ -0,0 +1,467 @@
+"""
+lexington.tables
+================
+An `~lexington.automaton.Automaton` discovers its states lazily and keeps
+its transitions in dictionaries, which is flexible but can't be shared
+between processes. A `Table` is the finished product: every state of an
+automaton over bytes, explored ahead of time, with its transitions laid out
+as one flat array of 256 entries per state.
+
+Because a table is just a block of integers, it can live in
+`multiprocessing.shared_memory` or a memory-mapped file, and any number of
+processes can attach to that one copy read-only instead of each building
+their own automaton.
+
+Automata over text can't have a dense table, since there are over a million
+code points. A `RangeTable` stores their transitions as sorted ranges of
+code points instead, the way the automaton does, with a dense table for
+ASCII in front.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from .automaton import RegexSet, DEAD
+from .regex import symbols
+from .strings import Text, Bytestring, PYTHON_3000, n
+
+# The header is the magic number, the number of states, and the start state.
+# Everything after it is native-endian 32-bit integers, since tables are
+# only meant to be shared between processes on the same machine.
+_MAGIC = b"LXT\x01"
+_HEADER = struct.Struct(str("=4sii"))
+_SYMBOLS = list(Bytestring(bytearray(range(256))))
+_unichr = chr if PYTHON_3000 else unichr
+
+
+class Table(object):
+    """
+    A complete transition table for an automaton over bytes. You usually
+    get one from `build`, `attach`, or `open`, rather than creating one
+    directly.
+
+    :param transitions: A sequence of state numbers, 256 for each state.
+                        The entry for reading byte `b` in state `s` is at
+                        ``s * 256 + b``.
+    :param accepting: A sequence with one integer per state: the value the
+                      automaton accepts with (the rule index, for a
+                      `~lexington.automaton.RuleAutomaton`), or -1 if the
+                      state doesn't accept.
+    :param start: The start state number.
+    """
+    def __init__(self, transitions, accepting, start):
+        #: The flat transition table.
+        self.transitions = transitions
+        #: The accept value of each state, or -1.
+        self.accepting = accepting
+        #: The start state number.
+        self.start = start
+        self._memory = None
+
+    def __len__(self):
+        return len(self.accepting)
+
+    def __repr__(self):
+        return "<Table (%d states)>" % len(self)
+
+    @classmethod
+    def build(cls, automaton):
+        """
+        Explores every state of `automaton` that can be reached by any byte
+        string, and returns a `Table` holding all of them. The automaton
+        keeps the states too, so building a table also warms it.
+
+        :param automaton: An automaton whose alphabet is
+                          `~lexington.strings.Bytestring` (or `None`). It
+                          can't be a `~lexington.automaton.RegexSet`, since
+                          a table only has room for one accept value per
+                          state.
+        """
+        if automaton.alphabet not in (Bytestring, None):
+            raise TypeError(n("Tables can only be built for automata over "
+                              "bytes, not %r" % automaton.alphabet))
+        if isinstance(automaton, RegexSet):
+            raise TypeError(n("Tables can't hold the sets of regexes a "
+                              "RegexSet accepts with"))
+        transitions = array(str('i'))
+        state = 0
+        # States are numbered in the order they're discovered, so walking
+        # them in order until we run out is a breadth-first search.
+        while state < len(automaton):
+            step = automaton.step
+            transitions.extend(step(state, sym) for sym in _SYMBOLS)
+            state += 1
+        accepting = array(str('i'), (_accept_value(v)
+                                     for v in automaton.accepting))
+        return cls(transitions, accepting, automaton.start)
+
+    def run(self, subject, state=None):
+        """
+        Reads every byte in `subject`, and returns the state the table ends
+        up in. It stops early if it reaches `~lexington.automaton.DEAD`.
+
+        :param subject: The bytes to read.
+        :param state: The state number to start from. (Defaults to `start`.)
+        """
+        if state is None:
+            state = self.start
+        if not PYTHON_3000:
+            subject = bytearray(subject)
+        transitions = self.transitions
+        for sym in subject:
+            state = transitions[(state << 8) | sym]
+            if state == DEAD:
+                break
+        return state
+
+    def match(self, subject):
+        """
+        Determines whether `subject` matches the automaton this table was
+        built from.
+
+        :param subject: The bytes to match.
+        """
+        return self.accepting[self.run(subject)] >= 0
+
+    def match_many(self, subjects):
+        """
+        Matches a whole batch of byte strings at once, and returns a NumPy
+        array of booleans saying which ones matched. (This requires NumPy.)
+
+        Instead of running each string through the table in turn, this
+        packs them into one padded 2-D array and advances every string by
+        one column per step, so the Python-level loop runs once per column
+        instead of once per byte. It's meant for large batches of short
+        strings, like validating millions of IDs against one pattern.
+
+        :param subjects: A sequence of byte strings.
+        """
+        import numpy
+        subjects = list(subjects)
+        lengths = numpy.fromiter((len(s) for s in subjects),
+                                 dtype=numpy.intp, count=len(subjects))
+        # Sorting by length (longest first) means the strings that still
+        # have input left at any column are always a prefix of the batch.
+        order = numpy.argsort(-lengths, kind='stable')
+        lengths = lengths[order]
+        width = int(lengths[0]) if len(subjects) else 0
+
+        packed = numpy.zeros((len(subjects), width), dtype=numpy.intp)
+        packed[numpy.arange(width) < lengths[:, None]] = numpy.frombuffer(
+            b"".join(subjects[i] for i in order.tolist()), dtype=numpy.uint8)
+        # Counting how many strings are longer than each column.
+        active = numpy.searchsorted(-lengths, -numpy.arange(width),
+                                    side='left')
+
+        transitions = numpy.frombuffer(self.transitions, dtype=numpy.intc)
+        states = numpy.full(len(subjects), self.start, dtype=numpy.intp)
+        for column in range(width):
+            live = active[column]
+            states[:live] = transitions[(states[:live] << 8) |
+                                        packed[:live, column]]
+
+        accepting = numpy.frombuffer(self.accepting, dtype=numpy.intc)
+        result = numpy.empty(len(subjects), dtype=bool)
+        result[order] = accepting[states] >= 0
+        return result
+
+    ### Sharing between processes
+
+    def to_bytes(self):
+        """
+        Returns this table in the binary format `share` and `save` use.
+        """
+        return (_HEADER.pack(_MAGIC, len(self), self.start) +
+                _tobytes(array(str('i'), self.transitions)) +
+                _tobytes(array(str('i'), self.accepting)))
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Creates a table that reads directly out of `buffer`, which must
+        contain data in the format written by `to_bytes`. Nothing is copied,
+        so the table is read-only if the buffer is. (Python 2's memoryviews
+        can't be read as integers, though, so there, the table is copied
+        into an array.)
+
+        :param buffer: An object supporting the buffer protocol.
+        """
+        try:
+            view = memoryview(buffer)
+        except TypeError:
+            # Python 2's mmap only has the old buffer interface.
+            view = memoryview(bytearray(buffer))
+        magic, count, start = _HEADER.unpack(view[:_HEADER.size].tobytes())
+        if magic != _MAGIC:
+            raise ValueError(n("Not a Lexington transition table"))
+        if hasattr(view, 'cast'):
+            ints = view[_HEADER.size:].cast(str('i'))
+        else:
+            ints = array(str('i'))
+            ints.fromstring(view[_HEADER.size:].tobytes())
+        return cls(ints[:count * 256], ints[count * 256:count * 257], start)
+
+    def share(self, name=None):
+        """
+        Copies this table into a new `multiprocessing.shared_memory` block,
+        and returns a `Table` backed by it. Other processes can use
+        `attach` with that table's `name`. The block stays around until the
+        returned table's `unlink` method is called.
+
+        :param name: The name to give the block. (By default, one is
+                     generated.)
+        """
+        from multiprocessing.shared_memory import SharedMemory
+        data = self.to_bytes()
+        memory = SharedMemory(name, create=True, size=len(data))
+        memory.buf[:len(data)] = data
+        table = self.from_buffer(memory.buf[:len(data)])
+        table._memory = memory
+        return table
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attaches, read-only, to a table another process placed in shared
+        memory with `share`.
+
+        :param name: The name of the shared memory block.
+        """
+        from multiprocessing.shared_memory import SharedMemory
+        try:
+            memory = SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13, SharedMemory always registers the block
+            # with the resource tracker, which would destroy it when this
+            # process exits -- and unregistering could undo the creator's
+            # registration, if we share its tracker. So on POSIX, the block
+            # is opened directly, and the tracker never hears about it.
+            # (Windows has no tracker for shared memory.)
+            try:
+                memory = _AttachedMemory(name)
+            except ImportError:
+                memory = SharedMemory(name)
+        table = cls.from_buffer(memory.buf.toreadonly())
+        table._memory = memory
+        return table
+
+    @property
+    def name(self):
+        """
+        The name of the shared memory block backing this table, or `None`.
+        """
+        return getattr(self._memory, 'name', None)
+
+    def save(self, path):
+        """
+        Writes this table to a file, which can be mapped with `open`.
+
+        :param path: The file's path.
+        """
+        with open(path, 'wb') as fd:
+            fd.write(self.to_bytes())
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-maps a table file written by `save`, read-only. Every process
+        that opens the same file shares the operating system's one copy.
+
+        :param path: The file's path.
+        """
+        with open(path, 'rb') as fd:
+            memory = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        table = cls.from_buffer(memory)
+        table._memory = memory
+        return table
+
+    def close(self):
+        """
+        Releases the shared memory or mapped file backing this table. The
+        table can't be used afterwards.
+        """
+        memory, self._memory = self._memory, None
+        if memory is not None:
+            # The views into the buffer have to go before it can close.
+            self.transitions = self.accepting = None
+            memory.close()
+
+    def unlink(self):
+        """
+        Closes this table, and destroys the shared memory block backing it
+        (once every process has closed it).
+        """
+        memory = self._memory
+        self.close()
+        if memory is not None:
+            memory.unlink()
+
+
+class _AttachedMemory(object):
+    # A read-only view of a POSIX shared memory block, with the parts of
+    # SharedMemory's interface that Table uses.
+    __slots__ = ('name', 'buf', '_mmap')
+
+    def __init__(self, name):
+        import _posixshmem
+        path = name if name.startswith("/") else "/" + name
+        fd = _posixshmem.shm_open(path, os.O_RDONLY, mode=0o600)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size,
+                                   access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.name = name
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+
+def _accept_value(value):
+    if value is None or value is False:
+        return -1
+    elif value is True:
+        return 0
+    return value
+
+
+def _tobytes(a):
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+
+class RangeTable(object):
+    """
+    A complete transition table for an automaton over text. Every code point
+    below 128 has an entry in a dense table, like a `Table`'s. Above that,
+    each state has a sorted list of where ranges of code points start, and
+    the state each range leads to, so a state only takes as much room as
+    it has distinct ranges -- a state that treats all of CJK the same way
+    needs only one. You usually get one from `build`.
+
+    :param ascii: A sequence of state numbers, 128 for each state. The entry
+                  for reading code point `c` in state `s` is at
+                  ``s * 128 + c``.
+    :param starts: A list with one sorted sequence for each state, of the
+                   code points where its ranges start. Each one begins
+                   with 128.
+    :param targets: A list with one sequence for each state, of the state
+                    each of its ranges leads to.
+    :param accepting: The automaton's `accepting` values for each state.
+    :param start: The start state number.
+    """
+    def __init__(self, ascii, starts, targets, accepting, start):
+        #: The dense table for ASCII.
+        self.ascii = ascii
+        #: The code points where each state's ranges start.
+        self.starts = starts
+        #: The states each state's ranges lead to.
+        self.targets = targets
+        #: The accept value of each state, as the automaton had it.
+        self.accepting = accepting
+        #: The start state number.
+        self.start = start
+
+    def __len__(self):
+        return len(self.accepting)
+
+    def __repr__(self):
+        return "<RangeTable (%d states, %d ranges)>" % (
+            len(self), sum(len(s) for s in self.starts))
+
+    @classmethod
+    def build(cls, automaton):
+        """
+        Explores every state of `automaton` that can be reached by any
+        string, and returns a `RangeTable` holding all of them.
+
+        Any two symbols that aren't mentioned in the automaton's regexes
+        lead to the same place, unless a mentioned one comes between them,
+        so each state only has to be stepped by the ASCII symbols that are
+        mentioned, and once by the symbol after each of them. Above ASCII,
+        the automaton's own ranges are used.
+
+        :param automaton: A deterministic automaton whose alphabet is
+                          `~lexington.strings.Text` (or `None`).
+        """
+        if automaton.alphabet not in (Text, None):
+            raise TypeError(n("Range tables can only be built for automata "
+                              "over text, not %r" % automaton.alphabet))
+        key = automaton.states[automaton.start]
+        mentioned = set()
+        for regex in (key if isinstance(key, tuple) else (key,)):
+            mentioned.update(symbols(regex))
+        # Every code from one of these up to the next one leads to the same
+        # place as the code itself.
+        codes = set([0])
+        for sym in mentioned:
+            codes.update((ord(sym), ord(sym) + 1))
+        codes = sorted(code for code in codes if code < 128)
+        syms = [_unichr(code) for code in codes]
+
+        ascii = array(str('i'))
+        starts, targets = [], []
+        state = 0
+        while state < len(automaton):
+            step = automaton.step
+            found = [step(state, sym) for sym in syms]
+            ascii.extend(found[bisect_right(codes, c) - 1]
+                         for c in range(128))
+            state_starts, state_targets = (automaton._ranges[state] or
+                                           automaton._ranges_for(state))
+            starts.append(state_starts)
+            targets.append(state_targets)
+            state += 1
+        return cls(ascii, starts, targets, list(automaton.accepting),
+                   automaton.start)
+
+    def step(self, state, sym):
+        """
+        Returns the state reached from `state` after reading `sym`.
+
+        :param state: The state number to start from.
+        :param sym: The symbol to read.
+        """
+        code = ord(sym)
+        if code < 128:
+            return self.ascii[(state << 7) | code]
+        return self.targets[state][bisect_right(self.starts[state], code) - 1]
+
+    def run(self, subject, state=None):
+        """
+        Reads every character in `subject`, and returns the state the table
+        ends up in. It stops early if it reaches
+        `~lexington.automaton.DEAD`.
+
+        :param subject: The text to read.
+        :param state: The state number to start from. (Defaults to `start`.)
+        """
+        if state is None:
+            state = self.start
+        ascii, starts, targets = self.ascii, self.starts, self.targets
+        for sym in subject:
+            code = ord(sym)
+            if code < 128:
+                state = ascii[(state << 7) | code]
+            else:
+                state = targets[state][bisect_right(starts[state], code) - 1]
+            if state == DEAD:
+                break
+        return state
+
+    def match(self, subject):
+        """
+        Determines whether `subject` matches the automaton this table was
+        built from. (For automata with several regexes, like
+        `~lexington.automaton.RuleAutomaton`, this returns the same value
+        as the automaton's `accepting` entry.)
+
+        :param subject: The text to match.
+        """
+        return self.accepting[self.run(subject)]
@@ -10,6 +10,7 @@ checks the tests' internals, the other only uses the documented API.
 :license:   Released under the MIT/X11 license, see LICENSE for details
 """
 from __future__ import unicode_literals
+import sys
 import unittest
 
 class LexingtonTestCase(unittest.TestCase):
@@ -68,12 +69,23 @@ def make_suite(*cases):
 
 
 def suite():
-    from . import strings, regex, regex_impl
+    from . import (strings, cache, regex, regex_impl, automaton, nfa,
+                   glushkov, engines, tables, lexer)
 
     test_suite = unittest.TestSuite()
 
     test_suite.addTest(strings.suite())
+    test_suite.addTest(cache.suite())
     test_suite.addTest(regex.suite())
     #test_suite.addTest(regex_impl.suite())
+    test_suite.addTest(automaton.suite())
+    test_suite.addTest(nfa.suite())
+    test_suite.addTest(glushkov.suite())
+    test_suite.addTest(engines.suite())
+    test_suite.addTest(tables.suite())
+    test_suite.addTest(lexer.suite())
+    if sys.version_info >= (3, 6):
+        from . import aio
+        test_suite.addTest(aio.suite())
 
     return test_suite
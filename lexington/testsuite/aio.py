@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.aio
+=======================
+This file contains API-level tests for the asyncio adapters.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import asyncio
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.aio import LexerProtocol, lex_stream
+from lexington.lexer import Lexer, LexError
+from lexington.regex import Regex, union
+
+
+def make_lexer():
+    return Lexer([("word", union(*b"abc").plus()), ("space", Regex(b" "))])
+
+
+def make_text_lexer():
+    return Lexer([("word", union(*"ab\xe9\u2603").plus()),
+                  ("space", Regex(" "))])
+
+
+def run_async(coroutine):
+    # Like asyncio.run, which is new in Python 3.7.
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(tokens):
+    return [token async for token in tokens]
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.calls = []
+
+    def pause_reading(self):
+        self.calls.append("pause")
+
+    def resume_reading(self):
+        self.calls.append("resume")
+
+    def close(self):
+        self.calls.append("close")
+
+
+class StreamReaderTests(LexingtonTestCase):
+    """
+    These tests check lexing from a `asyncio.StreamReader`.
+    """
+    def test_lex_stream(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"ab c")
+            reader.feed_data(b"ba a")
+            reader.feed_eof()
+            return await collect(lex_stream(make_lexer(), reader,
+                                            chunk_size=3))
+
+        tokens = run_async(run())
+        self.assert_equal([t.text for t in tokens],
+                          [b"ab", b" ", b"cba", b" ", b"a"])
+
+    def test_error(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"ab ?")
+            reader.feed_eof()
+            return await collect(lex_stream(make_lexer(), reader))
+
+        self.assert_raises(LexError, run_async, run())
+
+    def test_tokens_before_error(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"ab ?")
+            reader.feed_eof()
+            found = []
+            try:
+                async for token in lex_stream(make_lexer(), reader):
+                    found.append(token.text)
+            except LexError:
+                return found
+
+        self.assert_equal(run_async(run()), [b"ab", b" "])
+
+    def test_encoding(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            data = "a\xe9 \u2603b".encode("utf-8")
+            # Every piece but the first splits a character.
+            for i in range(0, len(data), 2):
+                reader.feed_data(data[i:i + 2])
+            reader.feed_eof()
+            return await collect(lex_stream(make_text_lexer(), reader,
+                                            chunk_size=2, encoding="utf-8"))
+
+        tokens = run_async(run())
+        self.assert_equal([t.text for t in tokens],
+                          ["a\xe9", " ", "\u2603b"])
+
+    def test_backpressure(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"a " * 100)
+            reader.feed_eof()
+            tokens = lex_stream(make_lexer(), reader, maxsize=4,
+                                chunk_size=2)
+            first = await tokens.__anext__()
+            # With the consumer stalled, the reader stops being drained.
+            for i in range(10):
+                await asyncio.sleep(0)
+            unread = len(reader._buffer)
+            rest = await collect(tokens)
+            return first, unread, rest
+
+        first, unread, rest = run_async(run())
+        self.assert_true(unread > 150)
+        self.assert_equal(len(rest), 199)
+
+
+class ProtocolTests(LexingtonTestCase):
+    """
+    These tests check `LexerProtocol`.
+    """
+    def test_tokens(self):
+        async def run():
+            protocol = LexerProtocol(make_lexer())
+            protocol.connection_made(FakeTransport())
+            protocol.data_received(b"ab ")
+            protocol.data_received(b"c")
+            protocol.eof_received()
+            return await collect(protocol)
+
+        tokens = run_async(run())
+        self.assert_equal([t.text for t in tokens], [b"ab", b" ", b"c"])
+
+    def test_encoding(self):
+        async def run():
+            protocol = LexerProtocol(make_text_lexer(), encoding="utf-8")
+            protocol.connection_made(FakeTransport())
+            data = "\u2603 a\xe9".encode("utf-8")
+            protocol.data_received(data[:2])
+            protocol.data_received(data[2:])
+            protocol.eof_received()
+            return await collect(protocol)
+
+        tokens = run_async(run())
+        self.assert_equal([t.text for t in tokens], ["\u2603", " ", "a\xe9"])
+
+    def test_pause_and_resume(self):
+        async def run():
+            transport = FakeTransport()
+            protocol = LexerProtocol(make_lexer(), maxsize=4)
+            protocol.connection_made(transport)
+            protocol.data_received(b"a b c a b ")
+            paused = list(transport.calls)
+            tokens = protocol.__aiter__()
+            # Nine tokens are queued; it resumes once only two are left.
+            for i in range(6):
+                await tokens.__anext__()
+            before = list(transport.calls)
+            await tokens.__anext__()
+            return paused, before, transport.calls
+
+        paused, before, calls = run_async(run())
+        self.assert_equal(paused, ["pause"])
+        self.assert_equal(before, ["pause"])
+        self.assert_equal(calls, ["pause", "resume"])
+
+    def test_error(self):
+        async def run():
+            transport = FakeTransport()
+            protocol = LexerProtocol(make_lexer())
+            protocol.connection_made(transport)
+            protocol.data_received(b"ab ?")
+            try:
+                await collect(protocol)
+            finally:
+                self.assert_equal(transport.calls, ["close"])
+
+        self.assert_raises(LexError, run_async, run())
+
+
+suite = make_suite(
+    StreamReaderTests,
+    ProtocolTests
+)
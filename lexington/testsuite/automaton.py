@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.automaton
+=============================
+This file contains API-level tests for the automaton module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import pickle
+import random
+import sys
+import threading
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.automaton import (Automaton, RuleAutomaton, RegexSet, Matcher,
+                                 Limits, LimitExceeded, DEAD)
+from lexington.regex import (Regex, StarRegex, Null, Epsilon, Any, union,
+                             repeat, symbol_range)
+
+
+def msv():
+    msv = Regex("spam") | Regex("eggs")
+    return msv + (" " + msv).star()
+
+
+class CollidingStar(StarRegex):
+    # Regexes only compare their hashes, so all of these are "equal".
+    __slots__ = ()
+
+    def __hash__(self):
+        return 0
+
+
+class MatchingTests(LexingtonTestCase):
+    """
+    These tests check that automata match the same strings as their regexes.
+    """
+    def test_simple(self):
+        a = Automaton("abc")
+        self.assert_true(a.match("abc"))
+        self.assert_false(a.match("ab"))
+        self.assert_false(a.match("abcd"))
+
+    def test_complex(self):
+        a = Automaton(msv())
+        self.assert_true(a.match("spam"))
+        self.assert_true(a.match("spam spam spam spam"))
+        self.assert_true(a.match("eggs spam eggs"))
+        self.assert_false(a.match("eggs spam "))
+        self.assert_false(a.match(" "))
+        self.assert_false(a.match("spam spam ham eggs"))
+
+    def test_null_and_epsilon(self):
+        self.assert_equal(Automaton(Null).start, DEAD)
+        self.assert_false(Automaton(Null).match(""))
+        self.assert_true(Automaton(Epsilon).match(""))
+        self.assert_false(Automaton(Epsilon).match("a"))
+
+    def test_bytes(self):
+        a = Automaton(Regex(b"GET") | Regex(b"PUT"))
+        self.assert_true(a.match(b"GET"))
+        self.assert_false(a.match(b"POST"))
+
+    def test_text_ranges(self):
+        cjk = symbol_range("\u4e00", "\u9fff")
+        regex = (cjk | "\u00e9").plus() + (Regex(" ") | "\u4e08")
+        a = Automaton(regex)
+        rand = random.Random(41)
+        for i in range(200):
+            subject = "".join(rand.choice(["\u4e00", "\u4e08", "\u9fff",
+                                           "\ua000", "\u00e9", " ", "a",
+                                           "%c" % rand.randint(0x4e00,
+                                                               0x9fff)])
+                              for j in range(rand.randint(0, 5)))
+            self.assert_equal(a.match(subject), regex.match(subject))
+        # Only ASCII transitions are stored one symbol at a time.
+        self.assert_true(all(sym < "\x80" for edges in a.transitions
+                             for sym in edges))
+        self.assert_true(all(len(r[0]) <= 7 for r in a._ranges if r))
+
+    def test_states_are_reused(self):
+        a = Automaton(msv())
+        a.match("spam spam")
+        n = len(a)
+        a.match("spam spam spam spam")
+        self.assert_equal(len(a), n)
+
+    def test_pickle(self):
+        a = Automaton(msv())
+        a.match("spam eggs")
+        b = pickle.loads(pickle.dumps(a))
+        self.assert_equal(len(b), len(a))
+        self.assert_true(b.match("eggs eggs"))
+
+
+class RuleAutomatonTests(LexingtonTestCase):
+    """
+    These tests check running several regexes side by side.
+    """
+    def test_first_rule_wins(self):
+        a = RuleAutomaton(["if", Regex("i") + Regex("f").star()])
+        self.assert_equal(a.accepting[a.run("if")], 0)
+        self.assert_equal(a.accepting[a.run("iff")], 1)
+        self.assert_is(a.accepting[a.run("x")], None)
+        self.assert_equal(a.run("x"), DEAD)
+
+
+class RegexSetTests(LexingtonTestCase):
+    """
+    These tests check matching against many regexes at once.
+    """
+    def test_all_matches(self):
+        digits = union(*"0123456789").plus()
+        patterns = RegexSet([digits, "42", Regex("4") + Any.star(),
+                             "x"])
+        self.assert_equal(patterns.match("42"), frozenset([0, 1, 2]))
+        self.assert_equal(patterns.match("4z"), frozenset([2]))
+        self.assert_equal(patterns.match("7"), frozenset([0]))
+        self.assert_equal(patterns.match("y"), frozenset())
+        self.assert_equal(patterns.accepting[DEAD], frozenset())
+
+    def test_same_as_match(self):
+        rand = random.Random(38)
+        regexes = [msv(), Regex("spam").star(), Regex("eggs") + " spam",
+                   union("spam", "ham") + Regex(" ").star()]
+        patterns = RegexSet(regexes)
+        for i in range(200):
+            subject = "".join(rand.choice(["spam", "eggs", " ", "ham"])
+                              for j in range(rand.randint(0, 4)))
+            self.assert_equal(patterns.match(subject),
+                              frozenset(k for k, r in enumerate(regexes)
+                                        if r.match(subject)))
+
+    def test_matcher(self):
+        m = RegexSet(["ab", "abc"]).matcher()
+        m.feed("ab")
+        self.assert_equal(m.accepts, frozenset([0]))
+        m.feed("c")
+        self.assert_equal(m.accepts, frozenset([1]))
+
+
+class UpdateTests(LexingtonTestCase):
+    """
+    These tests check updating an automaton's regexes.
+    """
+    def make_subjects(self):
+        rand = random.Random(50)
+        return ["".join(rand.choice(["spam", "eggs", " ", "ham"])
+                        for j in range(rand.randint(0, 4)))
+                for i in range(200)]
+
+    def test_remove(self):
+        regexes = [msv(), Regex("spam").star(), Regex("eggs") + " spam",
+                   union("spam", "ham") + Regex(" ").star()]
+        patterns = RegexSet(regexes)
+        subjects = self.make_subjects()
+        for subject in subjects:
+            patterns.match(subject)
+        kept = [regexes[3], regexes[0]]
+        updated = patterns.updated(kept)
+        self.assert_true(len(updated) > 2)
+        size = len(updated)
+        for subject in subjects:
+            self.assert_equal(updated.match(subject),
+                              frozenset(k for k, r in enumerate(kept)
+                                        if r.match(subject)))
+        self.assert_equal(len(updated), size)
+
+    def test_add(self):
+        regexes = [msv(), Regex("spam").star()]
+        rules = RuleAutomaton(regexes)
+        subjects = self.make_subjects()
+        for subject in subjects:
+            rules.run(subject)
+        added = regexes + [Regex("eggs") + " spam"]
+        updated = rules.updated(added)
+        self.assert_equal(len(updated), 2)
+        fresh = RuleAutomaton(added)
+        for subject in subjects:
+            self.assert_equal(updated.accepting[updated.run(subject)],
+                              fresh.accepting[fresh.run(subject)])
+        self.assert_equal(len(rules), len(rules.updated(regexes)))
+
+    def test_text_ranges(self):
+        regexes = [symbol_range("\u4e00", "\u9fff").plus(),
+                   Regex("\u00e9") + Any]
+        rules = RuleAutomaton(regexes)
+        subjects = ["\u4e00\u4e01", "\u00e9\u4e00", "\u00e9\u00e9",
+                    "\ua000", "\u9fff\u00e9"]
+        for subject in subjects:
+            rules.run(subject)
+        for kept in ([regexes[1]], regexes + ["\u4e01"]):
+            updated = rules.updated(kept)
+            fresh = RuleAutomaton(kept)
+            for subject in subjects:
+                self.assert_equal(updated.accepting[updated.run(subject)],
+                                  fresh.accepting[fresh.run(subject)])
+
+    def test_hash_collision(self):
+        first = CollidingStar(Regex("a"))
+        second = CollidingStar(Regex("b"))
+        self.assert_equal(first, second)
+        rules = RuleAutomaton([first])
+        rules.run("aaa")
+        updated = rules.updated([second, Regex("c")])
+        self.assert_equal(updated.accepting[updated.run("bb")], 0)
+        self.assert_equal(updated.accepting[updated.run("aa")], None)
+
+
+class MatcherTests(LexingtonTestCase):
+    """
+    These tests check incremental matching.
+    """
+    def test_feed(self):
+        m = Automaton(msv()).matcher()
+        self.assert_instance(m, Matcher)
+        self.assert_true(m.feed("sp"))
+        self.assert_false(m.accepts)
+        self.assert_true(m.feed("am egg"))
+        self.assert_false(m.accepts)
+        self.assert_true(m.feed("s"))
+        self.assert_true(m.accepts)
+        self.assert_false(m.feed(" ham"))
+        self.assert_false(m.accepts)
+
+    def test_reset(self):
+        m = Automaton("abc").matcher()
+        m.feed("x")
+        m.reset()
+        m.feed("abc")
+        self.assert_true(m.accepts)
+
+
+class LimitsTests(LexingtonTestCase):
+    """
+    These tests check that automata stop growing at their limits.
+    """
+    def explosive(self):
+        ab = union("a", "b")
+        return ab.star() + "a" + repeat(ab, 12)
+
+    def noise(self):
+        rand = random.Random(44)
+        return "".join(rand.choice("ab") for i in range(2000))
+
+    def test_states(self):
+        automaton = Automaton(self.explosive(), Limits(states=100))
+        self.assert_true(automaton.match("a" * 13))
+        self.assert_false(automaton.match("b" * 13))
+        try:
+            automaton.match(self.noise())
+        except LimitExceeded as e:
+            self.assert_equal(e.limit, "states")
+            self.assert_equal(e.value, 100)
+        else:
+            self.fail("the automaton should have exceeded its limit")
+        self.assert_equal(len(automaton), 100)
+        # Input that only needs states it already has still works.
+        self.assert_true(automaton.match("a" * 13))
+        self.assert_false(automaton.match("b" * 13))
+
+    def test_memory(self):
+        automaton = RuleAutomaton([self.explosive()], Limits(memory=50000))
+        self.assert_raises(LimitExceeded, automaton.match,
+                           self.noise())
+        self.assert_true(len(automaton) < 100)
+
+    def test_within_limits(self):
+        automaton = Automaton(msv(), Limits(states=100, seconds=60,
+                                            memory=1 << 20))
+        self.assert_true(automaton.match("spam eggs spam"))
+        self.assert_false(automaton.match("spam spam "))
+
+    def test_pickle(self):
+        automaton = Automaton(msv(), Limits(states=100))
+        automaton.match("spam eggs")
+        copy = pickle.loads(pickle.dumps(automaton))
+        self.assert_equal(copy.limits.states, 100)
+        self.assert_true(copy.match("eggs spam"))
+
+
+class ThreadingTests(LexingtonTestCase):
+    """
+    These tests hammer one shared automaton from many threads.
+    """
+    def setup(self):
+        # Switching threads as often as possible makes races likelier.
+        if hasattr(sys, 'setswitchinterval'):
+            self.interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+
+    def teardown(self):
+        if hasattr(sys, 'setswitchinterval'):
+            sys.setswitchinterval(self.interval)
+
+    def test_concurrent_match_and_feed(self):
+        ab = union("a", "b")
+        regex = ab.star() + "a" + repeat(ab, 6)
+        rand = random.Random(333)
+        subjects = ["".join(rand.choice("abc")
+                            for i in range(rand.randint(0, 30)))
+                    for i in range(200)]
+        expected = [regex.match(s) for s in subjects]
+
+        reference = Automaton(regex)
+        for s in subjects:
+            reference.match(s)
+
+        shared = Automaton(regex)
+        results = {}
+        errors = []
+
+        def work(n):
+            try:
+                order = list(range(len(subjects)))
+                random.Random(n).shuffle(order)
+                matched, fed = [None] * len(subjects), [None] * len(subjects)
+                for i in order:
+                    matched[i] = shared.match(subjects[i])
+                    m = shared.matcher()
+                    for sym in subjects[i]:
+                        m.feed(sym)
+                    fed[i] = m.accepts
+                results[n] = (matched, fed)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assert_equal(errors, [])
+        for matched, fed in results.values():
+            self.assert_equal(matched, expected)
+            self.assert_equal(fed, expected)
+        # Every thread should have warmed one cache, without duplicates.
+        self.assert_equal(len(shared), len(reference))
+        self.assert_equal(len(shared.index), len(shared.states))
+
+
+suite = make_suite(
+    MatchingTests,
+    RuleAutomatonTests,
+    RegexSetTests,
+    UpdateTests,
+    MatcherTests,
+    LimitsTests,
+    ThreadingTests
+)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.cache
+=========================
+This file contains API-level tests for the cache module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.cache import LRUCache
+
+
+class LRUCacheTests(LexingtonTestCase):
+    """
+    These tests check the least-recently-used cache.
+    """
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.setdefault("a", 1)
+        cache.setdefault("b", 2)
+        self.assert_equal(cache.get("a"), 1)
+        cache.setdefault("c", 3)
+        self.assert_equal(len(cache), 2)
+        self.assert_true("a" in cache)
+        self.assert_false("b" in cache)
+        self.assert_is(cache.get("b"), None)
+
+    def test_setdefault_keeps_first(self):
+        cache = LRUCache()
+        first, second = object(), object()
+        self.assert_is(cache.setdefault("k", first), first)
+        self.assert_is(cache.setdefault("k", second), first)
+        cache.clear()
+        self.assert_equal(len(cache), 0)
+
+
+suite = make_suite(
+    LRUCacheTests
+)
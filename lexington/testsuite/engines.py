@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.engines
+===========================
+This file contains API-level tests for the engines module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import random
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.automaton import Automaton
+from lexington.engines import (LiteralSet, choose_engine, compile, literals,
+                               SHORT_INPUT)
+from lexington.glushkov import PositionAutomaton
+from lexington.nfa import NFA
+from lexington.regex import Regex, union, star, repeat, parse
+
+
+def explosive(n):
+    ab = union("a", "b")
+    return star(ab) + "a" + repeat(ab, n)
+
+
+class ChoiceTests(LexingtonTestCase):
+    """
+    These tests check which engine gets picked for which regexes.
+    """
+    def test_short_input(self):
+        choice = choose_engine(explosive(20), 10)
+        self.assert_equal(choice.engine, "derivative")
+        self.assert_equal(choose_engine(explosive(20), 1000).engine,
+                          "position")
+
+    def test_literals(self):
+        self.assert_equal(literals(parse("if|else|while")),
+                          set(["if", "else", "while"]))
+        self.assert_equal(literals(Regex(b"ab")), set([b"ab"]))
+        self.assert_is(literals(parse("a+")), None)
+        self.assert_equal(choose_engine(parse("if|else")).engine, "literal")
+
+    def test_structure(self):
+        self.assert_equal(choose_engine(parse("[a-z]+[0-9]*")).engine, "dfa")
+        self.assert_equal(choose_engine(explosive(3)).engine, "dfa")
+        choice = choose_engine(explosive(20))
+        self.assert_equal(choice.engine, "position")
+        self.assert_equal(choice.positions, 43)
+        self.assert_equal(choose_engine(explosive(200)).engine, "nfa")
+
+    def test_boolean(self):
+        choice = choose_engine(parse("[a-z]+") & ~parse("if|else"))
+        self.assert_equal(choice.engine, "dfa")
+        self.assert_is(choice.positions, None)
+        self.assert_true(compile(parse("[^ab]+")).match("c" * 100))
+
+
+class CompileTests(LexingtonTestCase):
+    """
+    These tests check compiling patterns with an engine.
+    """
+    def test_auto(self):
+        self.assert_instance(compile("if|else"), LiteralSet)
+        self.assert_instance(compile("[a-z]+"), Automaton)
+        self.assert_instance(compile(explosive(20)), PositionAutomaton)
+        self.assert_instance(compile(explosive(300)), NFA)
+
+    def test_shared(self):
+        a = compile("(spam|eggs)( (spam|eggs))*")
+        self.assert_true(a.match("spam eggs"))
+        self.assert_is(compile("(spam|eggs)( (spam|eggs))*"), a)
+        # Different patterns that parse the same share an engine.
+        self.assert_is(compile("[ab]c"), compile("(a|b)c"))
+        self.assert_is(compile(Regex("x").star()), compile("x*"))
+
+    def test_explicit(self):
+        regex = parse("[ab]*c")
+        for engine in ("derivative", "dfa", "position", "nfa"):
+            compiled = compile(regex, engine)
+            self.assert_true(compiled.match("abac"))
+            self.assert_false(compiled.match("abca"))
+        self.assert_raises(ValueError, compile, regex, "literal")
+        self.assert_raises(ValueError, compile, regex, "backtracking")
+
+    def test_engines_agree(self):
+        rand = random.Random(43)
+        regex = explosive(4)
+        subjects = ["".join(rand.choice("ab") for j in range(20))
+                    for i in range(100)]
+        expected = [s[-5] == "a" for s in subjects]
+        for engine in ("derivative", "dfa", "position", "nfa"):
+            compiled = compile(regex, engine)
+            self.assert_equal([compiled.match(s) for s in subjects], expected)
+
+    def test_long_match(self):
+        subject = "ab" * SHORT_INPUT + "a" + "b" * 20
+        self.assert_true(explosive(20).match(subject))
+        self.assert_false(explosive(20).match(subject + "b"))
+
+
+suite = make_suite(
+    ChoiceTests,
+    CompileTests
+)
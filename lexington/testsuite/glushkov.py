@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.glushkov
+============================
+This file contains API-level tests for the glushkov module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import random
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.glushkov import PositionAutomaton, PositionMatcher
+from lexington.regex import Regex, Epsilon, Null, Any, union, star, repeat
+
+
+def msv():
+    msv = Regex("spam") | Regex("eggs")
+    return msv + (" " + msv).star()
+
+
+class MatchingTests(LexingtonTestCase):
+    """
+    These tests check matching with a position automaton.
+    """
+    def test_simple(self):
+        a = PositionAutomaton(msv())
+        self.assert_equal(len(a), 17)
+        self.assert_true(a.match("spam eggs spam"))
+        self.assert_false(a.match("spam eggs "))
+        self.assert_false(a.match("ham"))
+        self.assert_true(PositionAutomaton(Epsilon).match(""))
+        self.assert_false(PositionAutomaton(Epsilon).match("a"))
+        self.assert_false(PositionAutomaton(Null).match(""))
+
+    def test_same_as_regex(self):
+        rand = random.Random(40)
+        regexes = [
+            star(union("ab", "a", "ba")) + Regex("b").maybe(),
+            repeat(union("a", Regex("b").plus()), 3),
+            star(Regex("a") + Any) + "b",
+            union(Regex("ab").star(), Regex("ba").plus()) + Regex("a").star()
+        ]
+        for regex in regexes:
+            a = PositionAutomaton(regex)
+            for i in range(200):
+                subject = "".join(rand.choice("ab")
+                                  for j in range(rand.randint(0, 8)))
+                self.assert_equal(a.match(subject), regex.match(subject))
+
+    def test_many_positions(self):
+        ab = union("a", "b")
+        a = PositionAutomaton(star(ab) + "a" + repeat(ab, 100))
+        self.assert_true(a.match("b" * 50 + "a" + "b" * 100))
+        self.assert_false(a.match("a" * 50 + "b" + "a" * 100))
+
+    def test_deep_concatenation(self):
+        a = PositionAutomaton(Regex("ab" * 2000) + star("c"))
+        self.assert_equal(len(a), 4001)
+        self.assert_true(a.match("ab" * 2000 + "cc"))
+        self.assert_false(a.match("ab" * 1999))
+
+    def test_bytes(self):
+        a = PositionAutomaton(Regex(b"ab") + star(Regex(b"c")))
+        self.assert_true(a.match(b"abccc"))
+        self.assert_false(a.match(b"abd"))
+
+
+class MatcherTests(LexingtonTestCase):
+    """
+    These tests check incremental matching with a position automaton.
+    """
+    def test_feed(self):
+        m = PositionAutomaton(msv()).matcher()
+        self.assert_instance(m, PositionMatcher)
+        self.assert_true(m.feed("sp"))
+        self.assert_false(m.accepts)
+        self.assert_true(m.feed("am egg"))
+        self.assert_true(m.feed("s"))
+        self.assert_true(m.accepts)
+        self.assert_false(m.feed(" ham"))
+        self.assert_false(m.accepts)
+        m.reset()
+        self.assert_true(m.feed("eggs"))
+        self.assert_true(m.accepts)
+
+
+suite = make_suite(
+    MatchingTests,
+    MatcherTests
+)
@@ -0,0 +1,797 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.lexer
+=========================
+This file contains API-level tests for the lexer module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import pickle
+import random
+import unittest
+from . import LexingtonTestCase, make_suite
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 only has concurrent.futures with the futures backport.
+    ThreadPoolExecutor = None
+
+from lexington.lexer import (Lexer, LexError, Token, Source, LineIndex,
+                             TrailingContext)
+from lexington.automaton import Limits, LimitExceeded
+from lexington.regex import Regex, Epsilon, union
+
+
+digit = union(*"0123456789")
+letter = union(*"abcdefghijklmnopqrstuvwxyz")
+
+
+def make_lexer(skip=()):
+    return Lexer([
+        ("if", "if"),
+        ("name", letter.plus()),
+        ("number", digit.plus()),
+        ("space", union(" ", "\n").plus()),
+        ("string", '"' + union(letter, " ", "\n").star() + '"')
+    ], restart="\n", skip=skip)
+
+
+def make_modal_lexer(skip=()):
+    # Strings can have code in braces, which can have strings in it.
+    return Lexer([
+        ("name", letter.plus()),
+        ("space", union(" ", "\n").plus()),
+        ("quote", '"'),
+        ("close", "}"),
+        ("chars", union(letter, " ", "\n").plus()),
+        ("open", "{"),
+        ("endquote", '"')
+    ], restart="\n", skip=skip,
+        modes=[("code", ["name", "space", "quote", "close"]),
+               ("string", ["chars", "open", "endquote"])],
+        push={"quote": "string", "open": "code"}, pop=["close", "endquote"])
+
+
+def make_modal_text(seed, count):
+    rand = random.Random(seed)
+    return "".join(rand.choice(['a "b" ', '"x {y "z\n"}" ', "\n", "cd ",
+                                '"e\n\nf" '])
+                   for i in range(count))
+
+
+def token(kind, text, start):
+    return Token(kind, start, start + len(text), Source(text, start))
+
+
+def make_text(seed, count):
+    rand = random.Random(seed)
+    return "".join(rand.choice(["if", "ifs", "12", " ", "\n", '"a\nb"',
+                                "x\n\n"])
+                   for i in range(count))
+
+
+class LexingTests(LexingtonTestCase):
+    """
+    These tests check splitting whole strings into tokens.
+    """
+    def test_longest_match(self):
+        tokens = make_lexer().lex("iffy 42")
+        self.assert_equal(tokens, [token("name", "iffy", 0),
+                                   token("space", " ", 4),
+                                   token("number", "42", 5)])
+
+    def test_rule_priority(self):
+        tokens = make_lexer().lex("if")
+        self.assert_equal(tokens, [token("if", "if", 0)])
+
+    def test_empty(self):
+        self.assert_equal(make_lexer().lex(""), [])
+
+    def test_error(self):
+        try:
+            make_lexer().lex("abc ?")
+        except LexError as e:
+            self.assert_equal(e.position, 4)
+        else:
+            self.fail("LexError not raised")
+
+    def test_unfinished_token(self):
+        self.assert_raises(LexError, make_lexer().lex, 'x "abc')
+
+    def test_utf8(self):
+        lexer = Lexer([("word", union("\xe9", "\u2603", "a").plus()),
+                       ("space", " ")])
+        encoded = lexer.to_utf8()
+        text = "a\xe9 \u2603a"
+        tokens = encoded.lex(text.encode("utf-8"))
+        self.assert_equal([(t.kind, t.text.decode("utf-8")) for t in tokens],
+                          [(t.kind, t.text) for t in lexer.lex(text)])
+        self.assert_equal([t.end for t in tokens], [3, 4, 8])
+
+    def test_columns(self):
+        lexer = make_lexer()
+        text = make_text(31, 200)
+        expected = [(lexer.names.index(t.kind), t.start, t.end)
+                    for t in lexer.lex(text)]
+        for size in (1, 7, 100000):
+            found = []
+            for kinds, starts, ends in lexer.lex_columns(text, size):
+                self.assert_true(len(kinds) <= size)
+                found.extend(zip(kinds, starts, ends))
+            self.assert_equal(found, expected)
+        self.assert_equal(list(lexer.lex_columns("")), [])
+        self.assert_raises(LexError, list, lexer.lex_columns("ab ?"))
+
+    def test_skip(self):
+        lexer = make_lexer(skip=["space"])
+        self.assert_equal(lexer.lex(" ab  12\n"),
+                          [token("name", "ab", 1), token("number", "12", 5)])
+        self.assert_equal(lexer.lex("  \n "), [])
+        columns = [(list(k), list(s), list(e))
+                   for k, s, e in lexer.lex_columns("a b c", 2)]
+        self.assert_equal(columns, [([1, 1], [0, 2], [1, 3]),
+                                    ([1], [4], [5])])
+        self.assert_raises(ValueError, make_lexer, ["comment"])
+
+    def test_boolean_rules(self):
+        keyword = union("if", "else")
+        lexer = Lexer([
+            ("keyword", keyword),
+            ("name", letter.plus() & ~keyword),
+            ("space", " ")
+        ])
+        tokens = lexer.lex("if iffy else")
+        self.assert_equal([(t.kind, t.text) for t in tokens],
+                          [("keyword", "if"), ("space", " "),
+                           ("name", "iffy"), ("space", " "),
+                           ("keyword", "else")])
+
+    def test_empty_rule(self):
+        self.assert_raises(ValueError, Lexer, [("nothing", Epsilon)])
+
+
+class ModeTests(LexingtonTestCase):
+    """
+    These tests check lexers that switch between modes.
+    """
+    def test_modes(self):
+        tokens = make_modal_lexer().lex('a "b {c "d"} e" f')
+        self.assert_equal([(t.kind, t.text) for t in tokens], [
+            ("name", "a"), ("space", " "), ("quote", '"'), ("chars", "b "),
+            ("open", "{"), ("name", "c"), ("space", " "), ("quote", '"'),
+            ("chars", "d"), ("endquote", '"'), ("close", "}"),
+            ("chars", " e"), ("endquote", '"'), ("space", " "),
+            ("name", "f")
+        ])
+
+    def test_one_automaton(self):
+        lexer = make_modal_lexer()
+        automaton = lexer.automaton
+        lexer.lex(make_modal_text(48, 100))
+        size = len(automaton)
+        lexer.lex(make_modal_text(49, 100))
+        self.assert_is(lexer.automaton, automaton)
+        self.assert_equal(len(automaton), size)
+
+    def test_skip(self):
+        lexer = make_modal_lexer(skip=["space", "quote", "endquote"])
+        self.assert_equal([t.text for t in lexer.lex('a "b c" d')],
+                          ["a", "b c", "d"])
+
+    def test_stream(self):
+        lexer = make_modal_lexer()
+        text = make_modal_text(50, 100)
+        stream = lexer.stream()
+        tokens = []
+        for i in range(len(text)):
+            tokens.extend(stream.feed(text[i]))
+        tokens.extend(stream.finish())
+        self.assert_equal(tokens, lexer.lex(text))
+
+        stream = lexer.stream()
+        self.assert_equal(stream.mode, "code")
+        stream.feed('a "b')
+        self.assert_equal(stream.mode, "string")
+
+    def test_columns(self):
+        lexer = make_modal_lexer()
+        text = make_modal_text(51, 100)
+        expected = [(lexer.names.index(t.kind), t.start, t.end)
+                    for t in lexer.lex(text)]
+        found = []
+        for kinds, starts, ends in lexer.lex_columns(text, 10):
+            found.extend(zip(kinds, starts, ends))
+        self.assert_equal(found, expected)
+
+    def test_pop_first_mode(self):
+        lexer = make_modal_lexer()
+        try:
+            lexer.lex("a }")
+        except LexError as e:
+            self.assert_equal(e.position, 2)
+        else:
+            self.fail("LexError not raised")
+
+    def test_bad_modes(self):
+        rules = [("a", "a"), ("b", "b")]
+        self.assert_raises(ValueError, Lexer, rules, modes=[("m", ["c"])])
+        self.assert_raises(ValueError, Lexer, rules, push={"a": "m"})
+        self.assert_raises(ValueError, Lexer, rules, pop=["c"])
+        self.assert_equal(Lexer(rules).mode_names, ["default"])
+
+
+class TrailingContextTests(LexingtonTestCase):
+    """
+    These tests check rules that only match before some context.
+    """
+    def make_number_lexer(self):
+        return Lexer([
+            ("start", TrailingContext(digit.plus(), "..")),
+            ("float", digit.plus() + "." + digit.plus()),
+            ("int", digit.plus()),
+            ("dots", ".."),
+            ("space", " ")
+        ])
+
+    def test_fixed_context(self):
+        tokens = self.make_number_lexer().lex("12..5 1.5 7..")
+        self.assert_equal([(t.kind, t.text) for t in tokens], [
+            ("start", "12"), ("dots", ".."), ("int", "5"), ("space", " "),
+            ("float", "1.5"), ("space", " "), ("start", "7"), ("dots", "..")
+        ])
+
+    def test_fixed_regex(self):
+        lexer = Lexer([
+            ("call", TrailingContext("if", Regex(" ").star() + "(")),
+            ("name", letter.plus()),
+            ("space", Regex(" ").plus()),
+            ("paren", "(")
+        ])
+        tokens = lexer.lex("if  (a if")
+        self.assert_equal([(t.kind, t.text, t.start) for t in tokens], [
+            ("call", "if", 0), ("space", "  ", 2), ("paren", "(", 4),
+            ("name", "a", 5), ("space", " ", 6), ("name", "if", 7)
+        ])
+
+    def test_incremental(self):
+        lexer = self.make_number_lexer()
+        rand = random.Random(49)
+        text = "".join(rand.choice(["1", "23", " 4.5", "..", " "])
+                       for i in range(300))
+        tokens = lexer.lex(text)
+        for size in (1, 3, 40):
+            stream = lexer.stream()
+            found = []
+            for i in range(0, len(text), size):
+                found.extend(stream.feed(text[i:i + size]))
+            found.extend(stream.finish())
+            self.assert_equal(found, tokens)
+        columns = [(lexer.names[kind], start, end)
+                   for batch in lexer.lex_columns(text, 16)
+                   for kind, start, end in zip(*batch)]
+        self.assert_equal(columns, [(t.kind, t.start, t.end) for t in tokens])
+        document = lexer.document(text)
+        document.edit(10, 1, "4..")
+        text = text[:10] + "4.." + text[11:]
+        self.assert_equal(document.tokens, lexer.lex(text))
+
+    def test_utf8(self):
+        lexer = self.make_number_lexer().to_utf8()
+        tokens = lexer.lex("12..5 1.5".encode("utf-8"))
+        self.assert_equal([t.kind for t in tokens],
+                          ["start", "dots", "int", "space", "float"])
+
+    def test_variable(self):
+        self.assert_raises(ValueError, Lexer, [
+            ("name", TrailingContext(letter.plus(), Regex(" ").plus()))
+        ])
+        self.assert_raises(ValueError, Lexer, [
+            ("name", TrailingContext(Epsilon, "."))
+        ])
+
+
+class UpdateTests(LexingtonTestCase):
+    """
+    These tests check changing a lexer's rules.
+    """
+    def test_updated(self):
+        lexer = make_lexer(skip=["space"])
+        text = make_text(50, 100)
+        lexer.lex(text)
+        updated = lexer.updated(add=[("number", digit.plus() + "."),
+                                     ("comma", ",")],
+                                remove=["if"])
+        self.assert_equal(updated.names,
+                          ["name", "number", "space", "string", "comma"])
+        self.assert_equal(updated.skip, frozenset(["space"]))
+        # Only removing rules keeps every state that was discovered.
+        self.assert_true(len(lexer.updated(remove=["if"]).automaton) > 2)
+        tokens = updated.lex("if 12.,x")
+        self.assert_equal([(t.kind, t.text) for t in tokens], [
+            ("name", "if"), ("number", "12."), ("comma", ","), ("name", "x")
+        ])
+        self.assert_equal(lexer.lex("if")[0].kind, "if")
+        self.assert_raises(ValueError, lexer.updated, remove=["nothing"])
+
+    def test_updated_modes(self):
+        lexer = make_modal_lexer().updated(add=[("number", digit.plus())],
+                                           remove=["open"])
+        self.assert_equal(lexer.modes, [
+            ("code", ("name", "space", "quote", "close", "number")),
+            ("string", ("chars", "endquote"))
+        ])
+        self.assert_equal(lexer.push, {"quote": "string"})
+        tokens = lexer.lex('a1 "b"')
+        self.assert_equal([t.kind for t in tokens],
+                          ["name", "number", "space", "quote", "chars",
+                           "endquote"])
+
+    def test_switch(self):
+        lexer = make_lexer()
+        updated = lexer.updated(add=[("comma", ",")], remove=["if"])
+        stream = lexer.stream()
+        self.assert_equal(stream.feed("if i"), [token("if", "if", 0),
+                                                token("space", " ", 2)])
+        stream.switch(updated)
+        self.assert_is(stream.lexer, lexer)
+        # The token in progress still belongs to the old rules.
+        self.assert_equal(stream.feed("f if,"), [token("if", "if", 3),
+                                                 token("space", " ", 5),
+                                                 token("name", "if", 6)])
+        self.assert_is(stream.lexer, updated)
+        self.assert_equal(stream.finish(), [token("comma", ",", 8)])
+
+        stream = lexer.stream()
+        stream.switch(updated)
+        self.assert_is(stream.lexer, updated)
+        self.assert_equal(stream.feed("if "), [token("name", "if", 0)])
+        self.assert_raises(ValueError, stream.switch, make_modal_lexer())
+
+    def test_switch_after_skipped(self):
+        lexer = make_lexer(skip=["space"])
+        updated = lexer.updated(add=[("comma", ",")], remove=["if"])
+        stream = lexer.stream()
+        self.assert_equal(stream.feed("x "), [token("name", "x", 0)])
+        stream.switch(updated)
+        # The skipped space is the boundary the switch happens at.
+        self.assert_equal(stream.feed("if,"), [token("name", "if", 2)])
+        self.assert_is(stream.lexer, updated)
+        self.assert_equal(stream.finish(), [token("comma", ",", 4)])
+
+    def test_switch_then_error(self):
+        lexer = make_lexer()
+        updated = lexer.updated(add=[("comma", ",")], remove=["if"])
+        stream = lexer.stream()
+        stream.feed("if i")
+        stream.switch(updated)
+        # The snapshot couldn't say which lexer the next token belongs to.
+        self.assert_raises(ValueError, stream.checkpoint)
+        try:
+            stream.feed("f ,;")
+        except LexError as e:
+            self.assert_equal(e.tokens, [token("if", "if", 3),
+                                         token("space", " ", 5),
+                                         token("comma", ",", 6)])
+        else:
+            self.fail("LexError not raised")
+        self.assert_is(stream.lexer, updated)
+        self.assert_equal(updated.resume(stream.checkpoint()).position, 7)
+
+
+class StreamTests(LexingtonTestCase):
+    """
+    These tests check feeding input to a lexer a piece at a time.
+    """
+    def test_tokens_wait_for_their_end(self):
+        stream = make_lexer().stream()
+        self.assert_equal(stream.feed("ab"), [])
+        self.assert_equal(stream.feed("c 1"), [token("name", "abc", 0),
+                                               token("space", " ", 3)])
+        self.assert_equal(stream.finish(), [token("number", "1", 4)])
+
+    def test_pieces(self):
+        lexer = make_lexer()
+        text = make_text(26, 300)
+        for size in (1, 2, 7, 50):
+            stream = lexer.stream()
+            tokens = []
+            for i in range(0, len(text), size):
+                tokens.extend(stream.feed(text[i:i + size]))
+            tokens.extend(stream.finish())
+            self.assert_equal(tokens, lexer.lex(text))
+
+    def test_error(self):
+        stream = make_lexer().stream()
+        try:
+            stream.feed("ab cd ;")
+        except LexError as e:
+            self.assert_equal(e.position, 6)
+            self.assert_equal(e.tokens, [token("name", "ab", 0),
+                                         token("space", " ", 2),
+                                         token("name", "cd", 3),
+                                         token("space", " ", 5)])
+        else:
+            self.fail("LexError not raised")
+        self.assert_equal(stream.position, 6)
+        try:
+            stream.feed("ef")
+        except LexError as e:
+            self.assert_equal(e.position, 6)
+            self.assert_equal(e.tokens, [])
+        else:
+            self.fail("LexError not raised")
+
+    def test_lines(self):
+        stream = make_lexer().stream()
+        tokens = []
+        for i in range(100):
+            tokens.extend(stream.feed("ab\n c"))
+            # Only the line the stream is in the middle of is kept.
+            self.assert_equal(len(stream._lines.starts), 1)
+        tokens.extend(stream.finish())
+        self.assert_equal([(t.line, t.column) for t in tokens[-3:]],
+                          [(100, 1), (100, 4), (101, 1)])
+        self.assert_equal([(t.line, t.column) for t in tokens[:3]],
+                          [(1, 0), (1, 2), (2, 1)])
+
+    def test_long_token(self):
+        stream = make_lexer().stream()
+        self.assert_equal(stream.feed('"'), [])
+        for i in range(100):
+            self.assert_equal(stream.feed("ab "), [])
+        tokens = stream.feed('" x')
+        self.assert_equal(tokens, [token("string", '"' + "ab " * 100 + '"', 0),
+                                   token("space", " ", 302)])
+
+    def test_encoding(self):
+        lexer = Lexer([("word", union("\xe9", "\u2603", "a").plus()),
+                       ("space", " ")])
+        data = "a\xe9 \u2603\u2603 a".encode("utf-8")
+        expected = lexer.lex(data.decode("utf-8"))
+        for size in (1, 2, 5):
+            stream = lexer.stream(encoding="utf-8")
+            tokens = []
+            for i in range(0, len(data), size):
+                tokens.extend(stream.feed(data[i:i + size]))
+            tokens.extend(stream.finish())
+            self.assert_equal(tokens, expected)
+
+    def test_truncated_encoding(self):
+        stream = make_lexer().stream(encoding="utf-8")
+        stream.feed(b"ab\xe2\x98")
+        self.assert_raises(UnicodeDecodeError, stream.finish)
+
+    def test_skip(self):
+        lexer = make_lexer(skip=["space"])
+        text = make_text(31, 300)
+        stream = lexer.stream()
+        tokens = []
+        for i in range(0, len(text), 3):
+            tokens.extend(stream.feed(text[i:i + 3]))
+        tokens.extend(stream.finish())
+        self.assert_equal(tokens, lexer.lex(text))
+        self.assert_equal(tokens, [t for t in make_lexer().lex(text)
+                                   if t.kind != "space"])
+
+    def test_offset(self):
+        stream = make_lexer().stream(10)
+        stream.feed("abc")
+        self.assert_equal(stream.finish(), [token("name", "abc", 10)])
+
+    def test_limit(self):
+        lexer = make_modal_lexer()
+        lexer.lex('x "')
+        # The limit is hit right after the quote switches modes.
+        lexer.automaton.limits = Limits(states=len(lexer.automaton))
+        text = 'x "b {c}" y'
+        stream = lexer.stream(encoding="utf-8")
+        self.assert_raises(LimitExceeded, stream.feed, text.encode("utf-8"))
+        self.assert_equal((stream.mode, stream.position), ("code", 0))
+        lexer.automaton.limits = None
+        tokens = stream.feed(text.encode("utf-8")) + stream.finish()
+        self.assert_equal(tokens, lexer.lex(text))
+
+    def test_limit_while_switching(self):
+        lexer, other = make_modal_lexer(), make_modal_lexer()
+        other.automaton.limits = Limits(states=len(other.automaton))
+        stream = lexer.stream()
+        stream.feed("ab")
+        stream.switch(other)
+        self.assert_raises(LimitExceeded, stream.feed, ' "c"')
+        self.assert_is(stream.lexer, lexer)
+        other.automaton.limits = None
+        tokens = stream.feed(' "c"') + stream.finish()
+        self.assert_is(stream.lexer, other)
+        self.assert_equal(tokens, lexer.lex('ab "c"'))
+
+
+class TokenTests(LexingtonTestCase):
+    """
+    These tests check the tokens' lazily computed properties.
+    """
+    def test_text_is_sliced(self):
+        text = "ab 12"
+        tokens = make_lexer().lex(text)
+        self.assert_is(tokens[0].source.text, text)
+        self.assert_equal([t.text for t in tokens], ["ab", " ", "12"])
+
+    def test_lines(self):
+        tokens = make_lexer().lex("ab cd\n12\n\n x")
+        self.assert_equal([(t.text, t.line, t.column) for t in tokens],
+                          [("ab", 1, 0), (" ", 1, 2), ("cd", 1, 3),
+                           ("\n", 1, 5), ("12", 2, 0), ("\n\n ", 2, 2),
+                           ("x", 4, 1)])
+
+    def test_stream_lines(self):
+        lexer = make_lexer()
+        text = make_text(32, 300)
+        stream = lexer.stream()
+        tokens = []
+        for i in range(0, len(text), 7):
+            tokens.extend(stream.feed(text[i:i + 7]))
+        tokens.extend(stream.finish())
+        self.assert_equal([(t.line, t.column) for t in tokens],
+                          [(t.line, t.column) for t in lexer.lex(text)])
+
+    def test_line_index(self):
+        lines = LineIndex(b"a\nbc\n")
+        self.assert_equal(lines.locate(4), (2, 2))
+        self.assert_equal(lines.locate(0), (1, 0))
+        self.assert_equal(lines.locate(5), (3, 0))
+        fed = LineIndex(base=10, line=5)
+        fed.feed("ab\n")
+        fed.feed("\ncd")
+        self.assert_equal(fed.starts, [10, 13, 14])
+        self.assert_equal(fed.locate(15), (7, 1))
+
+
+class CheckpointTests(LexingtonTestCase):
+    """
+    These tests check snapshotting streams and resuming them.
+    """
+    def test_resume_mid_token(self):
+        lexer = make_lexer()
+        stream = lexer.stream()
+        self.assert_equal(stream.feed("ab 12"), [token("name", "ab", 0),
+                                                 token("space", " ", 2)])
+        checkpoint = stream.checkpoint()
+        self.assert_true(len(checkpoint) < 50)
+
+        # A pickled lexer stands in for one in another process.
+        copy = pickle.loads(pickle.dumps(lexer))
+        resumed = copy.resume(checkpoint)
+        self.assert_equal(resumed.feed("3 x"), [token("number", "123", 3),
+                                                token("space", " ", 6)])
+        self.assert_equal(resumed.finish(), [token("name", "x", 7)])
+
+    def test_resume_mid_character(self):
+        lexer = Lexer([("word", union("\xe9", "a").plus()), ("space", " ")])
+        stream = lexer.stream(encoding="utf-8")
+        stream.feed(b"a \xc3\xa9\xc3")
+        resumed = lexer.resume(stream.checkpoint())
+        self.assert_equal(resumed.encoding, "utf-8")
+        resumed.feed(b"\xa9")
+        self.assert_equal(resumed.finish(),
+                          [token("word", "\xe9\xe9", 2)])
+
+    def test_resume_lines(self):
+        lexer = make_lexer()
+        stream = lexer.stream()
+        stream.feed("a\nb\n c")
+        resumed = lexer.resume(stream.checkpoint())
+        tokens = resumed.feed("d\ne")
+        tokens.extend(resumed.finish())
+        self.assert_equal([(t.text, t.line, t.column) for t in tokens],
+                          [("cd", 3, 1), ("\n", 3, 3), ("e", 4, 0)])
+
+    def test_resume_elsewhere(self):
+        stream = make_lexer().stream()
+        stream.feed("ab 12")
+        checkpoint = stream.checkpoint()
+        # This lexer discovers its states in a different order.
+        other = make_lexer()
+        other.lex("99 x y")
+        resumed = other.resume(checkpoint)
+        tokens = resumed.feed("3 x")
+        tokens.extend(resumed.finish())
+        self.assert_equal(tokens, [token("number", "123", 3),
+                                   token("space", " ", 6),
+                                   token("name", "x", 7)])
+        self.assert_equal(make_lexer().resume(checkpoint).finish(),
+                          [token("number", "12", 3)])
+        different = Lexer([(name, digit if name == "number" else regex)
+                           for name, regex in other.rules])
+        self.assert_raises(ValueError, different.resume, checkpoint)
+
+    def test_resume_token_with_lines(self):
+        lexer = make_lexer()
+        stream = lexer.stream()
+        stream.feed('a\n"b\nc')
+        resumed = lexer.resume(stream.checkpoint())
+        tokens = resumed.feed('d" e')
+        tokens.extend(resumed.finish())
+        self.assert_equal([(t.text, t.line, t.column) for t in tokens],
+                          [('"b\ncd"', 2, 0), (" ", 3, 3), ("e", 3, 4)])
+
+    def test_old_version(self):
+        lexer = make_lexer()
+        stream = lexer.stream()
+        stream.feed("ab")
+        checkpoint = stream.checkpoint()
+        self.assert_raises(ValueError, lexer.resume, b"\x01" + checkpoint[1:])
+
+    def test_resume_between_tokens(self):
+        lexer = make_lexer()
+        stream = lexer.stream(5)
+        resumed = lexer.resume(stream.checkpoint())
+        resumed.feed("x")
+        self.assert_equal(resumed.finish(), [token("name", "x", 5)])
+
+    def test_resume_in_mode(self):
+        lexer = make_modal_lexer()
+        text = 'a "b {c "d'
+        stream = lexer.stream()
+        tokens = stream.feed(text)
+        resumed = lexer.resume(stream.checkpoint())
+        self.assert_equal(resumed.mode, "string")
+        tokens.extend(resumed.feed('e"} f" g'))
+        tokens.extend(resumed.finish())
+        self.assert_equal(tokens, lexer.lex(text + 'e"} f" g'))
+
+    def test_wrong_lexer(self):
+        checkpoint = make_lexer().stream().checkpoint()
+        other = Lexer([("a", "a")])
+        self.assert_raises(ValueError, other.resume, checkpoint)
+        checkpoint = make_modal_lexer().stream().checkpoint()
+        self.assert_raises(ValueError, make_lexer().resume, checkpoint)
+
+
+class DocumentTests(LexingtonTestCase):
+    """
+    These tests check updating tokens as text is edited.
+    """
+    def test_local_edit(self):
+        doc = make_lexer().document("ab 12 cd 34 ef")
+        last = doc.tokens[-1]
+        # The space before "12" had to look at the "1" to end.
+        self.assert_equal(doc.edit(3, 2, "567"), (1, 3, 3))
+        self.assert_equal(doc.text, "ab 567 cd 34 ef")
+        self.assert_equal(doc.tokens[2], token("number", "567", 3))
+        self.assert_is(doc.tokens[-1], last)
+        self.assert_equal(last.start, 13)
+
+    def test_merging_tokens(self):
+        doc = make_lexer().document("ab cd")
+        self.assert_equal(doc.edit(2, 1, ""), (0, 3, 1))
+        self.assert_equal(doc.tokens, [token("name", "abcd", 0)])
+
+    def test_lookahead(self):
+        # "i" + "x" is one name, but making it "if" needs the if rule,
+        # which the lexer only knows by looking past the first token.
+        doc = make_lexer().document("i x")
+        doc.edit(1, 2, "f")
+        self.assert_equal(doc.tokens, [token("if", "if", 0)])
+
+    def test_joining_strings(self):
+        doc = make_lexer().document('"a" b "c" d')
+        self.assert_equal(doc.edit(2, 5, " "), (0, 5, 1))
+        self.assert_equal(doc.tokens, [token("string", '"a c"', 0),
+                                       token("space", " ", 5),
+                                       token("name", "d", 6)])
+        self.assert_raises(LexError, doc.edit, 7, 0, '"')
+        self.assert_equal(doc.text, '"a c" d')
+
+    def test_random_edits(self):
+        self.check_random_edits(make_lexer())
+
+    def test_random_edits_skipping(self):
+        self.check_random_edits(make_lexer(skip=["space"]))
+
+    def check_random_edits(self, lexer):
+        rand = random.Random(33)
+        doc = lexer.document(make_text(30, 100))
+        for i in range(300):
+            offset = rand.randint(0, len(doc.text))
+            deleted = rand.randint(0, min(4, len(doc.text) - offset))
+            inserted = make_text(rand.random(), rand.randint(0, 2))
+            new_text = doc.text[:offset] + inserted + doc.text[offset + deleted:]
+            try:
+                expected = lexer.lex(new_text)
+            except LexError:
+                self.assert_raises(LexError, doc.edit,
+                                   offset, deleted, inserted)
+            else:
+                doc.edit(offset, deleted, inserted)
+                self.assert_equal(doc.tokens, expected)
+
+
+class ModeDocumentTests(LexingtonTestCase):
+    """
+    These tests check editing documents lexed with modes.
+    """
+    def test_edits(self):
+        lexer = make_modal_lexer()
+        doc = lexer.document(make_modal_text(52, 60))
+        rand = random.Random(53)
+        for i in range(100):
+            offset = rand.randint(0, len(doc.text))
+            deleted = rand.randint(0, min(3, len(doc.text) - offset))
+            inserted = rand.choice(['"', "{", "}", "a", " ", ""])
+            try:
+                doc.edit(offset, deleted, inserted)
+            except LexError:
+                continue
+            self.assert_equal(doc.tokens, lexer.lex(doc.text))
+
+    def test_quote_changes_the_rest(self):
+        doc = make_modal_lexer().document('a "b" c d')
+        # Every token after the edit is in a different mode now.
+        self.assert_equal(doc.edit(1, 0, ' "x'), (0, 9, 8))
+        self.assert_equal([t.kind for t in doc.tokens[-3:]],
+                          ["name", "quote", "chars"])
+
+
+class ParallelTests(LexingtonTestCase):
+    """
+    These tests check lexing large inputs in pieces, in parallel.
+    """
+    def test_split(self):
+        lexer = make_lexer()
+        self.assert_equal(lexer.split("ab\ncd\nef", 1),
+                          [(0, 3), (3, 6), (6, 8)])
+        self.assert_equal(Lexer([("a", "a")]).split("aaa", 1), [(0, 3)])
+
+    def test_same_as_lex(self):
+        if ThreadPoolExecutor is None:
+            return
+        text = make_text(27, 2000)
+        for lexer in (make_lexer(), make_lexer(skip=["space"])):
+            expected = lexer.lex(text)
+            with ThreadPoolExecutor(4) as pool:
+                for size in (1, 5, 40, 500):
+                    self.assert_equal(lexer.lex_parallel(text, pool, size),
+                                      expected)
+
+    def test_modes(self):
+        if ThreadPoolExecutor is None:
+            return
+        text = make_modal_text(54, 1000)
+        lexer = make_modal_lexer()
+        expected = lexer.lex(text)
+        with ThreadPoolExecutor(4) as pool:
+            for size in (1, 5, 40, 500):
+                self.assert_equal(lexer.lex_parallel(text, pool, size),
+                                  expected)
+
+    def test_processes(self):
+        if ThreadPoolExecutor is None:
+            return
+        lexer = make_lexer()
+        text = make_text(28, 2000)
+        self.assert_equal(lexer.lex_parallel(text, chunk_size=1000),
+                          lexer.lex(text))
+
+    def test_error(self):
+        if ThreadPoolExecutor is None:
+            return
+        lexer = make_lexer()
+        text = make_text(29, 200)
+        with ThreadPoolExecutor(2) as pool:
+            self.assert_raises(LexError, lexer.lex_parallel,
+                               text + "\n?\n" + text, pool, 20)
+
+
+suite = make_suite(
+    LexingTests,
+    ModeTests,
+    TrailingContextTests,
+    UpdateTests,
+    StreamTests,
+    TokenTests,
+    CheckpointTests,
+    DocumentTests,
+    ModeDocumentTests,
+    ParallelTests
+)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.nfa
+=======================
+This file contains API-level tests for the nfa module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import pickle
+import random
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.automaton import Automaton
+from lexington.nfa import NFA, NFAMatcher
+from lexington.regex import Regex, Epsilon, Null, union, star, repeat
+
+
+def msv():
+    msv = Regex("spam") | Regex("eggs")
+    return msv + (" " + msv).star()
+
+
+def explosive(n):
+    # Matching this means remembering the last n + 1 symbols, which takes
+    # a DFA with 2 ** (n + 1) states.
+    ab = union("a", "b")
+    return star(ab) + "a" + repeat(ab, n)
+
+
+class MatchingTests(LexingtonTestCase):
+    """
+    These tests check matching with an NFA.
+    """
+    def test_simple(self):
+        nfa = NFA(msv())
+        self.assert_true(nfa.match("spam eggs spam"))
+        self.assert_false(nfa.match("spam eggs "))
+        self.assert_false(nfa.match("ham"))
+        self.assert_true(NFA(Epsilon).match(""))
+        self.assert_false(NFA(Null).match(""))
+
+    def test_same_as_automaton(self):
+        rand = random.Random(39)
+        regex = star(union("ab", "a", "ba")) + Regex("b").maybe()
+        nfa, dfa = NFA(regex), Automaton(regex)
+        for i in range(300):
+            subject = "".join(rand.choice("ab")
+                              for j in range(rand.randint(0, 12)))
+            self.assert_equal(nfa.match(subject), dfa.match(subject))
+
+    def test_boolean(self):
+        rand = random.Random(47)
+        ab = union("a", "b")
+        regexes = [star(ab) & ~(star(ab) + "aa" + star(ab)),
+                   (star(ab) + "a") & (star("a") + ab + star(ab)),
+                   ~explosive(2)]
+        for regex in regexes:
+            nfa, dfa = NFA(regex), Automaton(regex)
+            for i in range(200):
+                subject = "".join(rand.choice("ab")
+                                  for j in range(rand.randint(0, 10)))
+                self.assert_equal(nfa.match(subject), dfa.match(subject))
+
+    def test_few_states(self):
+        rand = random.Random(20)
+        nfa = NFA(explosive(20))
+        for i in range(100):
+            subject = "".join(rand.choice("ab") for j in range(40))
+            self.assert_equal(nfa.match(subject), subject[-21] == "a")
+        self.assert_true(len(nfa) < 30)
+
+    def test_pickle(self):
+        nfa = NFA(msv())
+        nfa.match("spam eggs")
+        copy = pickle.loads(pickle.dumps(nfa))
+        self.assert_equal(len(copy), len(nfa))
+        self.assert_true(copy.match("eggs spam"))
+
+
+class MatcherTests(LexingtonTestCase):
+    """
+    These tests check incremental matching with an NFA.
+    """
+    def test_feed(self):
+        m = NFA(explosive(2)).matcher()
+        self.assert_instance(m, NFAMatcher)
+        self.assert_true(m.feed("bab"))
+        self.assert_false(m.accepts)
+        self.assert_true(m.feed("b"))
+        self.assert_true(m.accepts)
+        self.assert_false(m.feed("c"))
+        self.assert_false(m.accepts)
+        m.reset()
+        self.assert_true(m.feed("aaa"))
+        self.assert_true(m.accepts)
+
+
+suite = make_suite(
+    MatchingTests,
+    MatcherTests
+)
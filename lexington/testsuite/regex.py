@@ -8,12 +8,16 @@ This file contains API-level tests for the regular expression module.
 :license:   Released under the MIT/X11 license, see LICENSE for details
 """
 from __future__ import unicode_literals
+import pickle
 import unittest
 from . import LexingtonTestCase, make_suite
 
-from lexington.regex import (Regex, Null, Epsilon, Any,
-                             concat, union, join, star, repeat)
-from lexington.strings import Text, Bytestring
+from lexington.regex import (Regex, Null, Epsilon, Any, PatternError,
+                             concat, union, intersect, complement, join,
+                             star, repeat, symbol_range, parse,
+                             symbols, representatives, estimate_states,
+                             lengths, signature, prune)
+from lexington.strings import Text, Bytestring, PYTHON_3000
 
 class MatchingTests(LexingtonTestCase):
     """
@@ -48,6 +52,23 @@ class MatchingTests(LexingtonTestCase):
         self.assert_false(total.match(" "))
         self.assert_false(total.match("spam spam ham eggs"))
 
+    def test_iterable(self):
+        regex = Regex("a").star()
+        self.assert_true(regex.match(iter("a" * 100)))
+        self.assert_false(regex.match(c for c in "a" * 99 + "b"))
+        self.assert_true(regex.match("a" * 100))
+
+    def test_long_sequences(self):
+        # Long literals are looked up in a set, which lists can't be.
+        regex = Regex("abc" * 30)
+        self.assert_true(regex.match(list("abc" * 30)))
+        self.assert_false(regex.match(list("abc" * 29 + "abd")))
+        if PYTHON_3000:
+            # (On Python 2, a bytearray's symbols are ints, not bytes.)
+            regex = Regex(b"abc" * 30)
+            self.assert_true(regex.match(bytearray(b"abc" * 30)))
+            self.assert_false(regex.match(bytearray(b"abc" * 31)))
+
 
 class DerivationTests(LexingtonTestCase):
     """
@@ -105,6 +126,73 @@ class DerivationTests(LexingtonTestCase):
 
         self.assert_is(s3.derive("b"), Null)
 
+        self.assert_true(repeat(Regex("a").maybe(), 2).accepts_empty_string)
+
+
+class NestingTests(LexingtonTestCase):
+    """
+    These tests check that concatenations too deep to recurse through still
+    work.
+    """
+    def left_nested(self):
+        regex = Regex("a")
+        for i in range(3000):
+            regex = regex + union("b", "c")
+        return regex + star("d")
+
+    def test_long_literal(self):
+        regex = Regex("ab" * 3000)
+        self.assert_equal(regex, Regex("ab" * 3000))
+        self.assert_equal(hash(regex), hash(Regex("ab" * 3000)))
+        self.assert_equal(regex.literal, "ab" * 3000)
+        self.assert_equal(repr(regex), "Regex(%r)" % ("ab" * 3000))
+        self.assert_true(regex.match("ab" * 3000))
+        self.assert_false(regex.match("ab" * 2999 + "a"))
+        self.assert_false(regex.accepts_empty_string)
+
+    def test_left_nested(self):
+        regex = self.left_nested()
+        self.assert_true(regex.match("a" + "bc" * 1500))
+        self.assert_true(regex.match("a" + "b" * 3000 + "ddd"))
+        self.assert_false(regex.match("a" + "b" * 2999))
+        self.assert_true(regex.to_utf8().match(b"a" + b"c" * 3000))
+        self.assert_true(repr(regex).endswith(" + %r" % star("d")))
+        self.assert_true(regex.partial_derive("a"))
+
+    def test_pickle(self):
+        regex = star(union("spam", "eggs")) + repeat("ham", 3)
+        self.assert_equal(pickle.loads(pickle.dumps(regex)), regex)
+        # Deep concatenations are pickled without recursing through them.
+        for regex in (Regex("a" * 5000), self.left_nested()):
+            copy = pickle.loads(pickle.dumps(regex))
+            self.assert_equal(copy, regex)
+            self.assert_equal(repr(copy), repr(regex))
+
+
+class PartialDerivationTests(LexingtonTestCase):
+    """
+    These tests check that partial derivatives split up the derivative.
+    """
+    def test_basics(self):
+        self.assert_equal(Epsilon.partial_derive("a"), frozenset())
+        self.assert_equal(Any.partial_derive("a"), frozenset([Epsilon]))
+        self.assert_equal(Regex("a").partial_derive("b"), frozenset())
+
+    def test_terms(self):
+        ab = union("a", "b")
+        s = star(ab) + "a" + ab
+        self.assert_equal(s.partial_derive("a"),
+                          frozenset([s, ab]))
+        self.assert_equal(s.partial_derive("b"), frozenset([s]))
+
+    def test_union_of_terms(self):
+        regexes = [Regex("abc"), star(union("ab", "a")) + "c",
+                   repeat(union("a", Regex("b").plus()), 3)]
+        for r in regexes:
+            for sym in "abc":
+                self.assert_equal(union(*r.partial_derive(sym)).match("bc"),
+                                  r.derive(sym).match("bc"))
+
 
 class IdentityTests(LexingtonTestCase):
     """
@@ -176,6 +264,8 @@ class AlphabetTests(LexingtonTestCase):
         pratchett = b"Pratchett"
 
         self.assert_is(concat(terry, gilliam).alphabet, Text)
+        self.assert_is(concat(terry, Any).alphabet, Text)
+        self.assert_is(concat(Any, pratchett).alphabet, Bytestring)
         self.assert_raises(TypeError, concat, terry, pratchett)
 
     def test_union(self):
@@ -215,11 +305,285 @@ class OperatorTests(LexingtonTestCase):
         a = Regex("a")
         self.assert_equal(a.star(), star(a))
 
+    def test_amp_intersect(self):
+        a, b = Regex("a"), Regex("b")
+        self.assert_equal(a & b, intersect(a, b))
+        self.assert_equal("a" & b, intersect(a, b))
+
+    def test_invert_complement(self):
+        a = Regex("a")
+        self.assert_equal(~a, complement(a))
+        self.assert_equal(~~a, a)
+
+
+class BooleanTests(LexingtonTestCase):
+    """
+    These tests check intersections and complements.
+    """
+    def test_intersection(self):
+        regex = parse("[a-z]+") & ~parse("if|else")
+        for subject in ["i", "iff", "elsewhere", "x"]:
+            self.assert_true(regex.match(subject))
+        for subject in ["if", "else", "", "a1"]:
+            self.assert_false(regex.match(subject))
+        self.assert_true((parse("(ab)*") & parse("(ab)+|b*")).equivalent(
+            parse("(ab)*")))
+
+    def test_complement(self):
+        regex = ~(star(Any) + "x" + star(Any))
+        self.assert_true(regex.match(""))
+        self.assert_true(regex.match("abc"))
+        self.assert_false(regex.match("abxc"))
+        self.assert_true(regex.accepts_empty_string)
+        self.assert_false((~Epsilon).accepts_empty_string)
+        self.assert_true((~Null).match("anything"))
+
+    def test_simplification(self):
+        a = Regex("a")
+        self.assert_is(intersect(a, Null), Null)
+        self.assert_is(intersect(Epsilon, star(a)), Epsilon)
+        self.assert_is(intersect(Epsilon, a), Null)
+        self.assert_equal(intersect(a, ~Null), a)
+        self.assert_equal(intersect(a, a), a)
+        self.assert_raises(TypeError, intersect, "a", b"a")
+
+    def test_derivatives(self):
+        regex = parse("[a-z]+") & ~Regex("if")
+        self.assert_equal(regex.derive("i"),
+                          intersect(star(parse("[a-z]")), ~Regex("f")))
+        for sym in "if1":
+            self.assert_equal(union(*regex.partial_derive(sym)).match("f"),
+                              regex.derive(sym).match("f"))
+
+    def test_utf8(self):
+        regex = ~Regex("\xe9")
+        self.assert_true(regex.to_utf8().match("e".encode("utf-8")))
+        self.assert_false(regex.to_utf8().match("\xe9".encode("utf-8")))
+        # Complements only match well-formed UTF-8.
+        self.assert_false(regex.to_utf8().match(b"\xff"))
+
+
+class UTF8Tests(LexingtonTestCase):
+    """
+    These tests check converting text regexes to UTF-8 byte regexes.
+    """
+    def check(self, regex, subjects):
+        encoded = regex.to_utf8()
+        self.assert_is(encoded.alphabet, Bytestring)
+        for s in subjects:
+            self.assert_equal(encoded.match(s.encode("utf-8")), regex.match(s))
+
+    def test_symbols(self):
+        self.check(Regex("h\xe9llo") | Regex("\u65e5\u672c"),
+                   ["h\xe9llo", "hello", "\u65e5\u672c", "\u65e5"])
+
+    def test_operators(self):
+        regex = (Regex("\xe9") + "x").star() + repeat("\u2603", 2)
+        self.check(regex, ["\u2603\u2603", "\xe9x\u2603\u2603",
+                           "\xe9\u2603\u2603", "\xe9x\xe9x\u2603"])
+
+    def test_any(self):
+        regex = "<" + Any + ">"
+        self.check(regex, ["<a>", "<\xe9>", "<\u2603>", "<\U0001f600>",
+                           "<ab>", "<>"])
+        encoded = regex.to_utf8()
+        # Overlong encodings, surrogates, and stray bytes are not UTF-8.
+        self.assert_false(encoded.match(b"<\xc0\xaf>"))
+        self.assert_false(encoded.match(b"<\xed\xa0\x80>"))
+        self.assert_false(encoded.match(b"<\xff>"))
+
+    def test_range(self):
+        regex = symbol_range("x", "\U0001f600")
+        self.check(regex, ["w", "x", "\x7f", "\x80", "\u07ff", "\u0800",
+                           "\ud7ff", "\ue000", "\uffff", "\U00010000",
+                           "\U0001f600", "\U0001f601"])
+        # The surrogates can't be encoded, so they aren't in the range.
+        self.assert_false(regex.to_utf8().match(b"\xed\xa0\x80"))
+
+    def test_special(self):
+        self.assert_is(Epsilon.to_utf8(), Epsilon)
+        self.assert_is(Null.to_utf8(), Null)
+
+    def test_bytes(self):
+        self.assert_raises(TypeError, Regex(b"abc").to_utf8)
+
+
+class ParseTests(LexingtonTestCase):
+    """
+    These tests check parsing textual patterns.
+    """
+    def test_structure(self):
+        ab = union("a", "b")
+        self.assert_equal(parse("abc"), Regex("abc"))
+        self.assert_equal(parse("a|bc"), union("a", "bc"))
+        self.assert_equal(parse("(a|b)*c"), star(ab) + "c")
+        self.assert_equal(parse("[ab]+"), ab + star(ab))
+        self.assert_equal(parse("(?:ab)?"), Regex("ab").maybe())
+        self.assert_equal(parse(".{3}"), repeat(Any, 3))
+        self.assert_equal(parse("a|"), Regex("a").maybe())
+        self.assert_is(parse(""), Epsilon)
+
+    def test_matching(self):
+        cases = [
+            ("[a-z_][a-z0-9_]*", ["x", "a_1", "__"], ["", "1a", "aB"]),
+            (r"\d{2,4}", ["12", "1234"], ["1", "12345", "ab"]),
+            ("x{2,}", ["xx", "xxxxx"], ["x"]),
+            (r"[\]\-a-c.]+\.", ["]-b.", "..", "c."], ["d.", "."]),
+            (r"\s*\w+", ["  a", "\tb_9"], ["a b"]),
+            (r"\x41\u00e9\n", ["A\u00e9\n"], ["A\u00e9"]),
+            ("a{x}", ["a{x}"], ["a"]),
+            ("[^a-c]x", ["dx", "\u2603x"], ["ax", "x", "ddx"]),
+            (r"\D\S\W", ["a!.", "-a "], ["1a.", "a a", "aaa"]),
+        ]
+        for pattern, good, bad in cases:
+            regex = parse(pattern)
+            for subject in good:
+                self.assert_true(regex.match(subject))
+            for subject in bad:
+                self.assert_false(regex.match(subject))
+
+    def test_bytes(self):
+        regex = parse(b"[a-c]+\\.")
+        self.assert_is(regex.alphabet, Bytestring)
+        self.assert_true(regex.match(b"abc."))
+        self.assert_raises(PatternError, parse, b"\\u0100")
+
+    def test_errors(self):
+        for pattern, position in [("(a", 0), ("a)", 1), ("*", 0), ("[a", 0),
+                                  ("a{3,2}", 1), ("[z-a]", 0), ("\\q", 0),
+                                  ("a^", 1), ("\\x4", 0), ("(?=a)", 1)]:
+            try:
+                parse(pattern)
+            except PatternError as e:
+                self.assert_equal(e.position, position)
+            else:
+                self.fail("%r should not parse" % pattern)
+
+    def test_wide_class(self):
+        regex = parse("[\u0000-\uffff]")
+        self.assert_equal(regex, symbol_range("\u0000", "\uffff"))
+        self.assert_true(regex.match("\u4e00"))
+        self.assert_false(regex.match("\u4e00\u4e00"))
+        regex = parse("[^\u0100-\uffffa]+")
+        self.assert_true(regex.match("xyz\xe9"))
+        self.assert_false(regex.match("xa"))
+        self.assert_false(regex.match("x\u0100"))
+        # Narrow ranges are still unions of their symbols.
+        self.assert_equal(parse("[a-c]"), union("a", "b", "c"))
+        self.assert_raises(ValueError, symbol_range, "z", "a")
+        self.assert_raises(TypeError, symbol_range, b"a", b"z")
+
+    def test_cache(self):
+        self.assert_is(parse("[a-z]+"), parse("[a-z]+"))
+        self.assert_false(parse("ab") is parse(b"ab"))
+
+
+class AnalysisTests(LexingtonTestCase):
+    """
+    These tests check the functions that examine a regex without matching.
+    """
+    def test_symbols(self):
+        regex = union("spam", "eggs") + Any
+        self.assert_equal(symbols(regex), frozenset("spameg"))
+        self.assert_equal(symbols(Epsilon), frozenset())
+        self.assert_equal(representatives(parse("[a-c]x")),
+                          ["a", "b", "c", "x", "\0"])
+        wide = symbol_range("b", "\u2000")
+        self.assert_equal(symbols(wide), frozenset(["b", "\u2000"]))
+        self.assert_equal(representatives(wide),
+                          ["b", "\u2000", "\0", "c", "\u2001"])
+
+    def test_lengths(self):
+        self.assert_equal(lengths(parse("ab|c")), (1, 2))
+        self.assert_equal(lengths(parse("(ab){3}")), (6, 6))
+        self.assert_equal(lengths(parse("a+b?")), (1, None))
+        self.assert_equal(lengths(Epsilon), (0, 0))
+        self.assert_equal(lengths(parse("[a-z]+") & ~Regex("if")),
+                          (1, None))
+
+    def test_signature(self):
+        options = ["spam", "eggs", "ham", "bacon", "beans"]
+        regex = union(*options) + star("x")
+        self.assert_equal(signature(regex),
+                          signature(union(*reversed(options)) + star("x")))
+        self.assert_false(signature(regex) == signature(union(*options)))
+
+    def test_exact_estimate(self):
+        estimate = estimate_states(union("spam", "eggs"))
+        self.assert_true(estimate.complete)
+        # start, pam, am, m, ggs, gs, s, Epsilon, and Null
+        self.assert_equal(estimate.states, 9)
+        self.assert_equal(estimate.estimate, 9)
+
+    def test_explosive_estimate(self):
+        ab = union("a", "b")
+        regex = ab.star() + "a" + repeat(ab, 14)
+        estimate = estimate_states(regex, budget=200)
+        self.assert_false(estimate.complete)
+        self.assert_true(estimate.states > 200)
+        self.assert_true(estimate.estimate > 10 * estimate.states)
+        self.assert_equal(estimate_states(regex, budget=200), estimate)
+
+
+class EquivalenceTests(LexingtonTestCase):
+    """
+    These tests check comparing the languages of regexes.
+    """
+    def test_equivalent(self):
+        for first, second in [("(a|b)*", "(a*b*)*"), ("(ab)*a", "a(ba)*"),
+                              ("x{2,4}", "xx(x(x)?)?"), ("a|b|ab", "ab?|b"),
+                              ("", "()*")]:
+            self.assert_true(parse(first).equivalent(parse(second)))
+            self.assert_true(parse(second).equivalent(parse(first)))
+        self.assert_true(Null.equivalent(Null))
+        self.assert_true(Regex("spam").equivalent("spam"))
+
+    def test_not_equivalent(self):
+        for first, second in [("(a|b)*", "(ab)*"), ("a*", "a+"),
+                              ("x{2,4}", "x{2,5}"), ("a.", "ab")]:
+            self.assert_false(parse(first).equivalent(parse(second)))
+            self.assert_false(parse(second).equivalent(parse(first)))
+        self.assert_false(Epsilon.equivalent(Null))
+        self.assert_raises(TypeError, Regex("a").equivalent, Regex(b"a"))
+
+    def test_subset_of(self):
+        self.assert_true(parse("a+").subset_of(parse("a*")))
+        self.assert_false(parse("a*").subset_of(parse("a+")))
+        self.assert_true(parse("ab").subset_of(parse("a.")))
+        self.assert_true(Null.subset_of("a"))
+        self.assert_true(parse("a|b").subset_of(parse("(a|b)*")))
+        self.assert_false(parse("a|c").subset_of(parse("(a|b)*")))
+
+    def test_ranges(self):
+        first = symbol_range("a", "\u1000") | symbol_range("\u0800", "\u2000")
+        self.assert_true(first.equivalent(symbol_range("a", "\u2000")))
+        self.assert_false(first.equivalent(symbol_range("a", "\u2001")))
+        self.assert_true(Regex("\u0900").subset_of(first))
+        self.assert_false(Regex("\u3000").subset_of(first))
+
+    def test_prune(self):
+        regex = union("ab", Regex("a") + Any, "c", "cc")
+        self.assert_equal(prune(regex), union(Regex("a") + Any, "c", "cc"))
+        self.assert_equal(prune(union("a", "b")), union("a", "b"))
+        self.assert_equal(prune(union("a", star("a"))), star("a"))
+        self.assert_equal(prune("spam"), Regex("spam"))
+        # Sizes are counted in nodes, not by how long the repr is.
+        spelled = Regex("a" * 30)
+        built = repeat(intersect(symbol_range("a", "b"), ~Regex("b")), 30)
+        self.assert_equal(prune(union(spelled, built)), spelled)
+
 
 suite = make_suite(
     MatchingTests,
     DerivationTests,
+    NestingTests,
+    PartialDerivationTests,
     IdentityTests,
     AlphabetTests,
-    OperatorTests
+    OperatorTests,
+    UTF8Tests,
+    ParseTests,
+    AnalysisTests,
+    EquivalenceTests,
+    BooleanTests
 )
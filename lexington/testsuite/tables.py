@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+lexington.testsuite.tables
+==========================
+This file contains API-level tests for the transition table module.
+
+:copyright: (C) 2013, Matthew Frazier
+:license:   Released under the MIT/X11 license, see LICENSE for details
+"""
+from __future__ import unicode_literals
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from . import LexingtonTestCase, make_suite
+
+from lexington.automaton import Automaton, RuleAutomaton, RegexSet, DEAD
+from lexington.regex import Regex, Any, union, symbol_range
+from lexington import tables
+from lexington.tables import Table, RangeTable
+
+
+def make_automaton():
+    ab = union(b"a", b"b")
+    return Automaton(ab.star() + b"a" + ab ** 3)
+
+
+# Attaches to a table with a resource tracker running, then waits for the
+# tracker to clean up after this process.
+ATTACH_ELSEWHERE = """
+import os
+from multiprocessing import resource_tracker
+from lexington.tables import Table
+resource_tracker.ensure_running()
+Table.attach(%r).close()
+tracker = resource_tracker._resource_tracker
+os.close(tracker._fd)
+os.waitpid(tracker._pid, 0)
+"""
+
+
+class BuildTests(LexingtonTestCase):
+    """
+    These tests check building tables from automata.
+    """
+    def test_match(self):
+        a = make_automaton()
+        t = Table.build(a)
+        for s in (b"", b"abbb", b"bbabab", b"aaaa", b"abb", b"abcb"):
+            self.assert_equal(t.match(s), a.regex.match(s))
+
+    def test_complete(self):
+        a = make_automaton()
+        t = Table.build(a)
+        self.assert_equal(len(t), len(a))
+        self.assert_equal(len(t.transitions), 256 * len(a))
+        self.assert_equal(t.run(b"c"), DEAD)
+
+    def test_rules(self):
+        t = Table.build(RuleAutomaton([b"if",
+                                       Regex(b"i") + Regex(b"f").star()]))
+        self.assert_equal(t.accepting[t.run(b"if")], 0)
+        self.assert_equal(t.accepting[t.run(b"iff")], 1)
+        self.assert_equal(t.accepting[t.run(b"x")], -1)
+
+    def test_text(self):
+        self.assert_raises(TypeError, Table.build, Automaton("abc"))
+
+    def test_regex_set(self):
+        self.assert_raises(TypeError, Table.build,
+                           RegexSet([b"ab", Regex(b"a").plus()]))
+
+    def test_match_many(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        t = Table.build(make_automaton())
+        subjects = [b"abbb", b"", b"bbbb", b"babab", b"abcb", b"a", b"aaaa"]
+        result = t.match_many(subjects)
+        self.assert_equal(result.dtype, numpy.dtype(bool))
+        self.assert_equal(list(result), [t.match(s) for s in subjects])
+        self.assert_equal(len(t.match_many([])), 0)
+
+
+class RangeTableTests(LexingtonTestCase):
+    """
+    These tests check range tables for automata over text.
+    """
+    def test_match(self):
+        word = union(*"abc\u00e9\u4e00\u4e01\u4e02").plus()
+        a = Automaton(word + Regex(" ").maybe() + Any.star() + "\u00e9")
+        t = RangeTable.build(a)
+        self.assert_equal(len(t), len(a))
+        for s in ("a \u00e9", "\u4e00\u4e02b x\u00e9", "\u4e03\u00e9",
+                  "ab\u4e01\u4e00 \u2603\u00e9", "c", "", "\u00e9\u00e9"):
+            self.assert_equal(t.match(s), a.match(s))
+
+    def test_ranges_merge(self):
+        cjk = union(*("%c" % c for c in range(0x4e00, 0x4f00)))
+        t = RangeTable.build(Automaton(cjk.plus()))
+        # Each state only needs ranges for "below", "CJK", and "above".
+        self.assert_true(all(len(s) <= 3 for s in t.starts))
+        self.assert_equal(t.run("\u4e10\u4eff"), t.step(t.start, "\u4e10"))
+        self.assert_equal(t.run("\u4f00"), DEAD)
+
+    def test_symbol_range(self):
+        a = Automaton(symbol_range("\x20", "\u4e00").plus() + "\u4e00")
+        t = RangeTable.build(a)
+        for s in ("\u4e00\u4e00", "a\u4e00", "~\u2603\u4e00", "\u4e00",
+                  "\x1f\u4e00", "a\u4e01\u4e00", "\u4dff\u4e00"):
+            self.assert_equal(t.match(s), a.match(s))
+
+    def test_rules(self):
+        t = RangeTable.build(RuleAutomaton(["if", Regex("i") +
+                                            Regex("f").star()]))
+        self.assert_equal(t.match("if"), 0)
+        self.assert_equal(t.match("iff"), 1)
+        self.assert_is(t.match("x"), None)
+
+    def test_bytes(self):
+        self.assert_raises(TypeError, RangeTable.build, make_automaton())
+
+
+class SharingTests(LexingtonTestCase):
+    """
+    These tests check placing tables where other processes can reach them.
+    """
+    def test_round_trip(self):
+        t = Table.build(make_automaton())
+        u = Table.from_buffer(t.to_bytes())
+        self.assert_equal(list(u.transitions), list(t.transitions))
+        self.assert_equal(list(u.accepting), list(t.accepting))
+        self.assert_equal(u.start, t.start)
+        self.assert_raises(ValueError, Table.from_buffer, b"nonsense" * 4)
+
+    def test_shared_memory(self):
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            return
+        shared = Table.build(make_automaton()).share()
+        try:
+            attached = Table.attach(shared.name)
+            self.assert_true(attached.match(b"babbb"))
+            self.assert_false(attached.match(b"bbbb"))
+            self.assert_raises(TypeError, attached.transitions.__setitem__,
+                               0, 1)
+            attached.close()
+        finally:
+            shared.unlink()
+
+    def test_attach_elsewhere(self):
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            return
+        shared = Table.build(make_automaton()).share()
+        try:
+            # A process that attaches and exits mustn't take the block with
+            # it, even if it has a resource tracker of its own running.
+            root = os.path.dirname(os.path.dirname(tables.__file__))
+            subprocess.check_call([sys.executable, "-c",
+                                   ATTACH_ELSEWHERE % shared.name],
+                                  cwd=os.path.abspath(root))
+            attached = Table.attach(shared.name)
+            self.assert_true(attached.match(b"babbb"))
+            attached.close()
+        finally:
+            shared.unlink()
+
+    def test_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "table")
+            Table.build(make_automaton()).save(path)
+            mapped = Table.open(path)
+            self.assert_true(mapped.match(b"babbb"))
+            self.assert_false(mapped.match(b"bbbb"))
+            mapped.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+suite = make_suite(
+    BuildTests,
+    RangeTableTests,
+    SharingTests
+)